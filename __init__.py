@@ -1,11 +1,36 @@
 import os
+import logging
 import base64
-from PIL import Image
-from urllib.parse import unquote
+import struct
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+from email.utils import formatdate
 from server import PromptServer
 from aiohttp import web
 import folder_paths
 from nodes import LoadImage
+from .watcher import GalleryWatcher
+from .thumbnail_queue import PRIORITY_VISIBLE, PRIORITY_BACKGROUND
+from .atlas import AtlasStore
+from .thumbnail_store import BASE_SIZE
+from .thumbnail_gc import ThumbnailCollector
+from .metrics import METRICS, timed_route
+# Storage, generation and listing live in gallery_core so they also run without the server
+from .gallery_core import (
+    THUMBNAILS_DIR, GALLERY_CONFIG, THUMBNAIL_STORE, THUMBNAIL_CACHE, THUMBNAIL_SIZES,
+    THUMBNAIL_QUEUE, THUMBNAIL_MANIFEST, FILE_INDEX, METADATA_INDEX, HASH_INDEX, EXCLUDE_FOLDERS, VIDEO_EXTENSIONS,
+    parse_thumbnail_size, get_thumbnail_path, all_thumbnail_paths, create_thumbnail,
+    thumbnail_is_fresh, queue_thumbnail, is_gallery_image,
+    queue_missing_thumbnails, get_enhanced_files, listing_snapshot, scan_overwrites, get_base_dir, resolve_gallery_file,
+    thumbnail_version, refresh_source_stat, migrate_flat_thumbnails, refresh_index, sync_metadata_index,
+    sync_hash_index, duplicate_groups,
+)
+from .thumbnailer import read_metadata
+from .perceptual_hash import hamming, MAX_THRESHOLD
+
+logger = logging.getLogger(__name__)
 
 try:
     from nodes import LoadImageMask
@@ -30,222 +55,186 @@ if HAS_LOAD_IMAGE_MASK:
 if HAS_LOAD_IMAGE_OUTPUT:
     original_input_types["LoadImageOutput"] = LoadImageOutput.INPUT_TYPES
 
-# Path to the thumbnails directory
-THUMBNAILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnails")
-if not os.path.exists(THUMBNAILS_DIR):
-    os.makedirs(THUMBNAILS_DIR)
+migrate_flat_thumbnails()
 
-# Get safe filename for thumbnail
-def get_thumbnail_path(filename):
-    safe_filename = filename.replace(os.sep, "__").replace("/", "__").replace("\\", "__").replace(" ", "_")
-    return os.path.join(THUMBNAILS_DIR, f"{safe_filename}.webp")
+# Per node: (listing generation, merged INPUT_TYPES result), or None when the node has no list to extend
+_merged_input_types = {}
 
-# Create thumbnail from image file
-def create_thumbnail(file_path, dir_type="input", size=(80, 80), is_output=False):
-    try:
-        # Skip non-image files and handle None paths
-        if not file_path or not os.path.exists(file_path):
-            return None
-            
-        # Check if it's actually an image file
-        try:
-            with Image.open(file_path) as img:
-                img.verify()
-        except Exception:
-            # Not a valid image file
-            return None
-            
-        # Re-open for actual processing
-        img = Image.open(file_path)
-        
-        # Handle different image modes
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Convert to RGB for consistent handling
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # Calculate aspect ratio
-        width, height = img.size
-        aspect_ratio = width / height
-
-        # Crop to square from center
-        if aspect_ratio > 1:
-            new_width = height
-            left = (width - new_width) // 2
-            img = img.crop((left, 0, left + new_width, height))
-        else:
-            new_height = width
-            top = (height - new_height) // 2
-            img = img.crop((0, top, width, top + new_height))
+def enhanced_input_types(node, param_names, dir_type):
+    """The original INPUT_TYPES with the gallery files appended to its file list.
 
-        # Resize to thumbnail size
-        img = img.resize(size, Image.LANCZOS)
+    The original is called and merged once per listing generation; until the
+    tree changes every call shares that result.
+    """
+    cached = _merged_input_types.get(node, False)
+    if cached is None:
+        # e.g. a remote COMBO instead of a file list, so there is nothing to merge
+        return original_input_types[node]()
 
-        # Save as WebP
-        try:
-            if is_output:
-                # For output files, we store thumbnails with a prefix to avoid conflicts
-                rel_path = os.path.relpath(file_path, folder_paths.get_output_directory())
-                thumbnail_path = get_thumbnail_path(f"OP_{rel_path}")
-            else:
-                rel_path = os.path.relpath(file_path, folder_paths.get_input_directory())
-                thumbnail_path = get_thumbnail_path(rel_path)
-                
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
-            img.save(thumbnail_path, "WEBP", quality=80)
-            return thumbnail_path
-        except Exception as e:
-            print(f"Error saving thumbnail for {file_path}: {str(e)}")
-            return None
-            
-    except Exception as e:
-        print(f"Error creating thumbnail for {file_path}: {str(e)}")
-        return None
-
-def get_enhanced_files(input_dir_type="input"):
-    """Get enhanced files from either input or output directory"""
-    if input_dir_type == "input":
-        base_dir = folder_paths.get_input_directory()
-    elif input_dir_type == "output":
-        base_dir = folder_paths.get_output_directory()
-    else:
-        return []
-        
-    exclude_folders = ["clipspace", "3d", "audio"]  # Add more protected folders
-    additional_files = []
-
-    for root, dirs, files in os.walk(base_dir, followlinks=True):
-        # Skip protected folders
-        dirs[:] = [d for d in dirs if d not in exclude_folders]
-        
-        # Check if current directory should be excluded
-        if root != base_dir:  # Only check subdirectories, not the base directory itself
-            rel_path = os.path.relpath(root, base_dir)
-            parts = rel_path.split(os.sep)
-
-            # Check if any part is in exclude list
-            if any(part in exclude_folders for part in parts):
-                continue
-
-        for file in files:
-            # Filter for image files only - skip video files explicitly
-            if not folder_paths.filter_files_content_types([file], ["image"]):
-                continue
-                
-            # Skip video files regardless of MIME detection
-            video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
-            if any(file.lower().endswith(ext) for ext in video_extensions):
-                continue
+    generation, files = listing_snapshot(dir_type)
+    if not cached or cached[0] != generation:
+        result = original_input_types[node]()
+        required = result.get("required", {})
+        param_name = next((p for p in param_names if p in required), None)
+        if param_name is None or not isinstance(required[param_name][0], list):
+            _merged_input_types[node] = None
+            return result
+        # Combine files and remove duplicates while preserving order
+        combined_files = list(dict.fromkeys([*required[param_name][0], *files]))
+        required[param_name] = (combined_files,) + tuple(required[param_name][1:])
+        cached = _merged_input_types[node] = (generation, result)
 
-            file_path = os.path.join(root, file)
-            
-            # Make sure file_path is valid
-            if not os.path.exists(file_path) or not os.path.isfile(file_path):
-                continue
-                
-            rel_file_path = os.path.relpath(file_path, base_dir)
-            
-            # Add prefix to distinguish input and output files
-            if input_dir_type == "output":
-                prefixed_path = f"[output]/{rel_file_path}"
-            else:
-                prefixed_path = rel_file_path
-
-            additional_files.append(prefixed_path)
-
-            # For thumbnail creation, we need to ensure unique names for input/output files
-            if input_dir_type == "output":
-                # Use a special naming convention for output thumbnails to avoid conflicts
-                thumbnail_path = get_thumbnail_path(f"OP_{rel_file_path}")
-            else:
-                thumbnail_path = get_thumbnail_path(rel_file_path)
-                
-            if not os.path.exists(thumbnail_path) and os.path.exists(file_path):
-                try:
-                    thumbnail_result = create_thumbnail(file_path, input_dir_type, is_output=(input_dir_type == "output"))
-                    if thumbnail_result:
-                        print(f"Generated thumbnail: {thumbnail_result}")
-                    else:
-                        print(f"Failed to generate thumbnail for: {file_path}")
-                except Exception as e:
-                    print(f"Thumbnail generation error for {file_path}: {str(e)}")
-    return sorted(additional_files)
+    # Callers may add or replace keys, which must not leak into the shared result
+    return {key: dict(value) if isinstance(value, dict) else value for key, value in cached[1].items()}
 
 @classmethod
 def enhanced_load_image_input_types(cls):
-    original_result = original_input_types["LoadImage"]()
-    original_files = original_result["required"]["image"][0]
-    additional_files = get_enhanced_files("input")
-    
-    # Combine files and remove duplicates while preserving order
-    combined_files = list(dict.fromkeys(original_files + additional_files))
-    original_result["required"]["image"] = (combined_files, original_result["required"]["image"][1])
-    return original_result
+    return enhanced_input_types("LoadImage", ("image",), "input")
 
 LoadImage.INPUT_TYPES = enhanced_load_image_input_types
 
 if HAS_LOAD_IMAGE_MASK:
     @classmethod
     def enhanced_load_image_mask_input_types(cls):
-        original_result = original_input_types["LoadImageMask"]()
-        if "required" in original_result and "image" in original_result["required"]:
-            param_name = "image"
-        elif "required" in original_result and "mask" in original_result["required"]:
-            param_name = "mask"
-        else:
-            return original_result
-        
-        original_files = original_result["required"][param_name][0]
-        additional_files = get_enhanced_files()
-        
-        if isinstance(original_files, list):
-            # Combine files and remove duplicates while preserving order
-            combined_files = list(dict.fromkeys(original_files + additional_files))
-            original_result["required"][param_name] = (combined_files, original_result["required"][param_name][1])
-        
-        return original_result
-    
+        return enhanced_input_types("LoadImageMask", ("image", "mask"), "input")
+
     LoadImageMask.INPUT_TYPES = enhanced_load_image_mask_input_types
 
 if HAS_LOAD_IMAGE_OUTPUT:
     @classmethod
     def enhanced_load_image_output_input_types(cls):
-        original_result = original_input_types["LoadImageOutput"]()
-        if "required" in original_result and "image" in original_result["required"]:
-            param_name = "image"
-        else:
-            return original_result
-        
-        original_files = original_result["required"][param_name][0]
         # Get files from output directory
-        additional_files = get_enhanced_files("output")
-        
-        if isinstance(original_files, list):
-            # Combine files and remove duplicates while preserving order
-            combined_files = list(dict.fromkeys(original_files + additional_files))
-            original_result["required"][param_name] = (combined_files, original_result["required"][param_name][1])
-        elif isinstance(original_files, str):
-            # print(f"Warning: original_files for {param_name} is a string, not a list")
-            original_result["required"][param_name] = (original_files, original_result["required"][param_name][1])
-        
-        return original_result
-    
+        return enhanced_input_types("LoadImageOutput", ("image",), "output")
+
     LoadImageOutput.INPUT_TYPES = enhanced_load_image_output_input_types
 
 
+def gallery_value(dir_type, rel_path):
+    return f"[output]/{rel_path}" if dir_type == "output" else rel_path
+
+def _on_files_changed(dir_type, modified):
+    """Apply watcher events to the index, pre-generate thumbnails and notify open galleries"""
+    base_dir = get_base_dir(dir_type)
+    added, removed = refresh_index(dir_type)
+    queue_missing_thumbnails(dir_type, added)
+    if THUMBNAIL_CACHE is not None:
+        for rel_path in removed + list(modified):
+            for thumbnail_path in all_thumbnail_paths(dir_type, rel_path):
+                THUMBNAIL_CACHE.invalidate(thumbnail_path)
+
+    # Files overwritten in place: refresh their validators, then regenerate if the thumbnail is stale
+    changed = []
+    new_files = set(added)
+    for rel_path in modified:
+        if rel_path in new_files or not is_gallery_image(os.path.basename(rel_path)):
+            continue
+        if refresh_source_stat(dir_type, rel_path, os.path.join(base_dir, rel_path)) is not None:
+            changed.extend(queue_missing_thumbnails(dir_type, [rel_path]))
+
+    if added or removed or changed:
+        PromptServer.instance.send_sync("gallery.files_changed", {
+            "dir_type": dir_type,
+            "added": [gallery_value(dir_type, p) for p in added],
+            "removed": [gallery_value(dir_type, p) for p in removed],
+            "modified": [gallery_value(dir_type, p) for p in changed],
+        })
+
+GALLERY_WATCHER = GalleryWatcher(
+    {"input": folder_paths.get_input_directory(), "output": folder_paths.get_output_directory()},
+    _on_files_changed,
+    exclude_folders=EXCLUDE_FOLDERS,
+    mode=GALLERY_CONFIG["watcher"],
+    poll_interval=GALLERY_CONFIG["watch_poll_interval"],
+    scan_modified=scan_overwrites,
+)
+
+# Optional sprite sheets, one set per folder
+ATLAS_STORE = AtlasStore(
+    os.path.join(THUMBNAILS_DIR, "atlas"),
+    columns=GALLERY_CONFIG["atlas_columns"],
+    rows=GALLERY_CONFIG["atlas_rows"],
+) if GALLERY_CONFIG["atlas"] else None
+
 try:
     from send2trash import send2trash
     USE_SEND2TRASH = True
 except ImportError:
     USE_SEND2TRASH = False
 
+# Blocking route work (PIL decodes, directory walks, file reads) runs on this
+# small pool so the event loop stays free for running prompts and websockets
+ROUTE_WORKERS = 2
+MAX_PENDING_ROUTE_CALLS = 32
+_route_executor = ThreadPoolExecutor(max_workers=ROUTE_WORKERS, thread_name_prefix="gallery-route")
+_pending_route_calls = 0
+
+class GalleryBusyError(Exception):
+    pass
+
+async def run_blocking(func, *args):
+    """Run func(*args) on the route pool, refusing work once too much is waiting"""
+    global _pending_route_calls
+    if _pending_route_calls >= MAX_PENDING_ROUTE_CALLS:
+        raise GalleryBusyError()
+    _pending_route_calls += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_route_executor, func, *args)
+    finally:
+        _pending_route_calls -= 1
+
+def busy_response():
+    return web.Response(status=503, text="Gallery is busy, retry later", headers={"Retry-After": "1"})
+
+def _delete_file_sync(filename):
+    # Handle different path formats for output files
+    file_path = None
+    thumbnail_path = None
+    
+    # Normalize the filename for path handling
+    filename = str(filename).replace('\\', '/')
+
+    # Handle [output]/ prefix format
+    if filename.startswith('[output]/'):
+        dir_type, rel_path = "output", filename[9:]  # Remove "[output]/" prefix
+    # Handle output/ prefix format (some nodes use this)
+    elif filename.startswith('output/'):
+        dir_type, rel_path = "output", filename[7:]  # Remove "output/" prefix
+    # Handle direct paths (relative to base directories)
+    else:
+        # Check if it's in output directory, otherwise assume input directory
+        output_file = os.path.join(folder_paths.get_output_directory(), filename)
+        dir_type = "output" if os.path.exists(output_file) else "input"
+        rel_path = filename
+    file_path = os.path.join(get_base_dir(dir_type), rel_path)
+    thumbnail_path = get_thumbnail_path(dir_type, rel_path)
+        
+    if not os.path.exists(file_path):
+        logger.warning(f"Delete error: File not found - {file_path}")
+        return 404, f"File not found: {file_path}"
+    
+    logger.debug(f"Attempting to delete: {file_path}")
+    logger.debug(f"Thumbnail path to delete: {thumbnail_path}")
+
+    # Remove every size tier stored next to the base thumbnail
+    for tier_path in all_thumbnail_paths(dir_type, rel_path):
+        THUMBNAIL_STORE.delete(tier_path)
+        THUMBNAIL_MANIFEST.forget(tier_path)
+    if METADATA_INDEX is not None:
+        METADATA_INDEX.forget(dir_type, [os.path.normpath(rel_path)])
+    if HASH_INDEX is not None:
+        HASH_INDEX.forget(dir_type, [os.path.normpath(rel_path)])
+
+    if USE_SEND2TRASH:
+        send2trash(file_path)
+        message = "File moved to trash successfully"
+    else:
+        os.remove(file_path)
+        message = "File deleted successfully"
+
+    return 200, message
+
 @PromptServer.instance.routes.post("/delete_file")
+@timed_route
 async def delete_file(request):
     try:
         data = await request.json()
@@ -253,61 +242,70 @@ async def delete_file(request):
         if not filename:
             return web.Response(status=400, text="Filename not provided")
 
-        # Handle different path formats for output files
-        file_path = None
-        thumbnail_path = None
-        
-        # Normalize the filename for path handling
-        filename = str(filename).replace('\\', '/')
-        
-        # Handle [output]/ prefix format
-        if filename.startswith('[output]/'):
-            rel_path = filename[9:]  # Remove "[output]/" prefix
-            base_dir = folder_paths.get_output_directory()
-            file_path = os.path.join(base_dir, rel_path)
-            thumbnail_path = get_thumbnail_path(f"OP_{rel_path}")
-        # Handle output/ prefix format (some nodes use this)
-        elif filename.startswith('output/'):
-            rel_path = filename[7:]  # Remove "output/" prefix
-            base_dir = folder_paths.get_output_directory()
-            file_path = os.path.join(base_dir, rel_path)
-            thumbnail_path = get_thumbnail_path(f"OP_{rel_path}")
-        # Handle direct paths (relative to base directories)
-        else:
-            # Check if it's in output directory
-            output_file = os.path.join(folder_paths.get_output_directory(), filename)
-            if os.path.exists(output_file):
-                file_path = output_file
-                thumbnail_path = get_thumbnail_path(f"OP_{filename}")
-            else:
-                # Assume input directory
-                base_dir = folder_paths.get_input_directory()
-                file_path = os.path.join(base_dir, filename)
-                thumbnail_path = get_thumbnail_path(filename)
-            
-        if not os.path.exists(file_path):
-            print(f"Delete error: File not found - {file_path}")
-            return web.Response(status=404, text=f"File not found: {file_path}")
-        
-        print(f"Attempting to delete: {file_path}")
-        print(f"Thumbnail path to delete: {thumbnail_path}")
+        status, message = await run_blocking(_delete_file_sync, filename)
+        return web.Response(status=status, text=message)
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error deleting file: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
 
-        if os.path.exists(thumbnail_path):
-            os.remove(thumbnail_path)
+def _thumbnail_route_candidates(filename):
+    """Gallery values first, then the flattened names older clients send"""
+    if filename.startswith('[output]/'):
+        yield "output", filename[9:]
+        return
+    yield "input", filename
+    if filename.startswith("OP_"):
+        yield "output", filename[3:]
+        yield "output", filename[3:].replace("__", os.sep)
+    yield "output", filename
+    yield "input", filename.replace("__", os.sep)
+    yield "output", filename.replace("__", os.sep)
 
-        if USE_SEND2TRASH:
-            send2trash(file_path)
-            message = "File moved to trash successfully"
-        else:
-            os.remove(file_path)
-            message = "File deleted successfully"
+def _placeholder_thumbnail(size=BASE_SIZE):
+    name = "placeholder.webp" if size == BASE_SIZE else f"placeholder_{size}.webp"
+    placeholder_path = os.path.join(THUMBNAILS_DIR, name)
+    if not os.path.exists(placeholder_path):
+        from PIL import Image, ImageDraw
+        placeholder = Image.new('RGB', (size, size), color='lightgray')
+        draw = ImageDraw.Draw(placeholder)
+        draw.text((size * 25 // 80, size * 35 // 80), "No Image", fill='darkgray')
+        placeholder.save(placeholder_path, "WEBP", quality=80)
+    st = os.stat(placeholder_path)
+    with open(placeholder_path, "rb") as f:
+        return f.read(), (st.st_mtime_ns, st.st_size)
 
-        return web.Response(status=200, text=message)
-    except Exception as e:
-        print(f"Error deleting file: {str(e)}")
-        return web.Response(status=500, text="Internal server error")
+def _resolve_thumbnail_sync(filename, if_none_match="", size=BASE_SIZE):
+    """Return (content, etag, mtime); content is None when the client's copy is current"""
+    thumbnail_path = None
+    for dir_type, rel_path in _thumbnail_route_candidates(filename):
+        file_path = os.path.join(get_base_dir(dir_type), rel_path)
+        if not os.path.isfile(file_path):
+            continue
+        thumbnail_path = get_thumbnail_path(dir_type, rel_path, size)
+        if not thumbnail_is_fresh(file_path, thumbnail_path):
+            thumbnail_path = create_thumbnail(file_path, dir_type, size=(size, size)) or thumbnail_path
+        break
+
+    # Validators come from the stored thumbnail, so revalidation costs one lookup
+    version = THUMBNAIL_STORE.version(thumbnail_path) if thumbnail_path is not None else None
+    if version is None:
+        # Return a placeholder if thumbnail creation fails
+        content, version = _placeholder_thumbnail(size)
+    else:
+        content = None
+    etag = f'"{version[0]:x}-{version[1]:x}"'
+    if etag in if_none_match:
+        return None, etag, version[0] / 1e9
+    if content is None:
+        content = THUMBNAIL_STORE.read(thumbnail_path)
+        if content is None:
+            content, _ = _placeholder_thumbnail(size)
+    return content, etag, version[0] / 1e9
 
 @PromptServer.instance.routes.get("/get_thumbnail/{filename:.*}")
+@timed_route
 async def get_thumbnail(request):
     try:
         filename = request.match_info['filename']
@@ -321,79 +319,62 @@ async def get_thumbnail(request):
         # Clean the filename - remove any leading slashes or path traversal
         filename = filename.lstrip('/')
         
-        # First check if we have a thumbnail for this exact filename
-        thumbnail_path = get_thumbnail_path(filename)
-        
-        # If not found, check if the original file exists
-        if not os.path.exists(thumbnail_path):
-            # Check both input and output directories
-            thumbnail_created = False
-            
-            # Check input directory
-            input_file = os.path.join(folder_paths.get_input_directory(), filename)
-            if os.path.exists(input_file) and os.path.isfile(input_file):
-                # Create thumbnail for input file
-                new_thumbnail_path = create_thumbnail(input_file, "input")
-                if new_thumbnail_path and os.path.exists(new_thumbnail_path):
-                    thumbnail_path = new_thumbnail_path
-                    thumbnail_created = True
-            
-            if not thumbnail_created:
-                # Check output directory - these use OP_ prefix
-                output_file = os.path.join(folder_paths.get_output_directory(), filename)
-                if os.path.exists(output_file) and os.path.isfile(output_file):
-                    # Use OP_ prefix for output files
-                    op_thumbnail_path = get_thumbnail_path(f"OP_{filename}")
-                    if not os.path.exists(op_thumbnail_path):
-                        new_thumbnail_path = create_thumbnail(output_file, "output", is_output=True)
-                        if new_thumbnail_path and os.path.exists(new_thumbnail_path):
-                            thumbnail_path = new_thumbnail_path
-                            thumbnail_created = True
-                        else:
-                            thumbnail_path = op_thumbnail_path
-                    else:
-                        thumbnail_path = op_thumbnail_path
-                        thumbnail_created = True
-                else:
-                    # Handle nested paths with __ as path separator
-                    nested_input = os.path.join(folder_paths.get_input_directory(), filename.replace("__", os.sep))
-                    nested_output = os.path.join(folder_paths.get_output_directory(), filename.replace("__", os.sep))
-                    
-                    if os.path.exists(nested_input) and os.path.isfile(nested_input):
-                        new_thumbnail_path = create_thumbnail(nested_input, "input")
-                        if new_thumbnail_path and os.path.exists(new_thumbnail_path):
-                            thumbnail_path = new_thumbnail_path
-                            thumbnail_created = True
-                    elif os.path.exists(nested_output) and os.path.isfile(nested_output):
-                        op_thumbnail_path = get_thumbnail_path(f"OP_{filename.replace('__', '__')}")
-                        if not os.path.exists(op_thumbnail_path):
-                            new_thumbnail_path = create_thumbnail(nested_output, "output", is_output=True)
-                            if new_thumbnail_path and os.path.exists(new_thumbnail_path):
-                                thumbnail_path = new_thumbnail_path
-                                thumbnail_created = True
-                            else:
-                                thumbnail_path = op_thumbnail_path
-                        else:
-                            thumbnail_path = op_thumbnail_path
-                            thumbnail_created = True
-
-        if not os.path.exists(thumbnail_path):
-            # Return a placeholder if thumbnail creation fails
-            from PIL import Image, ImageDraw
-            placeholder = Image.new('RGB', (80, 80), color='lightgray')
-            draw = ImageDraw.Draw(placeholder)
-            draw.text((25, 35), "No Image", fill='darkgray')
-            
-            placeholder_path = os.path.join(THUMBNAILS_DIR, "placeholder.webp")
-            placeholder.save(placeholder_path, "WEBP", quality=80)
-            return web.FileResponse(placeholder_path)
-
-        return web.FileResponse(thumbnail_path)
+        # Unknown sizes get the base thumbnail, as this route never failed on bad input
+        size = parse_thumbnail_size(request.query.get("size")) or BASE_SIZE
+        content, etag, last_modified = await run_blocking(
+            _resolve_thumbnail_sync, filename, request.headers.get("If-None-Match", ""), size
+        )
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Last-Modified": formatdate(last_modified, usegmt=True)}
+        if content is None:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=content, content_type="image/webp", headers=headers)
+    except GalleryBusyError:
+        return busy_response()
     except Exception as e:
-        print(f"Error getting thumbnail for {filename}: {str(e)}")
+        logger.error(f"Error getting thumbnail for {filename}: {str(e)}")
         return web.Response(status=500, text="Internal server error")
 
+BATCH_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff', '.tif')
+BATCH_READ_CHUNK = 64
+
+def _plan_thumbnails_batch(filenames, size=BASE_SIZE):
+    """Map filenames to thumbnail paths and collect the ones that still need generating"""
+    thumbnail_paths = {}
+    missing = []
+    for filename in filenames:
+        try:
+            # Skip video files
+            if any(filename.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+                continue
+
+            # Skip if not a valid image file
+            if not filename.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                continue
+
+            dir_type, _, file_path, thumbnail_path = resolve_gallery_file(filename, size)
+            thumbnail_paths[filename] = thumbnail_path
+            if not thumbnail_is_fresh(file_path, thumbnail_path):
+                missing.append((filename, file_path, dir_type, thumbnail_path))
+        except Exception as e:
+            logger.warning(f"Error processing filename {filename}: {str(e)}")
+            continue
+    return thumbnail_paths, missing
+
+def _read_thumbnails(thumbnail_paths):
+    # One call into the store, which the packed backend answers with a single query
+    contents = THUMBNAIL_STORE.read_many(path for _, path in thumbnail_paths)
+    result = {}
+    for filename, thumbnail_path in thumbnail_paths:
+        content = contents.get(thumbnail_path)
+        if content is None:
+            # Generation failed or the thumbnail was removed behind our back
+            THUMBNAIL_MANIFEST.forget(thumbnail_path)
+            continue
+        result[filename] = content
+    return result
+
 @PromptServer.instance.routes.post("/get_thumbnails_batch")
+@timed_route
 async def get_thumbnails_batch(request):
     try:
         data = await request.json()
@@ -401,61 +382,544 @@ async def get_thumbnails_batch(request):
 
         if not filenames:
             return web.json_response({})
+        size = parse_thumbnail_size(data.get('size'))
+        if size is None:
+            return web.Response(status=400, text="Unknown thumbnail size")
+
+        thumbnail_paths, missing = await run_blocking(_plan_thumbnails_batch, filenames, size)
+
+        # These are on screen, so they go ahead of background work
+        pending = [
+            queue_thumbnail(file_path, dir_type, thumbnail_path, priority=PRIORITY_VISIBLE, size=size)
+            for _, file_path, dir_type, thumbnail_path in missing
+        ]
+        if pending:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in pending))
 
+        # Read in chunks so other requests can interleave on the route pool
         result = {}
-        input_dir = folder_paths.get_input_directory()
-        output_dir = folder_paths.get_output_directory()
+        items = list(thumbnail_paths.items())
+        for i in range(0, len(items), BATCH_READ_CHUNK):
+            contents = await run_blocking(_read_thumbnails, items[i:i + BATCH_READ_CHUNK])
+            for filename, file_content in contents.items():
+                base64_data = base64.b64encode(file_content).decode('utf-8')
+                result[filename] = f"data:image/webp;base64,{base64_data}"
 
-        # Skip video files in batch processing
-        video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
-        
-        for filename in filenames:
-            try:
-                # Skip video files
-                if any(filename.lower().endswith(ext) for ext in video_extensions):
-                    continue
-                    
-                # Skip if not a valid image file
-                if not any(filename.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff', '.tif']):
-                    continue
-
-                thumbnail_path = None
-                
-                # Handle output files with prefix
-                if filename.startswith('[output]/'):
-                    # Handle [output]/path format
-                    rel_path = filename[9:]  # Remove "[output]/" prefix
-                    file_path = os.path.join(output_dir, rel_path)
-                    thumbnail_path = get_thumbnail_path(f"OP_{rel_path}")
-                    if not os.path.exists(thumbnail_path):
-                        thumbnail_path = create_thumbnail(file_path, "output", is_output=True)
-                else:
-                    # Handle input files
-                    file_path = os.path.join(input_dir, filename)
-                    thumbnail_path = get_thumbnail_path(filename)
-                    if not os.path.exists(thumbnail_path):
-                        thumbnail_path = create_thumbnail(file_path, "input")
-
-                if thumbnail_path and os.path.exists(thumbnail_path):
-                    try:
-                        with open(thumbnail_path, "rb") as f:
-                            file_content = f.read()
-                            base64_data = base64.b64encode(file_content).decode('utf-8')
-                            result[filename] = f"data:image/webp;base64,{base64_data}"
-                    except Exception as e:
-                        print(f"Error reading thumbnail {thumbnail_path}: {str(e)}")
-                        continue
-                        
-            except Exception as e:
-                print(f"Error processing filename {filename}: {str(e)}")
+        return web.json_response(result)
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error getting thumbnails batch: {str(e)}")
+        return web.json_response({})
+
+def _stream_frame(filename, content):
+    # Frame layout: u32 name length, UTF-8 name, u32 data length, WebP bytes (big endian)
+    name = filename.encode('utf-8')
+    return struct.pack(">I", len(name)) + name + struct.pack(">I", len(content)) + content
+
+async def _read_thumbnails_admitted(items):
+    # The stream was already admitted, so wait for room instead of failing mid-response
+    while True:
+        try:
+            return await run_blocking(_read_thumbnails, items)
+        except GalleryBusyError:
+            await asyncio.sleep(0.05)
+
+@PromptServer.instance.routes.post("/get_thumbnails_stream")
+@timed_route
+async def get_thumbnails_stream(request):
+    """Stream thumbnails as length-prefixed binary frames in the order they become ready"""
+    try:
+        data = await request.json()
+        filenames = data.get('filenames', [])
+        size = parse_thumbnail_size(data.get('size'))
+        if size is None:
+            return web.Response(status=400, text="Unknown thumbnail size")
+        thumbnail_paths, missing = await run_blocking(_plan_thumbnails_batch, filenames, size)
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error planning thumbnails stream: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+    # Queue generation first so it overlaps with sending the ready thumbnails
+    pending = {}
+    for filename, file_path, dir_type, thumbnail_path in missing:
+        future = queue_thumbnail(file_path, dir_type, thumbnail_path, priority=PRIORITY_VISIBLE, size=size)
+        pending[asyncio.wrap_future(future)] = filename
+
+    response = web.StreamResponse(headers={"Content-Type": "application/octet-stream", "Cache-Control": "no-store"})
+    await response.prepare(request)
+    try:
+        missing_names = set(pending.values())
+        ready = [(f, path) for f, path in thumbnail_paths.items() if f not in missing_names]
+        for i in range(0, len(ready), BATCH_READ_CHUNK):
+            contents = await _read_thumbnails_admitted(ready[i:i + BATCH_READ_CHUNK])
+            await response.write(b"".join(_stream_frame(f, c) for f, c in contents.items()))
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = []
+            for future in done:
+                filename = pending.pop(future)
+                if future.result():
+                    finished.append((filename, future.result()))
+            if finished:
+                contents = await _read_thumbnails_admitted(finished)
+                await response.write(b"".join(_stream_frame(f, c) for f, c in contents.items()))
+        await response.write_eof()
+    except ConnectionResetError:
+        # Gallery was closed before everything arrived; queued jobs still finish in the background
+        pass
+    except Exception as e:
+        logger.error(f"Error streaming thumbnails: {str(e)}")
+    return response
+
+def _thumbnail_versions_sync(filenames):
+    result = {}
+    for filename in filenames:
+        dir_type, rel_path, file_path, _ = resolve_gallery_file(filename)
+        if refresh_source_stat(dir_type, rel_path, file_path) is None:
+            continue
+        version = thumbnail_version(dir_type, rel_path)
+        if version:
+            result[filename] = version
+    return result
+
+@PromptServer.instance.routes.post("/get_thumbnail_versions")
+@timed_route
+async def get_thumbnail_versions(request):
+    """Return {filename: version} for building immutable thumbnail URLs, at one stat per file"""
+    try:
+        data = await request.json()
+        return web.json_response(await run_blocking(_thumbnail_versions_sync, data.get('filenames', [])))
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error getting thumbnail versions: {str(e)}")
+        return web.json_response({})
+
+@PromptServer.instance.routes.get("/gallery/thumbnail/{version}/{filename:.*}")
+@timed_route
+async def get_versioned_thumbnail(request):
+    """Serve a thumbnail under a content-addressed URL that browsers may cache forever.
+
+    The optional size query picks one of the configured tiers.
+    """
+    try:
+        version = request.match_info['version']
+        filename = unquote(request.match_info['filename'])
+        size = parse_thumbnail_size(request.query.get("size"))
+        if size is None:
+            return web.Response(status=400, text="Unknown thumbnail size")
+        dir_type, rel_path, file_path, thumbnail_path = resolve_gallery_file(filename, size)
+        await run_blocking(refresh_source_stat, dir_type, rel_path, file_path)
+        current = thumbnail_version(dir_type, rel_path)
+        if current is None:
+            return web.Response(status=404, text="File not found")
+
+        headers = {"ETag": f'"{current}"' if size == BASE_SIZE else f'"{current}@{size}"'}
+        if version == current:
+            headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            # Outdated URL: serve the current thumbnail but do not let it be pinned
+            headers["Cache-Control"] = "no-cache"
+        if headers["ETag"] in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+
+        if not await run_blocking(thumbnail_is_fresh, file_path, thumbnail_path):
+            await asyncio.wrap_future(
+                queue_thumbnail(file_path, dir_type, thumbnail_path, priority=PRIORITY_VISIBLE, size=size)
+            )
+        content = await run_blocking(THUMBNAIL_STORE.read, thumbnail_path)
+        if content is None:
+            return web.Response(status=404, text="Thumbnail not available")
+        return web.Response(body=content, content_type="image/webp", headers=headers)
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error getting versioned thumbnail: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+@PromptServer.instance.routes.get("/gallery/thumbnail_sizes")
+@timed_route
+async def gallery_thumbnail_sizes(request):
+    return web.json_response({"sizes": THUMBNAIL_SIZES, "base": BASE_SIZE, "preview": GALLERY_CONFIG["preview_size"]})
+
+LIST_MAX_LIMIT = 500
+LIST_SORTS = ("name", "mtime", "size")
+
+def _gallery_list_sync(dir_type, folder, search, prefix, sort, descending, cursor, limit, collapse=False):
+    base_dir = get_base_dir(dir_type)
+    added, _ = refresh_index(dir_type)
+    queue_missing_thumbnails(dir_type, added)
+
+    entries, folders = FILE_INDEX.query(base_dir, folder, search, prefix, sort, descending)
+    duplicates = {}
+    groups = duplicate_groups(dir_type, GALLERY_CONFIG["duplicate_threshold"]) if collapse else None
+    if groups is not None:
+        # Keep the newest file of each near-duplicate group in this view and hide the rest
+        visible = {entry[0] for entry in entries}
+        hidden = set()
+        for group in groups:
+            members = [rel_path for rel_path in group if rel_path in visible]
+            if len(members) > 1:
+                duplicates[members[0]] = len(members) - 1
+                hidden.update(members[1:])
+        entries = [entry for entry in entries if entry[0] not in hidden]
+    page = []
+    for rel_path, mtime_ns, size in entries[cursor:cursor + limit]:
+        filename = gallery_value(dir_type, rel_path)
+        entry = {
+            "filename": filename,
+            "name": os.path.basename(rel_path),
+            "mtime": mtime_ns / 1e9,
+            "size": size,
+            "thumbnail": f"/gallery/thumbnail/{thumbnail_version(dir_type, rel_path)}/{quote(filename, safe='')}",
+        }
+        if rel_path in duplicates:
+            entry["duplicates"] = duplicates[rel_path]
+        page.append(entry)
+    next_cursor = cursor + limit if cursor + limit < len(entries) else None
+    result = {
+        "total": len(entries),
+        "entries": page,
+        "folders": folders,
+        "next_cursor": str(next_cursor) if next_cursor is not None else None,
+        "generation": FILE_INDEX.generation(base_dir),
+    }
+    if collapse and groups is None:
+        # Not clustered yet, so the client asks again shortly
+        result["indexing"] = True
+    return result
+
+@PromptServer.instance.routes.get("/gallery/list")
+@timed_route
+async def gallery_list(request):
+    """Paginated, filtered and sorted listing served from the file index.
+
+    Query: dir=input|output, folder (omit for the whole tree, "" for the root),
+    q (substring), prefix, sort=name|mtime|size, order=asc|desc, cursor, limit,
+    collapse=1 to show only the newest of each near-duplicate group.
+    """
+    try:
+        query = request.query
+        dir_type = query.get("dir", "input")
+        sort = query.get("sort", "name")
+        if dir_type not in ("input", "output") or sort not in LIST_SORTS:
+            return web.Response(status=400, text="Invalid dir or sort")
+        try:
+            cursor = max(0, int(query.get("cursor") or 0))
+            limit = min(max(1, int(query.get("limit") or 100)), LIST_MAX_LIMIT)
+        except ValueError:
+            return web.Response(status=400, text="Invalid cursor or limit")
+
+        folder = query.get("folder")
+        if folder is not None:
+            folder = folder.strip("/")
+            folder = os.path.normpath(folder.replace("/", os.sep)) if folder else ""
+            if folder.startswith(os.pardir) or os.path.isabs(folder):
+                return web.Response(status=400, text="Invalid folder")
+
+        collapse = query.get("collapse") == "1" and HASH_INDEX is not None
+        if collapse:
+            _start_backfill(sync_hash_index, "Image hashes")
+        result = await run_blocking(
+            _gallery_list_sync, dir_type, folder, query.get("q") or None, query.get("prefix") or None,
+            sort, query.get("order") == "desc", cursor, limit, collapse,
+        )
+        return web.json_response(result)
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error listing gallery: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+_backfill_threads = {}
+
+def _run_backfill(sync, what):
+    try:
+        count = sync()
+        logger.info(f"{what} up to date, {count} files added")
+    except Exception as e:
+        logger.error(f"Error backfilling {what.lower()}: {str(e)}")
+
+def _start_backfill(sync, what):
+    """Run an index backfill once per process, on first use; True while it runs"""
+    thread = _backfill_threads.get(sync)
+    if thread is None:
+        thread = _backfill_threads[sync] = threading.Thread(
+            target=_run_backfill, args=(sync, what), name=f"gallery-{sync.__name__}", daemon=True)
+        thread.start()
+    return thread.is_alive()
+
+def _gallery_search_sync(dir_type, text, seed, sort, descending, cursor, limit):
+    # Keeps thumbnail versions current and drops rows of removed files
+    generation, _ = listing_snapshot(dir_type)
+    total, rows = METADATA_INDEX.search(dir_type, text, seed, sort, descending, cursor, limit)
+    page = []
+    for rel_path, mtime_ns, size, width, height, fmt in rows:
+        filename = gallery_value(dir_type, rel_path)
+        page.append({
+            "filename": filename,
+            "name": os.path.basename(rel_path),
+            "mtime": mtime_ns / 1e9,
+            "size": size,
+            "thumbnail": f"/gallery/thumbnail/{thumbnail_version(dir_type, rel_path)}/{quote(filename, safe='')}",
+            "width": width,
+            "height": height,
+            "format": fmt,
+        })
+    next_cursor = cursor + limit if cursor + limit < total else None
+    return {
+        "total": total,
+        "entries": page,
+        "folders": [],
+        "next_cursor": str(next_cursor) if next_cursor is not None else None,
+        "generation": generation,
+    }
+
+@PromptServer.instance.routes.get("/gallery/search")
+@timed_route
+async def gallery_search(request):
+    """Search by embedded prompt text, seed or path, answered from the metadata index alone.
+
+    Query: dir=input|output, q (words matched as prefixes, "seed:123" for a
+    seed), seed, sort=rank|name|mtime|size, order=asc|desc, cursor, limit.
+    Entries are shaped like /gallery/list ones plus width, height and format.
+    indexing is true while files from before the index are still being read.
+    """
+    if METADATA_INDEX is None:
+        return web.Response(status=404, text="Metadata index is disabled")
+    try:
+        query = request.query
+        dir_type = query.get("dir", "input")
+        sort = query.get("sort", "rank")
+        if dir_type not in ("input", "output") or sort not in ("rank",) + LIST_SORTS:
+            return web.Response(status=400, text="Invalid dir or sort")
+        try:
+            cursor = max(0, int(query.get("cursor") or 0))
+            limit = min(max(1, int(query.get("limit") or 100)), LIST_MAX_LIMIT)
+            seed = int(query["seed"]) if query.get("seed") else None
+        except ValueError:
+            return web.Response(status=400, text="Invalid cursor, limit or seed")
+
+        indexing = _start_backfill(sync_metadata_index, "Metadata index")
+        result = await run_blocking(
+            _gallery_search_sync, dir_type, query.get("q", ""), seed, sort, query.get("order") == "desc", cursor, limit,
+        )
+        result["indexing"] = indexing
+        return web.json_response(result)
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error searching gallery: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+def _gallery_metadata_sync(filename):
+    dir_type, rel_path, file_path, _ = resolve_gallery_file(filename)
+    rel_path = os.path.normpath(rel_path)
+    listing_snapshot(dir_type)
+    # Only files the gallery lists, so the route cannot be pointed at anything else
+    if FILE_INDEX.stat(get_base_dir(dir_type), rel_path) is None:
+        return None
+    st = refresh_source_stat(dir_type, rel_path, file_path)
+    if st is None:
+        return None
+    metadata = METADATA_INDEX.get(dir_type, rel_path)
+    if metadata is None or (metadata["mtime_ns"], metadata["size"]) != (st.st_mtime_ns, st.st_size):
+        # Not indexed yet or changed since: read the header now and keep it
+        metadata = read_metadata(file_path)
+        if metadata is None:
+            return None
+        METADATA_INDEX.record(dir_type, rel_path, st.st_mtime_ns, st.st_size, metadata)
+        metadata = METADATA_INDEX.get(dir_type, rel_path)
+    return metadata
+
+@PromptServer.instance.routes.get("/gallery/metadata")
+@timed_route
+async def gallery_metadata(request):
+    """Dimensions, format and the decoded prompt/workflow of one gallery file"""
+    if METADATA_INDEX is None:
+        return web.Response(status=404, text="Metadata index is disabled")
+    filename = request.query.get("filename")
+    if not filename:
+        return web.Response(status=400, text="Filename not provided")
+    try:
+        metadata = await run_blocking(_gallery_metadata_sync, filename)
+        if metadata is None:
+            return web.Response(status=404, text="File not found")
+        return web.json_response({
+            "filename": filename,
+            "width": metadata["width"],
+            "height": metadata["height"],
+            "format": metadata["format"],
+            "mtime": metadata["mtime_ns"] / 1e9,
+            "size": metadata["size"],
+            "prompt": metadata["prompt"],
+            "workflow": metadata["workflow"],
+        })
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error reading metadata: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+DUPLICATES_MAX_LIMIT = 100
+DUPLICATES_MAX_THRESHOLD = MAX_THRESHOLD
+
+def _gallery_duplicates_sync(dir_type, threshold, cursor, limit):
+    generation, _ = listing_snapshot(dir_type)
+    groups = duplicate_groups(dir_type, threshold)
+    if groups is None:
+        return None
+    clusters = []
+    for group in groups[cursor:cursor + limit]:
+        representative = HASH_INDEX.get(dir_type, group[0])
+        entries = []
+        for rel_path in group:
+            filename = gallery_value(dir_type, rel_path)
+            info = FILE_INDEX.stat(get_base_dir(dir_type), rel_path)
+            value = HASH_INDEX.get(dir_type, rel_path)
+            if info is None or value is None:
                 continue
+            entries.append({
+                "filename": filename,
+                "name": os.path.basename(rel_path),
+                "mtime": info[0] / 1e9,
+                "size": info[1],
+                "thumbnail": f"/gallery/thumbnail/{thumbnail_version(dir_type, rel_path)}/{quote(filename, safe='')}",
+                "phash": f"{value:016x}",
+                "distance": hamming(representative, value) if representative is not None else None,
+            })
+        clusters.append({"representative": entries[0]["filename"] if entries else None, "entries": entries})
+    next_cursor = cursor + limit if cursor + limit < len(groups) else None
+    return {
+        "total": len(groups),
+        "duplicates": sum(len(group) - 1 for group in groups),
+        "threshold": threshold,
+        "clusters": clusters,
+        "next_cursor": str(next_cursor) if next_cursor is not None else None,
+        "generation": generation,
+    }
 
+@PromptServer.instance.routes.get("/gallery/duplicates")
+@timed_route
+async def gallery_duplicates(request):
+    """Groups of near-identical images, found by perceptual hash.
+
+    Query: dir=input|output (default output), threshold (Hamming distance of
+    the 64 bit hashes, default duplicate_threshold), cursor, limit. Groups
+    come largest first, each newest first; the newest is the representative.
+    hashing is true while thumbnails made before the hash index are hashed.
+    Clustering runs in the background; until its first result is ready the
+    route answers 202 and the client should retry.
+    """
+    if HASH_INDEX is None:
+        return web.Response(status=404, text="Duplicate detection is disabled")
+    try:
+        query = request.query
+        dir_type = query.get("dir", "output")
+        if dir_type not in ("input", "output"):
+            return web.Response(status=400, text="Invalid dir")
+        try:
+            threshold = int(query.get("threshold") or GALLERY_CONFIG["duplicate_threshold"])
+            cursor = max(0, int(query.get("cursor") or 0))
+            limit = min(max(1, int(query.get("limit") or 20)), DUPLICATES_MAX_LIMIT)
+        except ValueError:
+            return web.Response(status=400, text="Invalid threshold, cursor or limit")
+        if not 0 <= threshold <= DUPLICATES_MAX_THRESHOLD:
+            return web.Response(status=400, text=f"threshold must be between 0 and {DUPLICATES_MAX_THRESHOLD}")
+
+        hashing = _start_backfill(sync_hash_index, "Image hashes")
+        result = await run_blocking(_gallery_duplicates_sync, dir_type, threshold, cursor, limit)
+        if result is None:
+            return web.json_response({"computing": True, "hashing": hashing}, status=202, headers={"Retry-After": "2"})
+        result["hashing"] = hashing
         return web.json_response(result)
+    except GalleryBusyError:
+        return busy_response()
     except Exception as e:
-        print(f"Error getting thumbnails batch: {str(e)}")
-        return web.json_response({})
+        logger.error(f"Error finding duplicates: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+def _folder_atlas_sync(dir_type, folder):
+    base_dir = get_base_dir(dir_type)
+    refresh_index(dir_type)
+
+    entries, _ = FILE_INDEX.query(base_dir, folder)
+    versions = {}
+    pending = []
+    for rel_path, _, _ in entries:
+        if any(rel_path.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+            continue
+        filename = gallery_value(dir_type, rel_path)
+        _, _, file_path, thumbnail_path = resolve_gallery_file(filename)
+        # Sheets only take thumbnails that exist; rendering here would hold a route worker for the whole folder
+        if thumbnail_is_fresh(file_path, thumbnail_path):
+            versions[filename] = thumbnail_version(dir_type, rel_path)
+        else:
+            queue_thumbnail(file_path, dir_type, thumbnail_path, PRIORITY_BACKGROUND)
+            pending.append(filename)
+
+    def load_tile(filename):
+        return THUMBNAIL_STORE.read(resolve_gallery_file(filename)[3])
+
+    atlas = ATLAS_STORE.build(f"{dir_type}:{folder}", versions, load_tile)
+    atlas["sheets"] = [
+        f"/gallery/atlas/{atlas['folder_id']}/{i}.webp?v={version}" for i, version in enumerate(atlas["sheets"])
+    ]
+    atlas["pending"] = pending
+    return atlas
+
+@PromptServer.instance.routes.get("/gallery/atlas")
+@timed_route
+async def gallery_atlas(request):
+    """Sprite sheet index of one folder: {tile, columns, rows, sheets, entries{filename: [sheet, x, y]}, pending}.
+
+    Query: dir=input|output, folder ("" for the root). Only sheets whose
+    files changed since the last call are re-rendered. Files without a
+    current thumbnail are queued in the background and listed in pending;
+    they join the sheets on a later call.
+    """
+    if ATLAS_STORE is None:
+        return web.Response(status=404, text="Atlas mode is disabled")
+    try:
+        dir_type = request.query.get("dir", "input")
+        if dir_type not in ("input", "output"):
+            return web.Response(status=400, text="Invalid dir")
+        folder = request.query.get("folder", "").strip("/")
+        folder = os.path.normpath(folder.replace("/", os.sep)) if folder else ""
+        if folder.startswith(os.pardir) or os.path.isabs(folder):
+            return web.Response(status=400, text="Invalid folder")
+
+        return web.json_response(await run_blocking(_folder_atlas_sync, dir_type, folder))
+    except GalleryBusyError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error building thumbnail atlas: {str(e)}")
+        return web.Response(status=500, text="Internal server error")
+
+@PromptServer.instance.routes.get("/gallery/atlas/{folder_id}/{sheet}.webp")
+@timed_route
+async def gallery_atlas_sheet(request):
+    if ATLAS_STORE is None:
+        return web.Response(status=404, text="Atlas mode is disabled")
+    folder_id = request.match_info["folder_id"]
+    sheet = request.match_info["sheet"]
+    if not folder_id.isalnum() or not sheet.isdigit():
+        return web.Response(status=400, text="Invalid sheet")
+    path = ATLAS_STORE.sheet_path(folder_id, int(sheet))
+    if not os.path.exists(path):
+        return web.Response(status=404, text="Sheet not found")
+    # Sheet URLs carry a content hash, so a versioned request never changes
+    cache_control = "public, max-age=31536000, immutable" if request.query.get("v") else "no-cache"
+    # A file response is sent after the handler returns, so its size is counted here
+    METRICS.inc("gallery_bytes_served_total", os.path.getsize(path), route="gallery_atlas_sheet")
+    return web.FileResponse(path, headers={"Cache-Control": cache_control})
 
 @PromptServer.instance.routes.post("/cleanup_thumbnails")
+@timed_route
 async def cleanup_thumbnails(request):
     try:
         data = await request.json()
@@ -465,10 +929,11 @@ async def cleanup_thumbnails(request):
         # We'll handle stale thumbnail cleanup separately with a more intelligent approach
         return web.Response(status=200, text="Thumbnail cleanup skipped - using intelligent management")
     except Exception as e:
-        print(f"Error in thumbnail cleanup: {str(e)}")
+        logger.error(f"Error in thumbnail cleanup: {str(e)}")
         return web.Response(status=500, text="Internal server error")
 
 @PromptServer.instance.routes.get("/check_thumbnails_service")
+@timed_route
 async def check_thumbnails_service(request):
     try:
         # Check if thumbnails directory exists and is accessible
@@ -484,49 +949,101 @@ async def check_thumbnails_service(request):
         
         return web.Response(status=200, text="Thumbnails service is available")
     except Exception as e:
-        print(f"Error checking thumbnails service: {str(e)}")
+        logger.error(f"Error checking thumbnails service: {str(e)}")
         return web.Response(status=500, text="Service check failed")
 
+def _collect_gallery_metrics():
+    """Counters the queue and cache keep themselves, read at scrape time"""
+    queue = THUMBNAIL_QUEUE.status()
+    samples = [
+        ("gauge", "gallery_thumbnail_queue_pending", {}, queue["pending"]),
+        ("gauge", "gallery_thumbnail_queue_running", {}, queue["running"]),
+        ("counter", "gallery_thumbnail_jobs_completed_total", {}, queue["completed"]),
+        ("counter", "gallery_thumbnail_jobs_failed_total", {}, queue["failed"]),
+        ("gauge", "gallery_route_calls_pending", {}, _pending_route_calls),
+    ]
+    if THUMBNAIL_CACHE is not None:
+        cache = THUMBNAIL_CACHE.status()
+        samples += [
+            ("counter", "gallery_thumbnail_cache_hits_total", {}, cache["hits"]),
+            ("counter", "gallery_thumbnail_cache_misses_total", {}, cache["misses"]),
+            ("counter", "gallery_thumbnail_cache_evictions_total", {}, cache["evictions"]),
+            ("gauge", "gallery_thumbnail_cache_bytes", {}, cache["bytes"]),
+        ]
+    return samples
+
+METRICS.add_collector(_collect_gallery_metrics)
+
+@PromptServer.instance.routes.get("/gallery/metrics")
+async def gallery_metrics(request):
+    """Scan, thumbnail, cache and per-route timings as JSON, or Prometheus text with ?format=prometheus"""
+    if request.query.get("format") == "prometheus":
+        return web.Response(body=METRICS.prometheus().encode("utf-8"), headers={
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8", "Cache-Control": "no-store",
+        })
+    return web.json_response(METRICS.snapshot(), headers={"Cache-Control": "no-store"})
+
+@PromptServer.instance.routes.get("/thumbnail_queue_status")
+@timed_route
+async def thumbnail_queue_status(request):
+    return web.json_response(THUMBNAIL_QUEUE.status())
+
+@PromptServer.instance.routes.get("/thumbnail_cache_status")
+@timed_route
+async def thumbnail_cache_status(request):
+    if THUMBNAIL_CACHE is None:
+        return web.json_response({"enabled": False})
+    return web.json_response(dict(THUMBNAIL_CACHE.status(), enabled=True))
+
+def _gc_valid_thumbnails():
+    """Thumbnail paths of every indexed source, or None while an index is not loaded yet"""
+    valid = set()
+    for dir_type in ("input", "output"):
+        base_dir = get_base_dir(dir_type)
+        # Refreshing here would swallow new files before they are queued, so use the index as is
+        if not FILE_INDEX.loaded(base_dir):
+            return None
+        for rel_path in FILE_INDEX.files(base_dir):
+            valid.update(all_thumbnail_paths(dir_type, rel_path))
+    return valid
+
+THUMBNAIL_GC = ThumbnailCollector(
+    THUMBNAIL_STORE,
+    _gc_valid_thumbnails,
+    on_delete=THUMBNAIL_MANIFEST.forget,
+    interval=GALLERY_CONFIG["gc_interval_minutes"] * 60,
+    batch_size=GALLERY_CONFIG["gc_batch_size"],
+    max_bytes=int(GALLERY_CONFIG["gc_max_size_mb"] * 1024 * 1024),
+    max_age=GALLERY_CONFIG["gc_max_age_days"] * 86400,
+    dry_run=GALLERY_CONFIG["gc_dry_run"],
+)
+
 @PromptServer.instance.routes.post("/cleanup_stale_thumbnails")
+@timed_route
 async def cleanup_stale_thumbnails(request):
+    """Schedule a background GC run and return right away with the last report"""
     try:
-        data = await request.json()
-        active_files = data.get('active_files', [])
-
-        # Get all files from both input and output directories
-        input_files = get_enhanced_files("input")
-        output_files = get_enhanced_files("output")
-        all_files = input_files + output_files
-        
-        # Get all thumbnail files
-        thumbnails = [f for f in os.listdir(THUMBNAILS_DIR) if f.endswith('.webp')]
-        removed_count = 0
-        
-        # Create a set of valid thumbnail paths
-        valid_thumbnails = set()
-        for file_path in all_files:
-            # Handle output files with prefix
-            if file_path.startswith('[output]/'):
-                rel_path = file_path[9:]  # Remove "[output]/" prefix
-                valid_thumbnails.add(get_thumbnail_path(f"OP_{rel_path}"))
-            else:
-                valid_thumbnails.add(get_thumbnail_path(file_path))
-        
-        # Remove stale thumbnails
-        for thumbnail in thumbnails:
-            thumbnail_full_path = os.path.join(THUMBNAILS_DIR, thumbnail)
-            if thumbnail_full_path not in valid_thumbnails:
-                try:
-                    os.remove(thumbnail_full_path)
-                    removed_count += 1
-                except OSError:
-                    pass  # Ignore errors when removing files
-        
-        return web.Response(status=200, text=f"Removed {removed_count} stale thumbnails")
+        try:
+            data = await request.json() if request.can_read_body else {}
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return web.Response(status=400, text="Body must be a JSON object")
+        scheduled = THUMBNAIL_GC.request(data.get('dry_run'))
+        return web.json_response(dict(THUMBNAIL_GC.status(), scheduled=scheduled), status=202)
     except Exception as e:
-        print(f"Error cleaning up stale thumbnails: {str(e)}")
+        logger.error(f"Error scheduling thumbnail cleanup: {str(e)}")
         return web.Response(status=500, text="Internal server error")
 
+@PromptServer.instance.routes.get("/cleanup_stale_thumbnails")
+@timed_route
+async def cleanup_stale_thumbnails_status(request):
+    return web.json_response(THUMBNAIL_GC.status())
+
+# Started last, so change callbacks only ever see a fully loaded module
+GALLERY_WATCHER.start()
+THUMBNAIL_GC.start()
+
 NODE_CLASS_MAPPINGS = {}
 WEB_DIRECTORY = "./js"
 __all__ = ['NODE_CLASS_MAPPINGS', 'WEB_DIRECTORY']
\ No newline at end of file
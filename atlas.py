@@ -0,0 +1,153 @@
+import os
+import io
+import json
+import hashlib
+import threading
+from PIL import Image
+
+
+class AtlasStore:
+    """Per-folder sprite sheets of thumbnails plus a JSON offset index.
+
+    Each folder gets a layout of numbered slots; slot n lives on sheet
+    n // (columns * rows). Slots keep their place across rebuilds, so a new,
+    changed or deleted file only re-renders the one sheet that holds it.
+    Freed slots are reused by the next new files.
+    """
+
+    def __init__(self, atlas_dir, tile_size=80, columns=16, rows=16, background=(211, 211, 211)):
+        self.atlas_dir = atlas_dir
+        self.tile_size = tile_size
+        self.columns = columns
+        self.rows = rows
+        self.background = background
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def folder_id(key):
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    def sheet_path(self, folder_id, sheet):
+        return os.path.join(self.atlas_dir, folder_id, f"{sheet}.webp")
+
+    def _layout_path(self, folder_id):
+        return os.path.join(self.atlas_dir, folder_id, "layout.json")
+
+    def _load_layout(self, folder_id):
+        try:
+            with open(self._layout_path(folder_id), "r", encoding="utf-8") as f:
+                layout = json.load(f)
+            if layout.get("tile") == self.tile_size and layout.get("columns") == self.columns and layout.get("rows") == self.rows:
+                return layout
+        except (OSError, ValueError):
+            pass
+        return {"tile": self.tile_size, "columns": self.columns, "rows": self.rows, "slots": [], "sheets": []}
+
+    def build(self, key, entries, load_tile):
+        """Bring the atlas of one folder up to date and return its index.
+
+        entries maps filename -> version; load_tile(filename) returns the bytes
+        of an up to date thumbnail or None. Tiles that fail to load are left
+        blank and retried once the file's version changes.
+        """
+        folder_id = self.folder_id(key)
+        with self._lock:
+            layout = self._load_layout(folder_id)
+            slots = layout["slots"]
+            slot_of = {slot[0]: i for i, slot in enumerate(slots) if slot}
+            dirty = set()
+
+            for i, slot in enumerate(slots):
+                if slot and slot[0] not in entries:
+                    slots[i] = None
+                    dirty.add(i)
+
+            new_files = []
+            for filename, version in entries.items():
+                i = slot_of.get(filename)
+                if i is None:
+                    new_files.append(filename)
+                elif slots[i][1] != version:
+                    slots[i] = [filename, version, True]
+                    dirty.add(i)
+
+            holes = [i for i, slot in enumerate(slots) if slot is None]
+            holes.reverse()
+            for filename in sorted(new_files):
+                if holes:
+                    i = holes.pop()
+                else:
+                    i = len(slots)
+                    slots.append(None)
+                slots[i] = [filename, entries[filename], True]
+                dirty.add(i)
+
+            while slots and slots[-1] is None:
+                slots.pop()
+
+            per_sheet = self.columns * self.rows
+            sheet_count = (len(slots) + per_sheet - 1) // per_sheet
+            sheets = layout["sheets"][:sheet_count]
+            sheets += [None] * (sheet_count - len(sheets))
+            for sheet in sorted({i // per_sheet for i in dirty if i // per_sheet < sheet_count}):
+                sheets[sheet] = self._render_sheet(folder_id, sheet, slots, load_tile)
+
+            # Drop sheets that fell off the end
+            for sheet in range(sheet_count, len(layout["sheets"])):
+                try:
+                    os.remove(self.sheet_path(folder_id, sheet))
+                except OSError:
+                    pass
+
+            layout["slots"] = slots
+            layout["sheets"] = sheets
+            if dirty or len(layout["sheets"]) != sheet_count:
+                os.makedirs(os.path.dirname(self._layout_path(folder_id)), exist_ok=True)
+                with open(self._layout_path(folder_id), "w", encoding="utf-8") as f:
+                    json.dump(layout, f)
+
+            index = {}
+            for i, slot in enumerate(slots):
+                if slot and slot[2]:
+                    cell = i % per_sheet
+                    index[slot[0]] = [i // per_sheet, (cell % self.columns) * self.tile_size, (cell // self.columns) * self.tile_size]
+            return {
+                "folder_id": folder_id,
+                "tile": self.tile_size,
+                "columns": self.columns,
+                "rows": self.rows,
+                "sheets": sheets,
+                "entries": index,
+            }
+
+    def _render_sheet(self, folder_id, sheet, slots, load_tile):
+        # Every tile is drawn from its stored thumbnail. Decoding the previous
+        # lossy sheet and encoding it again would degrade unchanged tiles on
+        # every rebuild.
+        size = (self.columns * self.tile_size, self.rows * self.tile_size)
+        path = self.sheet_path(folder_id, sheet)
+        canvas = Image.new("RGB", size, self.background)
+
+        per_sheet = self.columns * self.rows
+        for i in range(sheet * per_sheet, min(len(slots), (sheet + 1) * per_sheet)):
+            slot = slots[i]
+            if slot is None:
+                continue
+            cell = i % per_sheet
+            box = ((cell % self.columns) * self.tile_size, (cell // self.columns) * self.tile_size)
+            tile_data = load_tile(slot[0])
+            try:
+                with Image.open(io.BytesIO(tile_data)) as tile:
+                    canvas.paste(tile.convert("RGB").resize((self.tile_size, self.tile_size)), box)
+                slot[2] = True
+            except (OSError, TypeError, AttributeError):
+                # Unreadable tile: keep the slot but leave it out of the index
+                slot[2] = False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        canvas.save(tmp_path, "WEBP", quality=80)
+        with open(tmp_path, "rb") as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:16]
+        os.replace(tmp_path, path)
+        return version
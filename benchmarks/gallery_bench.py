@@ -0,0 +1,378 @@
+"""End-to-end benchmark of the gallery on synthetic image trees.
+
+Builds input/output trees of the requested sizes (mixed PNG/JPEG/WebP,
+nested folders, excluded folders and a few non-images), then times the
+listing, thumbnail generation and the HTTP routes under concurrent clients.
+ComfyUI is not needed: server, folder_paths and nodes are replaced by
+minimal stand-ins, and the node is imported from a temporary copy so its
+thumbnails and index never touch the real ones.
+
+    python benchmarks/gallery_bench.py
+    python benchmarks/gallery_bench.py --files 1000 10000 100000 --clients 16 --output results.json
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import mimetypes
+import importlib.util
+from urllib.parse import quote
+
+import PIL
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from thumbnail_bench import make_image  # noqa: E402
+
+FORMATS = (("PNG", ".png"), ("JPEG", ".jpg"), ("WEBP", ".webp"))
+EXCLUDED = ("clipspace", "3d", "audio")
+FILES_PER_DIR = 250
+
+
+# --- Stand-ins for the ComfyUI modules the node imports ---
+
+def install_stubs():
+    mimetypes.add_type("image/webp", ".webp")
+
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.directories = {"input": None, "output": None}
+    folder_paths.get_input_directory = lambda: folder_paths.directories["input"]
+    folder_paths.get_output_directory = lambda: folder_paths.directories["output"]
+
+    def filter_files_content_types(files, content_types):
+        return [f for f in files if (mimetypes.guess_type(f, strict=False)[0] or "").split("/")[0] in content_types]
+
+    folder_paths.filter_files_content_types = filter_files_content_types
+
+    def list_images(directory):
+        files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
+        return sorted(filter_files_content_types(files, ["image"]))
+
+    nodes = types.ModuleType("nodes")
+
+    class LoadImage:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"image": (list_images(folder_paths.get_input_directory()), {"image_upload": True})}}
+
+    class LoadImageMask:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {
+                "image": (list_images(folder_paths.get_input_directory()), {"image_upload": True}),
+                "channel": (["alpha", "red", "green", "blue"],),
+            }}
+
+    class LoadImageOutput:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"required": {"image": (list_images(folder_paths.get_output_directory()), {"image_upload": True})}}
+
+    nodes.LoadImage, nodes.LoadImageMask, nodes.LoadImageOutput = LoadImage, LoadImageMask, LoadImageOutput
+
+    server = types.ModuleType("server")
+
+    class PromptServer:
+        instance = None
+
+        def __init__(self):
+            self.routes = web.RouteTableDef()
+
+        def send_sync(self, event, data, sid=None):
+            pass
+
+    server.PromptServer = PromptServer
+    sys.modules.update({"folder_paths": folder_paths, "nodes": nodes, "server": server})
+    return folder_paths, server
+
+
+def load_gallery(work_dir, name, config):
+    """Import a private copy of the node, so every tree starts with an empty index and cache"""
+    package_dir = os.path.join(work_dir, name)
+    os.makedirs(package_dir)
+    for entry in os.listdir(PACKAGE_DIR):
+        if entry.endswith(".py"):
+            shutil.copy(os.path.join(PACKAGE_DIR, entry), package_dir)
+    with open(os.path.join(package_dir, "gallery_config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    # Routes register on PromptServer.instance, so each copy gets its own
+    sys.modules["server"].PromptServer.instance = sys.modules["server"].PromptServer()
+    spec = importlib.util.spec_from_file_location(name, os.path.join(package_dir, "__init__.py"),
+                                                  submodule_search_locations=[package_dir])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    # Mark the store as already sharded; the legacy migration would scan and queue everything on import
+    store = importlib.import_module(f"{name}.thumbnail_store")
+    os.makedirs(os.path.join(package_dir, "thumbnails"))
+    with open(os.path.join(package_dir, "thumbnails", store.LAYOUT_FILE), "w", encoding="utf-8") as f:
+        f.write(store.LAYOUT)
+    spec.loader.exec_module(module)
+    return module, sys.modules[f"{name}.gallery_core"]
+
+
+# --- Synthetic trees ---
+
+def place(src, dst):
+    # Hard links keep 100k file trees cheap; each path is still a separate gallery entry
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def build_tree(root, count, templates, rng):
+    """Spread count images over the root, nested folders and excluded folders"""
+    stats = {"images": 0, "excluded": 0, "other": 0, "folders": 0}
+    os.makedirs(root, exist_ok=True)
+    top_level = max(1, count // 10)
+    dirs = [root]
+    for i in range((count - top_level + FILES_PER_DIR - 1) // FILES_PER_DIR):
+        depth = 1 + i % 3
+        path = os.path.join(root, *(f"set_{i}_{level}" for level in range(depth)))
+        os.makedirs(path, exist_ok=True)
+        dirs.append(path)
+    stats["folders"] = len(dirs) - 1
+
+    for n in range(count):
+        directory = root if n < top_level else dirs[1 + (n - top_level) // FILES_PER_DIR]
+        fmt, ext = FORMATS[n % len(FORMATS)]
+        place(templates[fmt], os.path.join(directory, f"image_{n:06d}{ext}"))
+        stats["images"] += 1
+
+    for n in range(max(3, count // 100)):
+        # Files the gallery must skip: excluded folders, videos and other non-images
+        folder = os.path.join(root, EXCLUDED[n % len(EXCLUDED)])
+        os.makedirs(folder, exist_ok=True)
+        place(templates["PNG"], os.path.join(folder, f"hidden_{n}.png"))
+        stats["excluded"] += 1
+        with open(os.path.join(rng.choice(dirs), f"note_{n}.{rng.choice(('txt', 'mp4', 'json'))}"), "wb") as f:
+            f.write(b"\0" * 64)
+        stats["other"] += 1
+    return stats
+
+
+# --- Measurements ---
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_listing(core, input_dir, repeat):
+    # Coalescing would hide the repeated scans being measured here
+    core.SNAPSHOT_MAX_AGE = 0
+    result = {}
+    for dir_type in ("input", "output"):
+        cold, files = timed(core.get_enhanced_files, dir_type, queue_thumbnails=False)
+        warm = [timed(core.get_enhanced_files, dir_type, queue_thumbnails=False)[0] for _ in range(repeat)]
+        result[dir_type] = {"files": len(files), "cold_ms": round(cold * 1000, 3), "warm": summarize(warm)}
+
+    # One new file in a nested folder: only that directory is re-listed
+    target = next(os.path.join(d, f) for d, _, fs in os.walk(input_dir)
+                  if d != input_dir and os.path.basename(d) not in EXCLUDED for f in fs if f.startswith("image_"))
+    changed = []
+    for n in range(repeat):
+        place(target, os.path.join(os.path.dirname(target), f"added_{n}{os.path.splitext(target)[1]}"))
+        changed.append(timed(core.get_enhanced_files, "input", queue_thumbnails=False)[0])
+    result["input_after_change"] = summarize(changed)
+
+    # What one /object_info pays for the three patched nodes, with the default coalescing
+    core.SNAPSHOT_MAX_AGE = 1.0
+    object_info = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for node in ("LoadImage", "LoadImageMask", "LoadImageOutput"):
+            getattr(sys.modules["nodes"], node).INPUT_TYPES()
+        object_info.append(time.perf_counter() - start)
+    result["input_types_all_nodes"] = summarize(object_info)
+    return result
+
+
+def bench_thumbnails(core, sample):
+    per_format = {}
+    start = time.perf_counter()
+    for dir_type, file_path in sample:
+        elapsed, path = timed(core.create_thumbnail, file_path, dir_type)
+        ext = os.path.splitext(file_path)[1]
+        entry = per_format.setdefault(ext, {"samples": [], "failed": 0})
+        entry["samples"].append(elapsed)
+        if path is None:
+            entry["failed"] += 1
+    total = time.perf_counter() - start
+    return {
+        "sizes": core.THUMBNAIL_SIZES,
+        "thumbnails_per_sec": round(len(sample) / total, 2) if total else 0.0,
+        "formats": {ext: dict(summarize(e["samples"]), failed=e["failed"]) for ext, e in per_format.items()},
+    }
+
+
+async def run_clients(make_request, clients, requests):
+    """Issue requests from concurrent clients; returns latencies and status counts"""
+    latencies, statuses = [], {}
+    remaining = [requests]
+
+    async def client(worker):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            status = await make_request(worker)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    return dict(summarize(latencies), requests_per_sec=round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+                statuses={str(k): v for k, v in sorted(statuses.items())})
+
+
+async def bench_routes(gallery, values, clients, requests, batch, rng):
+    app = web.Application()
+    app.add_routes(sys.modules["server"].PromptServer.instance.routes)
+    results = {}
+    async with TestClient(TestServer(app)) as http:
+        async def fetch(method, url, **kwargs):
+            async with http.request(method, url, **kwargs) as response:
+                await response.read()
+                return response.status
+
+        etags = {}
+        for value in values:
+            async with http.get(f"/get_thumbnail/{quote(value)}") as response:
+                await response.read()
+                etags[value] = response.headers.get("ETag", "")
+        versions = await (await http.post("/get_thumbnail_versions", json={"filenames": values})).json()
+
+        scenarios = {
+            "get_thumbnail": lambda _: fetch("GET", f"/get_thumbnail/{quote(rng.choice(values))}"),
+            "get_thumbnail_304": lambda _: (lambda v: fetch(
+                "GET", f"/get_thumbnail/{quote(v)}", headers={"If-None-Match": etags[v]}))(rng.choice(values)),
+            "versioned_thumbnail": lambda _: (lambda v: fetch(
+                "GET", f"/gallery/thumbnail/{versions.get(v, '0')}/{quote(v, safe='')}"))(rng.choice(values)),
+            "thumbnails_batch": lambda _: fetch(
+                "POST", "/get_thumbnails_batch", json={"filenames": rng.sample(values, min(batch, len(values)))}),
+            "thumbnails_stream": lambda _: fetch(
+                "POST", "/get_thumbnails_stream", json={"filenames": rng.sample(values, min(batch, len(values)))}),
+            "thumbnail_versions": lambda _: fetch(
+                "POST", "/get_thumbnail_versions", json={"filenames": rng.sample(values, min(batch, len(values)))}),
+            "gallery_list": lambda _: fetch(
+                "GET", f"/gallery/list?dir=input&sort=mtime&limit=100&cursor={rng.randrange(0, 1000, 100)}"),
+            "gallery_list_search": lambda _: fetch("GET", f"/gallery/list?dir=output&q=image_0{rng.randrange(10)}"),
+            # Last, since the first search and duplicates requests start index backfills in the background
+            "gallery_search": lambda _: fetch("GET", f"/gallery/search?dir=output&q=image_0{rng.randrange(10)}"),
+            "gallery_duplicates": lambda _: fetch("GET", "/gallery/duplicates?dir=output&limit=20"),
+        }
+        for name, make_request in scenarios.items():
+            results[name] = await run_clients(make_request, clients, requests)
+    return results
+
+
+def bench_tree(args, folder_paths, work_dir, count, templates):
+    rng = random.Random(count)
+    input_dir = os.path.join(work_dir, f"tree_{count}", "input")
+    output_dir = os.path.join(work_dir, f"tree_{count}", "output")
+    build_start = time.perf_counter()
+    tree = {"input": build_tree(input_dir, count // 2, templates, rng),
+            "output": build_tree(output_dir, count - count // 2, templates, rng)}
+    tree["build_seconds"] = round(time.perf_counter() - build_start, 3)
+    folder_paths.directories.update(input=input_dir, output=output_dir)
+
+    config = {"watcher": "off", "gc_interval_minutes": 0, "thumbnail_storage": args.storage,
+              "memory_cache_mb": args.memory_cache_mb}
+    import_time, (gallery, core) = timed(load_gallery, work_dir, f"gallery_bench_{count}", config)
+    result = {"files": count, "tree": tree, "import_ms": round(import_time * 1000, 3)}
+    result["listing"] = bench_listing(core, input_dir, args.repeat)
+
+    values = core.get_enhanced_files("input", queue_thumbnails=False)[:args.thumbnails // 2]
+    values += core.get_enhanced_files("output", queue_thumbnails=False)[:args.thumbnails - len(values)]
+    sample = []
+    for value in values:
+        dir_type, _, file_path, _ = core.resolve_gallery_file(value)
+        sample.append((dir_type, file_path))
+    result["create_thumbnail"] = bench_thumbnails(core, sample)
+    result["routes"] = asyncio.run(bench_routes(gallery, values, args.clients, args.requests, args.batch, rng))
+    result["metrics"] = gallery.METRICS.snapshot()["histograms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", nargs="+", type=int, default=[1000, 10000], help="tree sizes, split over input and output")
+    parser.add_argument("--image-size", type=int, default=1024, help="side of the synthetic source images")
+    parser.add_argument("--thumbnails", type=int, default=60, help="files to generate thumbnails for and request")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route scenario")
+    parser.add_argument("--batch", type=int, default=50, help="filenames per batch/stream request")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of each listing measurement")
+    parser.add_argument("--storage", choices=["files", "sqlite"], default="files")
+    parser.add_argument("--memory-cache-mb", type=float, default=64)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the generated trees")
+    args = parser.parse_args()
+
+    folder_paths, _ = install_stubs()
+    work_dir = tempfile.mkdtemp(prefix="gallery_bench_")
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pillow": PIL.__version__,
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+        "results": [],
+    }
+    try:
+        templates = {}
+        for fmt, ext in FORMATS:
+            templates[fmt] = os.path.join(work_dir, f"template{ext}")
+            make_image(templates[fmt], fmt, args.image_size, args.image_size * 3 // 4)
+        for count in args.files:
+            print(f"Benchmarking {count} files...", file=sys.stderr)
+            report["results"].append(bench_tree(args, folder_paths, work_dir, count, templates))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"Trees kept in {work_dir}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
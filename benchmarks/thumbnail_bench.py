@@ -0,0 +1,85 @@
+"""Micro-benchmark for the thumbnail pipeline.
+
+Generates synthetic images per format and size, then reports how many
+images per second encode_thumbnails() handles. That is the per-image cost of
+the node: one decode, every thumbnail tier rendered and WebP encoded, and the
+perceptual hash.
+
+    python benchmarks/thumbnail_bench.py
+    python benchmarks/thumbnail_bench.py --formats JPEG PNG --sizes 3840x2160 --json
+    python benchmarks/thumbnail_bench.py --tiers 80
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import importlib
+
+from PIL import Image
+
+# The thumbnailer uses relative imports; load it as part of the node's package without running __init__.py
+if "load_image_gallery" not in sys.modules:
+    package = types.ModuleType("load_image_gallery")
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules["load_image_gallery"] = package
+encode_thumbnails = importlib.import_module("load_image_gallery.thumbnailer").encode_thumbnails
+BASE_SIZE = importlib.import_module("load_image_gallery.thumbnail_store").BASE_SIZE
+DEFAULTS = importlib.import_module("load_image_gallery.config").DEFAULTS
+
+# The tiers a default configuration renders, as in gallery_core.THUMBNAIL_SIZES
+DEFAULT_TIERS = sorted({BASE_SIZE, *DEFAULTS["thumbnail_sizes"]} | ({DEFAULTS["preview_size"]} - {0}))
+
+EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def make_image(path, fmt, width, height, alpha=False):
+    # A gradient plus noise, so encoders and decoders cannot take shortcuts
+    base = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    img = Image.merge("RGB", (base, noise, base.transpose(Image.FLIP_LEFT_RIGHT)))
+    if alpha and fmt != "JPEG":
+        img.putalpha(base)
+    img.save(path, fmt, quality=90)
+
+
+def bench_one(path, tiers, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode_thumbnails(path, tiers)
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG", "WEBP"])
+    parser.add_argument("--sizes", nargs="+", default=["1024x1024", "3840x2160", "7680x4320"])
+    parser.add_argument("--tiers", nargs="+", type=int, default=DEFAULT_TIERS,
+                        help=f"thumbnail sizes rendered per image (default: {' '.join(map(str, DEFAULT_TIERS))})")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--alpha", action="store_true", help="add an alpha channel to PNG/WebP sources")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats:
+            for size in args.sizes:
+                width, height = (int(v) for v in size.split("x"))
+                path = os.path.join(tmp, f"{size}{EXTENSIONS[fmt]}")
+                make_image(path, fmt, width, height, args.alpha)
+                encode_thumbnails(path, args.tiers)  # warm up
+                rate = bench_one(path, args.tiers, args.iterations)
+                results.append({"format": fmt, "size": size, "tiers": args.tiers, "images_per_sec": round(rate, 2)})
+                if not args.json:
+                    print(f"{fmt:<5} {size:>10}  {rate:8.2f} images/sec")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gallery_config.json")
+
+DEFAULTS = {
+    # "auto" uses watchdog when installed and polling otherwise; "watchdog", "poll" or "off"
+    "watcher": "auto",
+    # Each poll stats every indexed directory and up to 5000 indexed files to catch
+    # overwrites in place, too much I/O every few seconds on large or network mounted
+    # trees. Install watchdog for instant updates at no polling cost.
+    "watch_poll_interval": 30.0,
+    # "files" (sharded files) or "sqlite" (one packed file, for network mounted installs)
+    "thumbnail_storage": "files",
+    # Memory for recently served thumbnails, 0 turns the cache off
+    "memory_cache_mb": 64,
+    # Extra thumbnail sizes for HiDPI screens, rendered with the 80 px grid thumbnail
+    "thumbnail_sizes": [160, 256],
+    # Size shown when hovering a tile; 0 turns the hover preview off
+    "preview_size": 256,
+    # Background removal of thumbnails whose source is gone; 0 minutes runs only on request
+    "gc_interval_minutes": 60,
+    "gc_batch_size": 500,
+    # Optional quotas, oldest thumbnails are evicted first; 0 means no limit
+    "gc_max_size_mb": 0,
+    "gc_max_age_days": 0,
+    "gc_dry_run": False,
+    # Serve each folder's thumbnails as a few sprite sheets instead of one image per file
+    "atlas": False,
+    "atlas_columns": 16,
+    "atlas_rows": 16,
+    # Index dimensions and the embedded prompt/workflow of every image for /gallery/search
+    "metadata_index": True,
+    # Perceptual hashes for /gallery/duplicates and collapsing near duplicates in the gallery
+    "duplicate_detection": True,
+    # Hamming distance (of 64 bits) up to which two images count as near duplicates
+    "duplicate_threshold": 6,
+}
+
+
+def load_config(path=CONFIG_PATH):
+    """Defaults overlaid with the optional gallery_config.json next to this file"""
+    config = dict(DEFAULTS)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                config.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error reading {path}, using defaults: {str(e)}")
+    return config
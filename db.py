@@ -0,0 +1,33 @@
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def connect(db_path, schema, journal_mode="WAL"):
+    """Open a SQLite database shared between threads and apply schema statements.
+
+    WAL needs shared memory between the processes using the file, which
+    network filesystems do not provide. Databases that may live on one pass
+    journal_mode="DELETE", and a WAL request that SQLite refuses falls back
+    to it as well. Returns None if the database cannot be used, so callers
+    can fall back to keeping their state in memory.
+    """
+    try:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            mode = conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.info(f"Database {db_path} cannot use journal mode {journal_mode}: {str(e)}")
+            mode = None
+        if mode is None or mode.upper() != journal_mode.upper():
+            mode = conn.execute("PRAGMA journal_mode=DELETE").fetchone()[0]
+        # Safe against corruption in WAL mode; a rollback journal needs full syncs
+        conn.execute(f"PRAGMA synchronous={'NORMAL' if mode.upper() == 'WAL' else 'FULL'}")
+        for statement in schema:
+            conn.execute(statement)
+        conn.commit()
+        return conn
+    except sqlite3.Error as e:
+        logger.warning(f"Database {db_path} unavailable, falling back to memory only: {str(e)}")
+        return None
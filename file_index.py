@@ -0,0 +1,290 @@
+import os
+import time
+import logging
+import json
+import sqlite3
+import threading
+
+from .db import connect
+
+logger = logging.getLogger(__name__)
+
+# Directory mtimes only have 2 s resolution on FAT and SMB (1 s on ext3), so a
+# file created in the same tick as a listing leaves the mtime unchanged.
+# Directories modified this recently are listed again on the next refresh.
+SETTLE_NS = 2 * 10**9
+# Stored instead of the mtime of such a directory; it never matches a real one
+UNSETTLED = -1
+
+
+class _DirState:
+    __slots__ = ("mtime_ns", "subdirs", "files")
+
+    def __init__(self, mtime_ns, subdirs, files):
+        self.mtime_ns = mtime_ns
+        self.subdirs = subdirs
+        self.files = files  # name -> (mtime_ns, size)
+
+
+class FileIndex:
+    """Persistent index of image files below one or more base directories.
+
+    Every directory is remembered together with its mtime. A refresh only
+    stats the known directories and re-lists the ones whose mtime changed,
+    so an unchanged tree is listed without touching any file. A directory
+    whose mtime was within SETTLE_NS of its listing is re-listed until it
+    settles. The state is
+    stored in SQLite so a restart does not need a full walk either.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._roots = {}
+        self._listings = {}
+        self._generations = {}
+        self._queries = {}
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path, (
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "root TEXT, rel_dir TEXT, mtime_ns INTEGER, subdirs TEXT, "
+                "PRIMARY KEY (root, rel_dir))",
+                "CREATE TABLE IF NOT EXISTS files ("
+                "root TEXT, rel_dir TEXT, name TEXT, mtime_ns INTEGER, size INTEGER, "
+                "PRIMARY KEY (root, rel_dir, name))",
+            )) or False
+        return self._conn or None
+
+    def _load(self, root):
+        dirs = {}
+        conn = self._connect()
+        if conn is not None:
+            try:
+                for rel_dir, mtime_ns, subdirs in conn.execute(
+                    "SELECT rel_dir, mtime_ns, subdirs FROM dirs WHERE root = ?", (root,)
+                ):
+                    dirs[rel_dir] = _DirState(mtime_ns, tuple(json.loads(subdirs)), {})
+                for rel_dir, name, mtime_ns, size in conn.execute(
+                    "SELECT rel_dir, name, mtime_ns, size FROM files WHERE root = ?", (root,)
+                ):
+                    state = dirs.get(rel_dir)
+                    if state is not None:
+                        state.files[name] = (mtime_ns, size)
+            except (sqlite3.Error, ValueError) as e:
+                logger.error(f"Error loading file index for {root}: {str(e)}")
+                dirs = {}
+        self._roots[root] = dirs
+        return dirs
+
+    def refresh(self, base_dir, exclude_folders=(), accept=None):
+        """Bring the index for base_dir up to date.
+
+        Returns (added, removed) lists of paths relative to base_dir.
+        """
+        root = os.path.abspath(base_dir)
+        with self._lock:
+            dirs = self._roots.get(root)
+            if dirs is None:
+                dirs = self._load(root)
+
+            added, removed = [], []
+            changed, dropped = {}, []
+            seen, visited = set(), set()
+            pending = [""]
+            while pending:
+                rel_dir = pending.pop()
+                abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+                try:
+                    st = os.stat(abs_dir)
+                except OSError:
+                    continue
+                # Guard against symlink loops since links are followed
+                if (st.st_dev, st.st_ino) in visited:
+                    continue
+                visited.add((st.st_dev, st.st_ino))
+                seen.add(rel_dir)
+
+                state = dirs.get(rel_dir)
+                if state is None or state.mtime_ns != st.st_mtime_ns:
+                    mtime_ns = st.st_mtime_ns if time.time_ns() - st.st_mtime_ns >= SETTLE_NS else UNSETTLED
+                    new_state = self._scan_dir(abs_dir, mtime_ns, exclude_folders, accept)
+                    old_files = state.files if state is not None else {}
+                    for name in new_state.files:
+                        if name not in old_files:
+                            added.append(os.path.join(rel_dir, name))
+                    for name in old_files:
+                        if name not in new_state.files:
+                            removed.append(os.path.join(rel_dir, name))
+                    # Re-listing an unsettled directory usually finds nothing new
+                    if (state is None or state.mtime_ns != new_state.mtime_ns or state.files != new_state.files
+                            or state.subdirs != new_state.subdirs):
+                        changed[rel_dir] = new_state
+                    dirs[rel_dir] = state = new_state
+
+                pending.extend(os.path.join(rel_dir, d) if rel_dir else d for d in state.subdirs)
+
+            for rel_dir in [d for d in dirs if d not in seen]:
+                for name in dirs.pop(rel_dir).files:
+                    removed.append(os.path.join(rel_dir, name))
+                dropped.append(rel_dir)
+
+            if changed or dropped:
+                self._touch(root)
+                self._persist(root, changed, dropped)
+            return added, removed
+
+    def _touch(self, root):
+        # Any change invalidates derived listings of this root
+        self._generations[root] = self._generations.get(root, 0) + 1
+        self._listings.pop(root, None)
+
+    def generation(self, base_dir):
+        """Counter that changes whenever the indexed contents of base_dir change"""
+        with self._lock:
+            return self._generations.get(os.path.abspath(base_dir), 0)
+
+    def _scan_dir(self, abs_dir, mtime_ns, exclude_folders, accept):
+        subdirs, files = [], {}
+        try:
+            with os.scandir(abs_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if entry.name not in exclude_folders:
+                                subdirs.append(entry.name)
+                        elif entry.is_file():
+                            if accept is None or accept(entry.name):
+                                st = entry.stat()
+                                files[entry.name] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.error(f"Error scanning directory {abs_dir}: {str(e)}")
+        return _DirState(mtime_ns, tuple(sorted(subdirs)), files)
+
+    def _persist(self, root, changed, dropped):
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            with conn:
+                for rel_dir in dropped:
+                    conn.execute("DELETE FROM dirs WHERE root = ? AND rel_dir = ?", (root, rel_dir))
+                    conn.execute("DELETE FROM files WHERE root = ? AND rel_dir = ?", (root, rel_dir))
+                for rel_dir, state in changed.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                        (root, rel_dir, state.mtime_ns, json.dumps(list(state.subdirs))),
+                    )
+                    conn.execute("DELETE FROM files WHERE root = ? AND rel_dir = ?", (root, rel_dir))
+                    conn.executemany(
+                        "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                        [(root, rel_dir, name, m, s) for name, (m, s) in state.files.items()],
+                    )
+        except sqlite3.Error as e:
+            logger.error(f"Error saving file index for {root}: {str(e)}")
+
+    def loaded(self, base_dir):
+        """True once base_dir has been refreshed in this process"""
+        with self._lock:
+            return os.path.abspath(base_dir) in self._roots
+
+    def files(self, base_dir):
+        """Return {rel_path: (mtime_ns, size)} for the last refresh of base_dir."""
+        root = os.path.abspath(base_dir)
+        with self._lock:
+            result = {}
+            for rel_dir, state in self._roots.get(root, {}).items():
+                for name, info in state.files.items():
+                    result[os.path.join(rel_dir, name)] = info
+            return result
+
+    def stat(self, base_dir, rel_path):
+        """Return the indexed (mtime_ns, size) of one file without touching the disk."""
+        rel_dir, name = os.path.split(os.path.normpath(rel_path))
+        with self._lock:
+            state = self._roots.get(os.path.abspath(base_dir), {}).get(rel_dir)
+            return state.files.get(name) if state is not None else None
+
+    def update_file(self, base_dir, rel_path, mtime_ns, size):
+        """Record new validators for a file that was modified in place.
+
+        Overwriting a file keeps its directory mtime, so refresh() cannot see it.
+        """
+        root = os.path.abspath(base_dir)
+        rel_dir, name = os.path.split(os.path.normpath(rel_path))
+        with self._lock:
+            state = self._roots.get(root, {}).get(rel_dir)
+            if state is None or name not in state.files or state.files[name] == (mtime_ns, size):
+                return
+            state.files[name] = (mtime_ns, size)
+            self._touch(root)
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    with conn:
+                        conn.execute(
+                            "UPDATE files SET mtime_ns = ?, size = ? WHERE root = ? AND rel_dir = ? AND name = ?",
+                            (mtime_ns, size, root, rel_dir, name),
+                        )
+                except sqlite3.Error as e:
+                    logger.error(f"Error saving file index for {root}: {str(e)}")
+
+    def listing(self, base_dir):
+        """Return the sorted relative paths of base_dir, cached until the tree changes."""
+        root = os.path.abspath(base_dir)
+        with self._lock:
+            listing = self._listings.get(root)
+            if listing is None:
+                listing = self._listings[root] = sorted(self.files(root))
+            return listing
+
+    def query(self, base_dir, folder=None, search=None, prefix=None, sort="name", descending=False):
+        """Filtered and sorted view of the index for paginated listings.
+
+        folder=None covers the whole tree, otherwise only the files directly in
+        that folder. search is a case-insensitive substring of the relative
+        path and prefix a case-insensitive start of the file name. Returns
+        (entries, subfolders) with entries as (rel_path, mtime_ns, size).
+        Results are cached until the tree changes.
+        """
+        root = os.path.abspath(base_dir)
+        key = (root, folder, search, prefix, sort, descending)
+        with self._lock:
+            generation = self._generations.get(root, 0)
+            cached = self._queries.get(key)
+            if cached is not None and cached[0] == generation:
+                return cached[1]
+
+            dirs = self._roots.get(root, {})
+            if folder is None:
+                states = dirs.items()
+                subfolders = []
+            else:
+                state = dirs.get(folder)
+                states = [(folder, state)] if state is not None else []
+                subfolders = list(state.subdirs) if state is not None else []
+
+            search = search.lower() if search else None
+            prefix = prefix.lower() if prefix else None
+            entries = []
+            for rel_dir, state in states:
+                for name, (mtime_ns, size) in state.files.items():
+                    if prefix and not name.lower().startswith(prefix):
+                        continue
+                    rel_path = os.path.join(rel_dir, name)
+                    if search and search not in rel_path.lower():
+                        continue
+                    entries.append((rel_path, mtime_ns, size))
+
+            column = {"name": 0, "mtime": 1, "size": 2}[sort]
+            entries.sort(key=lambda e: (e[column], e[0]), reverse=descending)
+
+            # Keep only a handful of views; a new search supersedes older ones
+            if len(self._queries) >= 16:
+                self._queries.pop(next(iter(self._queries)))
+            self._queries[key] = (generation, (entries, subfolders))
+            return entries, subfolders
@@ -0,0 +1,423 @@
+import os
+import time
+import logging
+import hashlib
+import threading
+import folder_paths
+from .file_index import FileIndex
+from .thumbnail_manifest import ThumbnailManifest
+from .metadata_index import MetadataIndex
+from .perceptual_hash import HashIndex, phash_bytes, HAS_NUMPY, MAX_THRESHOLD
+from .thumbnailer import encode_thumbnails, read_metadata
+from .config import load_config
+from .thumbnail_queue import ThumbnailQueue, PRIORITY_BACKGROUND
+from .thumbnail_store import ShardedThumbnailStore, PackedThumbnailStore, BASE_SIZE
+from .thumbnail_cache import CachedThumbnailStore
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Path to the thumbnails directory
+THUMBNAILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnails")
+if not os.path.exists(THUMBNAILS_DIR):
+    os.makedirs(THUMBNAILS_DIR)
+
+GALLERY_CONFIG = load_config()
+
+# "files" keeps one sharded file per thumbnail, "sqlite" packs them all into one file
+if GALLERY_CONFIG["thumbnail_storage"] == "sqlite":
+    THUMBNAIL_STORE = PackedThumbnailStore(os.path.join(THUMBNAILS_DIR, "thumbnail_pack.db"))
+else:
+    THUMBNAIL_STORE = ShardedThumbnailStore(THUMBNAILS_DIR)
+
+# Hot thumbnails are kept in memory in front of the store
+THUMBNAIL_CACHE = None
+if GALLERY_CONFIG["memory_cache_mb"] > 0:
+    THUMBNAIL_CACHE = THUMBNAIL_STORE = CachedThumbnailStore(
+        THUMBNAIL_STORE, int(GALLERY_CONFIG["memory_cache_mb"] * 1024 * 1024)
+    )
+
+# Every tier is rendered from the same decode; the base size is the grid thumbnail
+THUMBNAIL_SIZES = sorted({BASE_SIZE, *GALLERY_CONFIG["thumbnail_sizes"]} | ({GALLERY_CONFIG["preview_size"]} - {0}))
+
+def parse_thumbnail_size(value):
+    """Return the configured tier for a size parameter, BASE_SIZE when absent or None when unknown"""
+    if value in (None, ""):
+        return BASE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return size if size in THUMBNAIL_SIZES else None
+
+def thumbnail_tier(size):
+    """The smallest configured tier of at least size pixels, else the largest one"""
+    return next((tier for tier in THUMBNAIL_SIZES if tier >= size), THUMBNAIL_SIZES[-1])
+
+def get_thumbnail_path(dir_type, rel_path, size=BASE_SIZE):
+    return THUMBNAIL_STORE.path(dir_type, rel_path, size)
+
+def all_thumbnail_paths(dir_type, rel_path):
+    return [get_thumbnail_path(dir_type, rel_path, size) for size in THUMBNAIL_SIZES]
+
+def legacy_thumbnail_path(dir_type, rel_path):
+    """Where the old flat layout kept a thumbnail, used only for migration"""
+    filename = f"OP_{rel_path}" if dir_type == "output" else rel_path
+    safe_filename = filename.replace(os.sep, "__").replace("/", "__").replace("\\", "__").replace(" ", "_")
+    return os.path.join(THUMBNAILS_DIR, f"{safe_filename}.webp")
+
+# Create thumbnail from image file
+def create_thumbnail(file_path, dir_type="input", size=(80, 80), is_output=False):
+    """Render every configured size from one decode and return the path of the requested one.
+
+    size is (width, height) and maps to the configured tier that covers it.
+    """
+    try:
+        # Skip non-image files and handle None paths
+        if not file_path or not os.path.exists(file_path):
+            return None
+
+        # Validators are taken before decoding, so a concurrent overwrite shows up as stale
+        source_stat = os.stat(file_path)
+            
+        # Single decode: crop, scale and flatten happen in one pass for all sizes
+        with METRICS.timer("gallery_thumbnail_render_seconds"):
+            result = encode_thumbnails(file_path, THUMBNAIL_SIZES)
+        if result is None:
+            # Not a valid image file
+            METRICS.inc("gallery_thumbnails_failed_total")
+            return None
+
+        if is_output:
+            dir_type = "output"
+        rel_path = os.path.relpath(file_path, get_base_dir(dir_type))
+        encoded, metadata = result
+        if not store_thumbnails(dir_type, rel_path, source_stat, encoded, metadata):
+            METRICS.inc("gallery_thumbnails_failed_total")
+            return None
+        METRICS.inc("gallery_thumbnails_generated_total")
+        return get_thumbnail_path(dir_type, rel_path, thumbnail_tier(max(size)))
+            
+    except Exception as e:
+        METRICS.inc("gallery_thumbnails_failed_total")
+        logger.warning(f"Error creating thumbnail for {file_path}: {str(e)}")
+        return None
+
+def store_thumbnails(dir_type, rel_path, source_stat, encoded, metadata=None):
+    """Save the encoded tiers of one source, record what they were made from and index its metadata"""
+    try:
+        for tier, data in encoded.items():
+            tier_path = get_thumbnail_path(dir_type, rel_path, tier)
+            THUMBNAIL_STORE.write(tier_path, data)
+            THUMBNAIL_MANIFEST.record(tier_path, source_stat)
+        FILE_INDEX.update_file(get_base_dir(dir_type), rel_path, source_stat.st_mtime_ns, source_stat.st_size)
+        if METADATA_INDEX is not None and metadata is not None:
+            METADATA_INDEX.record(dir_type, rel_path, source_stat.st_mtime_ns, source_stat.st_size, metadata)
+        if HASH_INDEX is not None and metadata is not None and metadata.get("phash") is not None:
+            HASH_INDEX.record(dir_type, rel_path, source_stat.st_mtime_ns, source_stat.st_size, metadata["phash"])
+        return True
+    except Exception as e:
+        logger.error(f"Error saving thumbnail for {rel_path}: {str(e)}")
+        return False
+
+def thumbnail_is_fresh(file_path, thumbnail_path):
+    """Check with one stat of the source whether its thumbnail is still current"""
+    fresh = _thumbnail_is_fresh(file_path, thumbnail_path)
+    METRICS.inc("gallery_thumbnail_lookups_total", result="fresh" if fresh else "stale")
+    return fresh
+
+def _thumbnail_is_fresh(file_path, thumbnail_path):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return False
+    return THUMBNAIL_MANIFEST.check(thumbnail_path, st, lambda: THUMBNAIL_STORE.version(thumbnail_path))
+
+def _thumbnail_job(file_path, dir_type, thumbnail_path, size=BASE_SIZE):
+    # The thumbnail may have been created on demand while the job was waiting
+    if thumbnail_is_fresh(file_path, thumbnail_path):
+        return thumbnail_path
+    return create_thumbnail(file_path, dir_type, size=(size, size), is_output=(dir_type == "output"))
+
+# Background thumbnail generation, so listing never waits for PIL
+THUMBNAIL_QUEUE = ThumbnailQueue(_thumbnail_job)
+
+def queue_thumbnail(file_path, dir_type, thumbnail_path, priority=PRIORITY_BACKGROUND, size=BASE_SIZE):
+    """Schedule thumbnail generation and return a Future for the thumbnail path"""
+    return THUMBNAIL_QUEUE.enqueue(thumbnail_path, file_path, dir_type, thumbnail_path, size, priority=priority)
+
+EXCLUDE_FOLDERS = ["clipspace", "3d", "audio"]  # Add more protected folders
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
+
+# Persistent index of the input/output trees, refreshed by directory mtime
+GALLERY_DB = os.path.join(THUMBNAILS_DIR, "gallery_index.db")
+FILE_INDEX = FileIndex(GALLERY_DB)
+# Source mtime/size/inode each thumbnail was generated from
+THUMBNAIL_MANIFEST = ThumbnailManifest(GALLERY_DB)
+# Dimensions and embedded prompt/workflow, filled in while thumbnails are generated
+METADATA_INDEX = MetadataIndex(GALLERY_DB) if GALLERY_CONFIG["metadata_index"] else None
+# Perceptual hashes, also computed while thumbnails are generated
+HASH_INDEX = HashIndex(
+    GALLERY_DB,
+    on_clustered=lambda dir_type, seconds: METRICS.observe("gallery_duplicate_cluster_seconds", seconds, dir_type=dir_type),
+) if GALLERY_CONFIG["duplicate_detection"] and HAS_NUMPY else None
+if GALLERY_CONFIG["duplicate_detection"] and not HAS_NUMPY:
+    logger.info("NumPy is not installed, duplicate detection is off")
+# Clustering cost grows steeply with the threshold
+GALLERY_CONFIG["duplicate_threshold"] = min(GALLERY_CONFIG["duplicate_threshold"], MAX_THRESHOLD)
+
+def is_gallery_image(filename):
+    # Filter for image files only - skip video files explicitly
+    if not folder_paths.filter_files_content_types([filename], ["image"]):
+        return False
+    # Skip video files regardless of MIME detection
+    return not any(filename.lower().endswith(ext) for ext in VIDEO_EXTENSIONS)
+
+def queue_missing_thumbnails(dir_type, rel_paths):
+    """Queue background generation for every file whose thumbnail is missing or stale"""
+    base_dir = get_base_dir(dir_type)
+    queued = []
+    for rel_file_path in rel_paths:
+        file_path = os.path.join(base_dir, rel_file_path)
+        thumbnail_path = get_thumbnail_path(dir_type, rel_file_path)
+        if not thumbnail_is_fresh(file_path, thumbnail_path):
+            queue_thumbnail(file_path, dir_type, thumbnail_path)
+            queued.append(rel_file_path)
+    return queued
+
+def refresh_index(dir_type):
+    """Bring the index of one tree up to date and return (added, removed)"""
+    with METRICS.timer("gallery_scan_seconds", dir_type=dir_type):
+        added, removed = FILE_INDEX.refresh(get_base_dir(dir_type), EXCLUDE_FOLDERS, is_gallery_image)
+    METRICS.inc("gallery_scans_total", dir_type=dir_type)
+    METRICS.inc("gallery_files_added_total", len(added), dir_type=dir_type)
+    METRICS.inc("gallery_files_removed_total", len(removed), dir_type=dir_type)
+    if removed and METADATA_INDEX is not None:
+        METADATA_INDEX.forget(dir_type, removed)
+    if removed and HASH_INDEX is not None:
+        HASH_INDEX.forget(dir_type, removed)
+    return added, removed
+
+def sync_metadata_index(dir_types=("input", "output"), queue_thumbnails=True, batch_size=200):
+    """Index the metadata of files that have no current row yet and drop rows of removed files.
+
+    Covers thumbnails made before the index existed and files changed while
+    the server was down. Only image headers and text chunks are read, no
+    pixels. Returns the number of files indexed.
+    """
+    if METADATA_INDEX is None:
+        return 0
+    indexed = 0
+    for dir_type in dir_types:
+        base_dir = get_base_dir(dir_type)
+        listing_snapshot(dir_type, queue_thumbnails)
+        files = FILE_INDEX.files(base_dir)
+        known = METADATA_INDEX.versions(dir_type)
+        METADATA_INDEX.forget(dir_type, [rel_path for rel_path in known if rel_path not in files])
+        batch = []
+        for rel_path, version in files.items():
+            if known.get(rel_path) == version:
+                continue
+            metadata = read_metadata(os.path.join(base_dir, rel_path))
+            if metadata is not None:
+                batch.append((rel_path, version[0], version[1], metadata))
+            if len(batch) >= batch_size:
+                METADATA_INDEX.record_many(dir_type, batch)
+                indexed += len(batch)
+                batch = []
+        METADATA_INDEX.record_many(dir_type, batch)
+        indexed += len(batch)
+    METRICS.inc("gallery_metadata_indexed_total", indexed)
+    return indexed
+
+def sync_hash_index(dir_types=("input", "output"), queue_thumbnails=True, batch_size=200):
+    """Hash files that have a current thumbnail but no current hash, and drop hashes of removed files.
+
+    The hash is taken from the largest stored thumbnail, the same square it
+    is computed from during generation, so no source is decoded. Files
+    without a current thumbnail get their hash when it is generated.
+    Returns the number of files hashed.
+    """
+    if HASH_INDEX is None:
+        return 0
+    hashed = 0
+    for dir_type in dir_types:
+        base_dir = get_base_dir(dir_type)
+        listing_snapshot(dir_type, queue_thumbnails)
+        files = FILE_INDEX.files(base_dir)
+        known = HASH_INDEX.versions(dir_type)
+        HASH_INDEX.forget(dir_type, [rel_path for rel_path in known if rel_path not in files])
+        batch = []
+        for rel_path, version in files.items():
+            if known.get(rel_path) == version:
+                continue
+            largest = get_thumbnail_path(dir_type, rel_path, THUMBNAIL_SIZES[-1])
+            if not _thumbnail_is_fresh(os.path.join(base_dir, rel_path), largest):
+                continue
+            data = THUMBNAIL_STORE.read(largest)
+            if data is None:
+                continue
+            try:
+                batch.append((rel_path, version[0], version[1], phash_bytes(data)))
+            except Exception as e:
+                logger.warning(f"Error hashing thumbnail of {rel_path}: {str(e)}")
+            if len(batch) >= batch_size:
+                HASH_INDEX.record_many(dir_type, batch)
+                hashed += len(batch)
+                batch = []
+        HASH_INDEX.record_many(dir_type, batch)
+        hashed += len(batch)
+    METRICS.inc("gallery_hashes_indexed_total", hashed)
+    return hashed
+
+def duplicate_groups(dir_type, threshold):
+    """Near-duplicate groups of one tree, each newest first, the largest groups first.
+
+    None until the tree has been clustered in the background.
+    """
+    base_dir = get_base_dir(dir_type)
+    clusters = HASH_INDEX.clusters(dir_type, threshold)
+    if clusters is None:
+        return None
+    groups = []
+    for cluster in clusters:
+        # Only files still in the listing, in case a removal has not been refreshed yet
+        members = [(FILE_INDEX.stat(base_dir, rel_path), rel_path) for rel_path in cluster]
+        members = sorted(((info[0], rel_path) for info, rel_path in members if info is not None), reverse=True)
+        if len(members) > 1:
+            groups.append([rel_path for _, rel_path in members])
+    groups.sort(key=len, reverse=True)
+    return groups
+
+# Files stat'ed per poll when looking for overwrites, so a poll stays cheap on large trees
+OVERWRITE_SCAN_BATCH = 5000
+_overwrite_cursors = {}
+
+def scan_overwrites(dir_type, batch_size=OVERWRITE_SCAN_BATCH):
+    """Stat the next slice of indexed files and return those changed in place since they were indexed.
+
+    Overwrites keep their directory mtime, so without filesystem events this
+    is the only way to see them. Each call moves on to the next slice, so
+    the whole tree is covered every len(tree) / batch_size calls.
+    """
+    base_dir = get_base_dir(dir_type)
+    listing = FILE_INDEX.listing(base_dir)
+    if not listing:
+        return []
+    start = _overwrite_cursors.get(dir_type, 0)
+    if start >= len(listing):
+        start = 0
+    chunk = listing[start:start + batch_size]
+    _overwrite_cursors[dir_type] = start + len(chunk)
+    modified = []
+    for rel_path in chunk:
+        info = FILE_INDEX.stat(base_dir, rel_path)
+        try:
+            st = os.stat(os.path.join(base_dir, rel_path))
+        except OSError:
+            # Removed; the next refresh drops it
+            continue
+        if info is not None and info != (st.st_mtime_ns, st.st_size):
+            modified.append(rel_path)
+    return modified
+
+# Several nodes list the same tree during one /object_info, so scans this close together share one walk
+SNAPSHOT_MAX_AGE = 1.0
+_snapshots = {}  # dir_type -> (checked_at, generation, gallery values)
+_snapshot_lock = threading.Lock()
+
+def listing_snapshot(dir_type, queue_thumbnails=True):
+    """Return (generation, gallery values) of one tree.
+
+    The values are rebuilt only when the index generation changes, so the
+    same tuple is shared by every caller until the tree changes.
+    """
+    start = time.perf_counter()
+    base_dir = get_base_dir(dir_type)
+    with _snapshot_lock:
+        now = time.monotonic()
+        snapshot = _snapshots.get(dir_type)
+        if snapshot is None or now - snapshot[0] >= SNAPSHOT_MAX_AGE:
+            added, _ = refresh_index(dir_type)
+            # Only files that are new to the index need a thumbnail check
+            if queue_thumbnails:
+                queue_missing_thumbnails(dir_type, added)
+            checked_at = now
+        else:
+            checked_at = snapshot[0]
+
+        # Other refreshes (watcher, /gallery/list) may have moved the generation in between
+        generation = FILE_INDEX.generation(base_dir)
+        if snapshot is not None and snapshot[1] == generation:
+            values = snapshot[2]
+        elif dir_type == "output":
+            # Add prefix to distinguish input and output files
+            values = tuple(f"[output]/{rel_file_path}" for rel_file_path in FILE_INDEX.listing(base_dir))
+        else:
+            values = tuple(FILE_INDEX.listing(base_dir))
+        _snapshots[dir_type] = (checked_at, generation, values)
+
+    METRICS.set("gallery_files", len(values), dir_type=dir_type)
+    # Everything a node's INPUT_TYPES, and so /object_info, waits for
+    METRICS.observe("gallery_list_seconds", time.perf_counter() - start, dir_type=dir_type)
+    return generation, values
+
+def get_enhanced_files(input_dir_type="input", queue_thumbnails=True):
+    """Get enhanced files from either input or output directory"""
+    if input_dir_type not in ("input", "output"):
+        return []
+    return list(listing_snapshot(input_dir_type, queue_thumbnails)[1])
+
+def get_base_dir(dir_type):
+    return folder_paths.get_output_directory() if dir_type == "output" else folder_paths.get_input_directory()
+
+def resolve_gallery_file(filename, size=BASE_SIZE):
+    """Map a gallery value to (dir_type, rel_path, file_path, thumbnail_path)"""
+    if filename.startswith('[output]/'):
+        rel_path = filename[9:]  # Remove "[output]/" prefix
+        file_path = os.path.join(folder_paths.get_output_directory(), rel_path)
+        return "output", rel_path, file_path, get_thumbnail_path("output", rel_path, size)
+    file_path = os.path.join(folder_paths.get_input_directory(), filename)
+    return "input", filename, file_path, get_thumbnail_path("input", filename, size)
+
+def thumbnail_version(dir_type, rel_path):
+    """Content address for a source file's thumbnail, taken from the file index without any disk I/O"""
+    info = FILE_INDEX.stat(get_base_dir(dir_type), rel_path)
+    if info is None:
+        return None
+    mtime_ns, size = info
+    return hashlib.sha1(f"{dir_type}/{rel_path}:{mtime_ns}:{size}".encode("utf-8")).hexdigest()[:16]
+
+def refresh_source_stat(dir_type, rel_path, file_path):
+    """Stat a source once and feed in-place overwrites, which keep their directory mtime, back into the index"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    FILE_INDEX.update_file(get_base_dir(dir_type), rel_path, st.st_mtime_ns, st.st_size)
+    return st
+
+def migrate_flat_thumbnails(queue_thumbnails=True):
+    """One-time move of thumbnails from the old flat directory into the sharded layout"""
+    if not THUMBNAIL_STORE.needs_migration():
+        return
+    candidates, added = [], {}
+    for dir_type in ("input", "output"):
+        base_dir = get_base_dir(dir_type)
+        added[dir_type], _ = refresh_index(dir_type)
+        for rel_path in FILE_INDEX.listing(base_dir):
+            candidates.append((dir_type, rel_path, legacy_thumbnail_path(dir_type, rel_path)))
+
+    def on_move(old_path, new_path):
+        if new_path is None:
+            THUMBNAIL_MANIFEST.forget(old_path)
+        else:
+            THUMBNAIL_MANIFEST.rename(old_path, new_path)
+
+    moved, dropped = THUMBNAIL_STORE.migrate_flat(candidates, keep=("placeholder.webp",), on_move=on_move)
+    # The refresh above took these out of the next listing's delta, so queue them here
+    if queue_thumbnails:
+        for dir_type, rel_paths in added.items():
+            queue_missing_thumbnails(dir_type, rel_paths)
+    if moved or dropped:
+        logger.info(f"Migrated {moved} thumbnails to sharded storage, dropped {dropped} stale or ambiguous ones")
@@ -1,4 +1,5 @@
 import { app } from "../../scripts/app.js";
+import { api } from "../../scripts/api.js";
 let thumbnailCache = new Map();
 // Adds a gallery to the Load Image node and tabs for Load Checkpoint/Lora/etc Nodes
 
@@ -71,40 +72,305 @@ const ext = {
 			.tab.active {
 					  border-bottom: 3px solid #64b5f6;
 					}
+			.virtual-gallery-toolbar {
+				display: flex;
+				gap: 4px;
+				padding: 4px 0;
+			}
+			.virtual-gallery-toolbar input {
+				flex: 1;
+			}
+			.virtual-gallery-scroller {
+				position: relative;
+				overflow-y: auto;
+			}
+			.virtual-gallery-scroller .image-entry {
+				position: absolute;
+				cursor: pointer;
+			}
+			.virtual-gallery-toolbar button.active {
+				border-color: #64b5f6;
+			}
+			.virtual-gallery-scroller .duplicate-badge {
+				position: absolute;
+				left: 2px;
+				bottom: 2px;
+				padding: 0 3px;
+				font-size: 10px;
+				color: white;
+				background: rgba(0, 0, 0, 0.6);
+				border-radius: 3px;
+			}
+			.virtual-gallery-scroller .image-entry.selected {
+				outline: 2px solid #64b5f6;
+			}
+			.gallery-hover-preview {
+				position: fixed;
+				z-index: 10000;
+				pointer-events: none;
+				background-size: cover;
+				border-radius: 4px;
+				box-shadow: 0 2px 12px rgba(0, 0, 0, 0.6);
+				display: none;
+			}
 		`;
         document.head.append(style);
         // Use a more persistent way to track if cleanup has been done
         let cleanupDone = sessionStorage.getItem('galleryCleanupDone') === 'true';
         
-        async function preloadThumbnailsBatch(filenames) {
+        // Thumbnail size tiers configured on the server; the base tier is the 80 px grid tile
+        let thumbnailSizes = { sizes: [80], base: 80, preview: 0 };
+        fetch('/gallery/thumbnail_sizes')
+			.then((response) => response.ok ? response.json() : null)
+			.then((sizes) => { if (sizes) thumbnailSizes = sizes; })
+			.catch(() => {});
+
+        // Smallest tier that covers a grid tile at this screen's pixel density
+        function gridThumbnailSize() {
+			const target = thumbnailSizes.base * (window.devicePixelRatio || 1);
+			return thumbnailSizes.sizes.find((size) => size >= target) ?? thumbnailSizes.sizes[thumbnailSizes.sizes.length - 1];
+		}
+
+        function withThumbnailSize(url, size) {
+			if (size === thumbnailSizes.base) return url;
+			return `${url}${url.includes('?') ? '&' : '?'}size=${size}`;
+		}
+
+        // CSS srcset for tiles: the browser fetches only the tier matching its pixel density
+        function paintThumbnailSet(element, url) {
+			element.style.backgroundImage = `url('${withThumbnailSize(url, gridThumbnailSize())}')`;
+			const candidates = thumbnailSizes.sizes
+				.map((size) => `url('${withThumbnailSize(url, size)}') ${size / thumbnailSizes.base}x`)
+				.join(', ');
+			// Ignored by browsers without image-set(), which keep the url() above
+			element.style.backgroundImage = `image-set(${candidates})`;
+		}
+
+        // Larger preview while hovering a tile
+        const hoverPreview = document.createElement('div');
+        hoverPreview.className = 'gallery-hover-preview';
+        document.body.appendChild(hoverPreview);
+        let hoverTimer = null;
+        // Menus close on click and move on wheel without a mouseleave, so hide on both
+        document.addEventListener('mousedown', () => hideHoverPreview(), true);
+        document.addEventListener('wheel', () => hideHoverPreview(), { capture: true, passive: true });
+
+        function attachHoverPreview(tile, previewUrl) {
+			tile.addEventListener('mouseenter', (e) => {
+				if (!thumbnailSizes.preview) return;
+				clearTimeout(hoverTimer);
+				hoverTimer = setTimeout(() => {
+					const size = thumbnailSizes.preview;
+					const rect = tile.getBoundingClientRect();
+					const left = rect.right + 8 + size > window.innerWidth ? rect.left - size - 8 : rect.right + 8;
+					hoverPreview.style.width = hoverPreview.style.height = `${size}px`;
+					hoverPreview.style.left = `${Math.max(0, left)}px`;
+					hoverPreview.style.top = `${Math.max(0, Math.min(rect.top, window.innerHeight - size))}px`;
+					hoverPreview.style.backgroundImage = `url('${withThumbnailSize(previewUrl(), size)}')`;
+					hoverPreview.style.display = 'block';
+				}, 400);
+			});
+			tile.addEventListener('mouseleave', hideHoverPreview);
+		}
+
+        function hideHoverPreview() {
+			clearTimeout(hoverTimer);
+			hoverPreview.style.display = 'none';
+		}
+
+        // Read length-prefixed frames (u32 name length, name, u32 data length, WebP bytes)
+        // from the thumbnails stream and hand each thumbnail over as soon as it arrives
+        async function readThumbnailFrames(response, onFrame) {
+			const reader = response.body.getReader();
+			const decoder = new TextDecoder();
+			let buffer = new Uint8Array(0);
+			let count = 0;
+			while (true) {
+				const { done, value } = await reader.read();
+				if (done) break;
+				const merged = new Uint8Array(buffer.length + value.length);
+				merged.set(buffer);
+				merged.set(value, buffer.length);
+				buffer = merged;
+
+				let offset = 0;
+				while (buffer.length - offset >= 4) {
+					const view = new DataView(buffer.buffer, buffer.byteOffset + offset);
+					const nameLength = view.getUint32(0);
+					if (buffer.length - offset < 8 + nameLength) break;
+					const frameLength = 8 + nameLength + view.getUint32(4 + nameLength);
+					if (buffer.length - offset < frameLength) break;
+					const filename = decoder.decode(buffer.subarray(offset + 4, offset + 4 + nameLength));
+					const data = buffer.slice(offset + 8 + nameLength, offset + frameLength);
+					onFrame(filename, data);
+					offset += frameLength;
+					count++;
+				}
+				buffer = buffer.slice(offset);
+			}
+			return count;
+		}
+
+        async function preloadThumbnailsBatch(filenames, onThumbnail) {
 			if (!window.thumbnailCache) {
 				window.thumbnailCache = new Map();
 			}
+			if (filenames.length === 0) {
+				return;
+			}
 			
 			try {
-				const response = await fetch('/get_thumbnails_batch', {
+				let response;
+				for (let attempt = 0; attempt < 3; attempt++) {
+					response = await fetch('/get_thumbnails_stream', {
+						method: 'POST',
+						headers: {
+							'Content-Type': 'application/json',
+						},
+						body: JSON.stringify({ filenames, size: gridThumbnailSize() }),
+					});
+					// Server is busy with other gallery work, back off and retry
+					if (response.status !== 503) break;
+					const retryAfter = parseInt(response.headers.get('Retry-After') || '1', 10);
+					await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+				}
+
+				if (response.ok && response.body) {
+					const count = await readThumbnailFrames(response, (filename, data) => {
+						const blob = new Blob([data], { type: 'image/webp' });
+						const url = URL.createObjectURL(blob);
+						window.thumbnailCache.set(filename, url);
+						if (onThumbnail) {
+							onThumbnail(filename, url, blob);
+						}
+					});
+					console.log(`Preloaded ${count} thumbnails`);
+				}
+			} catch (error) {
+				console.error("Error preloading thumbnails batch:", error);
+			}
+		}
+
+
+        // Content-addressed thumbnail URLs (source path + mtime + size), safe to cache forever
+        function versionedThumbnailUrl(filename, version, size = thumbnailSizes.base) {
+			return withThumbnailSize(`/gallery/thumbnail/${version}/${encodeURIComponent(filename)}`, size);
+		}
+
+        async function fetchThumbnailVersions(filenames) {
+			try {
+				const response = await fetch('/get_thumbnail_versions', {
 					method: 'POST',
 					headers: {
 						'Content-Type': 'application/json',
 					},
 					body: JSON.stringify({ filenames }),
 				});
-				
-				if (response.ok) {
-					const data = await response.json();
-					for (const [filename, dataUrl] of Object.entries(data)) {
-						window.thumbnailCache.set(filename, dataUrl);
-					}
-					console.log(`Preloaded ${Object.keys(data).length} thumbnails`);
-				}
+				return response.ok ? await response.json() : {};
 			} catch (error) {
-				console.error("Error preloading thumbnails batch:", error);
+				console.error("Error fetching thumbnail versions:", error);
+				return {};
+			}
+		}
+
+        // Cache Storage only exists in secure contexts (https or localhost)
+        async function openThumbnailStore() {
+			try {
+				return window.caches ? await caches.open('comfy-gallery-thumbnails') : null;
+			} catch (error) {
+				return null;
 			}
 		}
 
+        // Paint thumbnails from the browser's Cache Storage and stream only the ones it lacks.
+        // Returns the versions so callers can fall back to immutable URLs.
+        async function loadThumbnails(filenames, onThumbnail) {
+			if (!window.thumbnailCache) {
+				window.thumbnailCache = new Map();
+			}
+			if (filenames.length === 0) {
+				return {};
+			}
+			const versions = await fetchThumbnailVersions(filenames);
+			const store = await openThumbnailStore();
+			const size = gridThumbnailSize();
+			let missing = filenames;
+			if (store) {
+				missing = [];
+				await Promise.all(filenames.map(async (filename) => {
+					const version = versions[filename];
+					const cached = version ? await store.match(versionedThumbnailUrl(filename, version, size)) : null;
+					if (cached) {
+						const url = URL.createObjectURL(await cached.blob());
+						window.thumbnailCache.set(filename, url);
+						onThumbnail(filename, url);
+					} else {
+						missing.push(filename);
+					}
+				}));
+			}
+			await preloadThumbnailsBatch(missing, (filename, url, blob) => {
+				onThumbnail(filename, url);
+				const version = versions[filename];
+				if (store && version) {
+					store.put(
+						versionedThumbnailUrl(filename, version, size),
+						new Response(blob, { headers: { 'Content-Type': 'image/webp' } })
+					).catch(() => {});
+				}
+			});
+			return versions;
+		}
+
+        // Sprite sheets are only used when the server has atlas mode enabled
+        const ATLAS_MAX_FOLDERS = 8;
+        let atlasAvailable = true;
+
+        // Paint tiles from per-folder sprite sheets, one index request per folder.
+        // onTile(filename, sheetUrl, x, y, sheetWidth) is called for every file an atlas covers.
+        async function loadAtlases(filenames, onTile) {
+			if (!atlasAvailable || filenames.length === 0) {
+				return;
+			}
+			const folders = new Map();
+			for (const filename of filenames) {
+				const dirType = filename.startsWith('[output]/') ? 'output' : 'input';
+				const path = (dirType === 'output' ? filename.slice(9) : filename).replace(/\\/g, '/');
+				const cut = path.lastIndexOf('/');
+				const key = `${dirType}:${cut === -1 ? '' : path.slice(0, cut)}`;
+				if (!folders.has(key)) {
+					folders.set(key, { dirType, folder: cut === -1 ? '' : path.slice(0, cut), files: [] });
+				}
+				folders.get(key).files.push(filename);
+			}
+			// Folders with the most missing tiles gain the most from a sheet
+			const groups = [...folders.values()].sort((a, b) => b.files.length - a.files.length).slice(0, ATLAS_MAX_FOLDERS);
+			await Promise.all(groups.map(async ({ dirType, folder, files }) => {
+				try {
+					const params = new URLSearchParams({ dir: dirType, folder });
+					const response = await fetch(`/gallery/atlas?${params}`);
+					if (response.status === 404) {
+						atlasAvailable = false;
+						return;
+					}
+					if (!response.ok) {
+						return;
+					}
+					const atlas = await response.json();
+					for (const filename of files) {
+						const slot = atlas.entries[filename];
+						if (slot) {
+							onTile(filename, atlas.sheets[slot[0]], slot[1], slot[2], atlas.columns * atlas.tile);
+						}
+					}
+				} catch (error) {
+					console.error("Error loading thumbnail atlas:", error);
+				}
+			}));
+		}
 
-        // Clean up stale thumbnails
-        function CleanDB(values) {
+        // Ask the server to schedule its background cleanup of stale thumbnails
+        function CleanDB() {
             // Use sessionStorage to track if cleanup has been done
             if (sessionStorage.getItem('galleryCleanupDone') === 'true') {
                 return; // Already done, skip
@@ -115,17 +381,17 @@ const ext = {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ active_files: values }),
+                body: JSON.stringify({}),
             })
             .then(response => {
                 if (response.ok) {
-                    return response.text();
+                    return response.json();
                 } else {
                     throw new Error('Cleanup failed');
                 }
             })
-            .then(message => {
-                console.log(message);
+            .then(status => {
+                console.log("Thumbnail cleanup scheduled:", status);
                 // Mark cleanup as done
                 sessionStorage.setItem('galleryCleanupDone', 'true');
             })
@@ -196,6 +462,62 @@ const ext = {
 		}
 
 
+        // URL of the single thumbnail route for a gallery value
+        function fallbackThumbnailUrl(filename) {
+			return `/get_thumbnail/${encodeURIComponent(filename)}`;
+		}
+
+        // Live updates pushed by the server-side file watcher
+        const NODE_TYPES_BY_DIR = { input: ["LoadImage", "LoadImageMask"], output: ["LoadImageOutput"] };
+        api.addEventListener("gallery.files_changed", ({ detail }) => {
+			const { dir_type, added = [], removed = [], modified = [] } = detail;
+
+			// Removed or rewritten files must not be painted from stale cache entries
+			for (const filename of [...removed, ...modified]) {
+				const url = window.thumbnailCache?.get(filename);
+				if (url?.startsWith('blob:')) {
+					URL.revokeObjectURL(url);
+				}
+				window.thumbnailCache?.delete(filename);
+			}
+
+			// Update the combo values in place, so the next open needs no rescan
+			const removedSet = new Set(removed);
+			for (const node of app.graph?._nodes ?? []) {
+				if (!NODE_TYPES_BY_DIR[dir_type]?.includes(node.type)) continue;
+				const widget = node.widgets?.find((w) => w.type === "combo" && w.name === "image");
+				if (!Array.isArray(widget?.options?.values)) continue;
+				const values = widget.options.values.filter((v) => !removedSet.has(v));
+				const known = new Set(values);
+				values.push(...added.filter((v) => !known.has(v)));
+				widget.options.values = values;
+			}
+
+			// Patch a gallery that is currently open
+			const openEntries = document.querySelectorAll('.litemenu-entry.image-entry');
+			if (openEntries.length > 0) {
+				const modifiedSet = new Set(modified);
+				const repaint = new Map();
+				openEntries.forEach((entry) => {
+					const value = entry.getAttribute('data-value');
+					if (removedSet.has(value)) {
+						entry.remove();
+					} else if (modifiedSet.has(value)) {
+						repaint.set(value, entry);
+					}
+				});
+				loadThumbnails([...repaint.keys()], (filename, url) => {
+					const entry = repaint.get(filename);
+					if (entry) {
+						// Drop any sprite sheet offsets, this is a standalone thumbnail
+						entry.style.backgroundSize = '';
+						entry.style.backgroundPosition = '';
+						entry.style.backgroundImage = `url('${url}')`;
+					}
+				});
+			}
+		});
+
         // Check if thumbnails service is available
         async function checkThumbnailsService() {
             try {
@@ -214,7 +536,260 @@ const ext = {
         }
 
 
+        // Large galleries are rendered as a virtual grid fed by /gallery/list,
+        // so only the visible tiles exist in the DOM and only their pages are fetched
+        const VIRTUAL_GALLERY_THRESHOLD = 500;
+        const VIRTUAL_PAGE_SIZE = 120;
+        const VIRTUAL_CELL = 88;
+        const VIRTUAL_COLUMNS = 8;
+        const VIRTUAL_ROWS = 6;
+
+        function galleryDirType(node) {
+            if (node?.type === "LoadImageOutput") return "output";
+            if (node?.type === "LoadImage" || node?.type === "LoadImageMask") return "input";
+            return null;
+        }
+
+        function showVirtualGallery(ctx, options, dirType, currentValue) {
+			const root = ctx.root;
+			root.querySelectorAll('.litemenu-entry').forEach((entry) => entry.style.display = 'none');
+			const filter = root.querySelector('.comfy-context-menu-filter');
+			if (filter) filter.style.display = 'none';
+			// The menu's own wheel handler moves the whole menu; scroll the grid instead
+			options.scroll_speed = 0;
+
+			const state = { folder: "", q: "", scope: "names", collapse: false, sort: "name", order: "asc", total: 0, view: 0, pages: new Map(), loading: new Map() };
+			const panel = document.createElement('div');
+			panel.style.width = `${VIRTUAL_COLUMNS * VIRTUAL_CELL}px`;
+
+			const toolbar = document.createElement('div');
+			toolbar.className = 'virtual-gallery-toolbar';
+			const search = document.createElement('input');
+			search.placeholder = 'Search all folders';
+			const sort = document.createElement('select');
+			for (const [value, label] of [["name:asc", "Name"], ["mtime:desc", "Newest"], ["mtime:asc", "Oldest"], ["size:desc", "Largest"]]) {
+				sort.add(new Option(label, value));
+			}
+			sort.add(new Option("Best match", "rank:asc"));
+			// Prompts searches the text embedded in the images through the metadata index
+			const scope = document.createElement('select');
+			scope.add(new Option("Names", "names"));
+			scope.add(new Option("Prompts", "prompts"));
+			// Show one tile per group of near-identical re-runs
+			const collapse = document.createElement('button');
+			collapse.textContent = 'Collapse duplicates';
+			toolbar.append(search, scope, sort, collapse);
+
+			const tabs = document.createElement('div');
+			tabs.className = 'tabs';
+			const scroller = document.createElement('div');
+			scroller.className = 'virtual-gallery-scroller';
+			scroller.style.height = `${VIRTUAL_ROWS * VIRTUAL_CELL}px`;
+			const spacer = document.createElement('div');
+			scroller.appendChild(spacer);
+			panel.append(toolbar, tabs, scroller);
+			root.appendChild(panel);
+
+			function select(filename, event) {
+				options.callback?.call(ctx, filename, options, event, ctx, options.node);
+				ctx.close();
+			}
+
+			async function loadPage(pageIndex) {
+				if (state.pages.has(pageIndex)) return state.pages.get(pageIndex);
+				const { view, loading } = state;
+				if (!loading.has(pageIndex)) {
+					const prompts = state.scope === 'prompts' && state.q;
+					const params = new URLSearchParams({
+						dir: dirType,
+						// Relevance only exists for prompt searches
+						sort: state.sort === 'rank' && !prompts ? 'name' : state.sort,
+						order: state.order,
+						cursor: String(pageIndex * VIRTUAL_PAGE_SIZE),
+						limit: String(VIRTUAL_PAGE_SIZE),
+					});
+					if (state.collapse && !prompts) {
+						params.set('collapse', '1');
+					}
+					// A search covers the whole tree, browsing shows one folder
+					if (state.q) {
+						params.set('q', state.q);
+					} else {
+						params.set('folder', state.folder);
+					}
+					loading.set(pageIndex, fetch(`/gallery/${prompts ? 'search' : 'list'}?${params}`).then(async (response) => {
+						if (prompts && response.status === 404) {
+							// The metadata index is turned off on this server
+							scope.style.display = 'none';
+							state.scope = scope.value = 'names';
+						}
+						const data = response.ok ? await response.json() : { total: 0, entries: [], folders: [] };
+						// Drop answers for a view the user already left
+						if (state.view !== view) return null;
+						if (data.indexing && pageIndex === 0) {
+							// Older images are still being indexed, so more matches will show up
+							setTimeout(() => { if (state.view === view) refresh(); }, 2000);
+						}
+						state.total = data.total;
+						state.folders = data.folders;
+						state.pages.set(pageIndex, data.entries);
+						return data.entries;
+					}).catch((error) => {
+						console.error("Error loading gallery page:", error);
+						return null;
+					}));
+				}
+				return loading.get(pageIndex);
+			}
+
+			function newView() {
+				state.view++;
+				state.pages = new Map();
+				state.loading = new Map();
+			}
+
+			function renderTabs() {
+				tabs.replaceChildren();
+				const addTab = (label, folder, active) => {
+					const tab = document.createElement('button');
+					tab.textContent = label;
+					tab.className = active ? 'tab active' : 'tab';
+					tab.onclick = () => { state.folder = folder; search.value = ''; state.q = ''; reset(); };
+					tabs.appendChild(tab);
+				};
+				const parts = state.folder ? state.folder.split('/') : [];
+				addTab('Root', '', parts.length === 0);
+				parts.forEach((part, i) => addTab(part, parts.slice(0, i + 1).join('/'), i === parts.length - 1));
+				if (!state.q) {
+					for (const sub of state.folders ?? []) {
+						addTab(`${sub}/`, state.folder ? `${state.folder}/${sub}` : sub, false);
+					}
+				}
+			}
+
+			function render() {
+				spacer.style.height = `${Math.ceil(state.total / VIRTUAL_COLUMNS) * VIRTUAL_CELL}px`;
+				const firstRow = Math.floor(scroller.scrollTop / VIRTUAL_CELL);
+				const start = firstRow * VIRTUAL_COLUMNS;
+				const end = Math.min(state.total, (firstRow + VIRTUAL_ROWS + 1) * VIRTUAL_COLUMNS);
+
+				scroller.querySelectorAll('.image-entry').forEach((tile) => tile.remove());
+				const requested = new Set();
+				for (let index = start; index < end; index++) {
+					const pageIndex = Math.floor(index / VIRTUAL_PAGE_SIZE);
+					const page = state.pages.get(pageIndex);
+					if (!page) {
+						if (!requested.has(pageIndex)) {
+							requested.add(pageIndex);
+							loadPage(pageIndex).then((entries) => entries && render());
+						}
+						continue;
+					}
+					const entry = page[index % VIRTUAL_PAGE_SIZE];
+					if (!entry) continue;
+
+					const tile = document.createElement('div');
+					tile.className = entry.filename === currentValue ? 'image-entry selected' : 'image-entry';
+					tile.style.top = `${Math.floor(index / VIRTUAL_COLUMNS) * VIRTUAL_CELL}px`;
+					tile.style.left = `${(index % VIRTUAL_COLUMNS) * VIRTUAL_CELL}px`;
+					const cachedUrl = window.thumbnailCache?.get(entry.filename);
+					if (cachedUrl) {
+						tile.style.backgroundImage = `url('${cachedUrl}')`;
+					} else {
+						paintThumbnailSet(tile, entry.thumbnail);
+					}
+					tile.title = entry.duplicates ? `${entry.filename} (+${entry.duplicates} near duplicates)` : entry.filename;
+					tile.addEventListener('click', (e) => select(entry.filename, e));
+					if (entry.duplicates) {
+						const badge = document.createElement('div');
+						badge.className = 'duplicate-badge';
+						badge.textContent = `+${entry.duplicates}`;
+						tile.appendChild(badge);
+					}
+					attachHoverPreview(tile, () => entry.thumbnail);
+
+					const deleteButton = document.createElement('div');
+					deleteButton.classList.add('delete-button');
+					deleteButton.textContent = '×';
+					deleteButton.setAttribute('title', 'Delete');
+					deleteButton.addEventListener('click', async (e) => {
+						e.stopPropagation();
+						if (await deleteFile(entry.filename)) {
+							refresh();
+						}
+					});
+					tile.appendChild(deleteButton);
+					scroller.appendChild(tile);
+				}
+			}
+
+			// Reload the current view, keeping the scroll position
+			function refresh() {
+				newView();
+				const firstIndex = Math.floor(scroller.scrollTop / VIRTUAL_CELL) * VIRTUAL_COLUMNS;
+				loadPage(Math.floor(firstIndex / VIRTUAL_PAGE_SIZE)).then((entries) => {
+					if (entries) { renderTabs(); render(); }
+				});
+			}
+
+			function reset() {
+				newView();
+				state.total = 0;
+				scroller.scrollTop = 0;
+				loadPage(0).then((entries) => {
+					if (entries) { renderTabs(); render(); }
+				});
+			}
+
+			let searchTimer = null;
+			search.addEventListener('input', () => {
+				clearTimeout(searchTimer);
+				searchTimer = setTimeout(() => { state.q = search.value.trim(); reset(); }, 200);
+			});
+			scope.addEventListener('change', () => {
+				state.scope = scope.value;
+				search.placeholder = state.scope === 'prompts' ? 'Search prompts, seed:123' : 'Search all folders';
+				if (state.q) reset();
+			});
+			collapse.addEventListener('click', () => {
+				state.collapse = !state.collapse;
+				collapse.classList.toggle('active', state.collapse);
+				reset();
+			});
+			sort.addEventListener('change', () => {
+				[state.sort, state.order] = sort.value.split(':');
+				reset();
+			});
+			scroller.addEventListener('scroll', () => requestAnimationFrame(render));
+			scroller.addEventListener('wheel', (e) => { scroller.scrollTop += e.deltaY; });
+
+			// Open on the folder of the current value
+			if (typeof currentValue === 'string') {
+				const path = (dirType === 'output' ? currentValue.replace(/^\[output\]\//, '') : currentValue).replace(/\\/g, '/');
+				state.folder = path.includes('/') ? path.slice(0, path.lastIndexOf('/')) : '';
+			}
+			reset();
+
+			let top = options.event.clientY - 10;
+			const bodyRect = document.body.getBoundingClientRect();
+			const rootRect = root.getBoundingClientRect();
+			if (bodyRect.height && top > bodyRect.height - rootRect.height - 10) {
+				top = Math.max(0, bodyRect.height - rootRect.height - 10);
+			}
+			root.style.top = top + "px";
+			search.focus();
+		}
+
         LiteGraph.ContextMenu = function (values, options) {
+            const node = LGraphCanvas.active_canvas?.current_node;
+            const dirType = galleryDirType(node);
+            if (dirType && options?.className === "dark" && values?.length > VIRTUAL_GALLERY_THRESHOLD && typeof values[0] === 'string') {
+                // Let LiteGraph build a one-entry menu and draw the gallery ourselves
+                const ctx = ctxMenu.call(this, values.slice(0, 1), options);
+                const currentValue = node.widgets?.find((w) => w.type === "combo" && w.name === "image")?.value;
+                requestAnimationFrame(() => showVirtualGallery(ctx, options, dirType, currentValue));
+                return ctx;
+            }
             const ctx = ctxMenu.call(this, values, options);
             if (options?.className === "dark" && values?.length > 0) {
                 const items = Array.from(ctx.root.querySelectorAll(".litemenu-entry"));
@@ -405,7 +980,7 @@ const ext = {
                           valuesnames.some(v => ["alpha", "red", "green", "blue"].includes(v));
                         if (!isChannelList) {
 							if (!cleanupDone) {
-								CleanDB(valuesnames);
+								CleanDB();
 								sessionStorage.setItem('galleryCleanupDone', 'true');
 								cleanupDone = true;
 							}
@@ -438,31 +1013,18 @@ const ext = {
 								entry.setAttribute('title', filename);
 								}
 							});
-							// Preload all thumbnails at once
-							preloadThumbnailsBatch(valuesnames).then(() => {
-								
-								items.forEach((entry, index) => {
-									const filename = valuesnames[index];
-									if (filename !== "rgthreefolder") {
-									
-																		// Use cached thumbnail or load a new one
-									let thumbnailUrl = window.thumbnailCache.get(filename);
-									if (!thumbnailUrl) {
-										// Handle output files with prefix
-										let thumbnailFilename = filename;
-										if (filename.startsWith('[output]/')) {
-											// For output files, we use a special naming convention
-											let relPath = filename.substring(9); // Remove "[output]/" prefix
-											thumbnailFilename = "OP_" + relPath.replace(/\\/g, "__").replace(/\//g, "__").replace(/ /g, "_");
-										} else {
-											thumbnailFilename = filename.replace(/\\/g, "__").replace(/\//g, "__").replace(/ /g, "_");
-										}
-										// Get thumbnail from server instead of using placeholder
-										thumbnailUrl = `/get_thumbnail/${encodeURIComponent(thumbnailFilename)}`;
+							const entriesByName = new Map();
+							items.forEach((entry, index) => {
+								const filename = valuesnames[index];
+								if (filename !== "rgthreefolder") {
+									// Use cached thumbnail, otherwise it is painted when its frame arrives
+									const thumbnailUrl = window.thumbnailCache?.get(filename);
+									if (thumbnailUrl) {
+										entry.style.backgroundImage = `url('${thumbnailUrl}')`;
+									} else {
+										entriesByName.set(filename, entry);
 									}
-									
-									entry.style.backgroundImage = `url('${thumbnailUrl}')`;
-									
+
 									// Delete button
 									const deleteButton = document.createElement('div');
 									deleteButton.classList.add('delete-button');
@@ -476,9 +1038,33 @@ const ext = {
 										}
 									});
 									entry.appendChild(deleteButton);
+									attachHoverPreview(entry, () => fallbackThumbnailUrl(filename));
 								}
+							});
+
+							// Paint from sprite sheets or the browser cache, stream the rest as it arrives
+							loadAtlases([...entriesByName.keys()], (filename, sheetUrl, x, y, sheetWidth) => {
+								const entry = entriesByName.get(filename);
+								if (entry) {
+									entry.style.backgroundImage = `url('${sheetUrl}')`;
+									entry.style.backgroundSize = `${sheetWidth}px auto`;
+									entry.style.backgroundPosition = `-${x}px -${y}px`;
+									entriesByName.delete(filename);
+								}
+							}).then(() => loadThumbnails([...entriesByName.keys()], (filename, url) => {
+								const entry = entriesByName.get(filename);
+								if (entry) {
+									entry.style.backgroundImage = `url('${url}')`;
+									entriesByName.delete(filename);
+								}
+							})).then((versions) => {
+								// Anything the stream did not deliver is requested individually
+								entriesByName.forEach((entry, filename) => {
+									const url = versions[filename]
+										? versionedThumbnailUrl(filename, versions[filename])
+										: fallbackThumbnailUrl(filename);
+									paintThumbnailSet(entry, url);
 								});
-								
 							});
 					}
 					}
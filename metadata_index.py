@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import zlib
+import logging
+import sqlite3
+import threading
+
+from .db import connect
+
+logger = logging.getLogger(__name__)
+
+# Cap on the searchable text of one image; workflows can carry long notes
+MAX_TEXT = 64 * 1024
+SEARCH_SORTS = {"name": "m.rel_path", "mtime": "m.mtime_ns", "size": "m.size"}
+SEED_QUERY = re.compile(r"\bseed:(\d+)\b", re.IGNORECASE)
+
+
+def _parse(data):
+    try:
+        return json.loads(data) if data else None
+    except ValueError:
+        return None
+
+
+def searchable_text(rel_path, prompt, workflow):
+    """What a search finds an image by: its path, every string input of the prompt and its seeds"""
+    parts = [rel_path.replace(os.sep, " ")]
+    nodes = _parse(prompt)
+    if isinstance(nodes, dict):
+        for node in nodes.values():
+            inputs = node.get("inputs") if isinstance(node, dict) else None
+            for key, value in (inputs or {}).items():
+                if isinstance(value, str):
+                    parts.append(value)
+                elif "seed" in key and isinstance(value, int) and not isinstance(value, bool):
+                    parts.append(f"seed {value}")
+    else:
+        # Only a UI workflow, as saved by some nodes: take the text widgets
+        graph = _parse(workflow)
+        for node in (graph.get("nodes") or []) if isinstance(graph, dict) else []:
+            values = node.get("widgets_values") if isinstance(node, dict) else None
+            if isinstance(values, dict):
+                values = list(values.values())
+            parts.extend(v for v in values or [] if isinstance(v, str))
+    return "\n".join(parts)[:MAX_TEXT]
+
+
+def _pack(text):
+    return sqlite3.Binary(zlib.compress(text.encode("utf-8"))) if text else None
+
+
+def _unpack(blob):
+    return _parse(zlib.decompress(blob).decode("utf-8")) if blob else None
+
+
+class MetadataIndex:
+    """Dimensions, format and embedded prompt/workflow of every gallery image, with full-text search.
+
+    Rows are written while thumbnails are generated, so a search never opens
+    an image file. Prompt and workflow are kept zlib compressed next to the
+    extracted text. The text is matched with FTS5 where SQLite has it and
+    with LIKE otherwise.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.fts = False
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path, (
+                "CREATE TABLE IF NOT EXISTS image_metadata ("
+                "id INTEGER PRIMARY KEY, dir_type TEXT, rel_path TEXT, mtime_ns INTEGER, size INTEGER, "
+                "width INTEGER, height INTEGER, format TEXT, prompt BLOB, workflow BLOB, text TEXT, "
+                "UNIQUE (dir_type, rel_path))",
+            )) or False
+            if self._conn:
+                self.fts = self._create_fts(self._conn)
+        return self._conn or None
+
+    @staticmethod
+    def _create_fts(conn):
+        try:
+            with conn:
+                exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'image_metadata_fts'").fetchone()
+                # External content table: the text is stored once, in image_metadata
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS image_metadata_fts "
+                    "USING fts5(text, content='image_metadata', content_rowid='id')"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS image_metadata_ai AFTER INSERT ON image_metadata BEGIN "
+                    "INSERT INTO image_metadata_fts(rowid, text) VALUES (new.id, new.text); END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS image_metadata_ad AFTER DELETE ON image_metadata BEGIN "
+                    "INSERT INTO image_metadata_fts(image_metadata_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS image_metadata_au AFTER UPDATE ON image_metadata BEGIN "
+                    "INSERT INTO image_metadata_fts(image_metadata_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+                    "INSERT INTO image_metadata_fts(rowid, text) VALUES (new.id, new.text); END"
+                )
+                if not exists:
+                    # Pick up rows written while FTS5 was not available
+                    conn.execute("INSERT INTO image_metadata_fts(image_metadata_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.Error as e:
+            logger.info(f"SQLite has no FTS5, metadata search falls back to LIKE: {str(e)}")
+            return False
+
+    def _execute(self, sql, rows):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+            except sqlite3.Error as e:
+                logger.error(f"Error saving image metadata: {str(e)}")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            try:
+                return conn.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading image metadata: {str(e)}")
+                return []
+
+    def record_many(self, dir_type, entries):
+        """Store [(rel_path, mtime_ns, size, metadata)], metadata as returned by image_metadata()"""
+        rows = [
+            (dir_type, rel_path, mtime_ns, size, metadata.get("width"), metadata.get("height"), metadata.get("format"),
+             _pack(metadata.get("prompt")), _pack(metadata.get("workflow")),
+             searchable_text(rel_path, metadata.get("prompt"), metadata.get("workflow")))
+            for rel_path, mtime_ns, size, metadata in entries
+        ]
+        # An upsert, so the update trigger keeps the full-text index in step
+        self._execute(
+            "INSERT INTO image_metadata (dir_type, rel_path, mtime_ns, size, width, height, format, prompt, workflow, text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (dir_type, rel_path) DO UPDATE SET "
+            "mtime_ns = excluded.mtime_ns, size = excluded.size, width = excluded.width, height = excluded.height, "
+            "format = excluded.format, prompt = excluded.prompt, workflow = excluded.workflow, text = excluded.text",
+            rows,
+        )
+
+    def record(self, dir_type, rel_path, mtime_ns, size, metadata):
+        self.record_many(dir_type, [(rel_path, mtime_ns, size, metadata)])
+
+    def forget(self, dir_type, rel_paths):
+        self._execute("DELETE FROM image_metadata WHERE dir_type = ? AND rel_path = ?",
+                      [(dir_type, rel_path) for rel_path in rel_paths])
+
+    def versions(self, dir_type):
+        """Return {rel_path: (mtime_ns, size)} of the indexed files of one tree"""
+        return {
+            rel_path: (mtime_ns, size)
+            for rel_path, mtime_ns, size in self._query(
+                "SELECT rel_path, mtime_ns, size FROM image_metadata WHERE dir_type = ?", (dir_type,))
+        }
+
+    def get(self, dir_type, rel_path):
+        rows = self._query(
+            "SELECT mtime_ns, size, width, height, format, prompt, workflow FROM image_metadata "
+            "WHERE dir_type = ? AND rel_path = ?", (dir_type, rel_path))
+        if not rows:
+            return None
+        mtime_ns, size, width, height, fmt, prompt, workflow = rows[0]
+        return {"mtime_ns": mtime_ns, "size": size, "width": width, "height": height, "format": fmt,
+                "prompt": _unpack(prompt), "workflow": _unpack(workflow)}
+
+    def search(self, dir_type, text="", seed=None, sort="rank", descending=False, cursor=0, limit=100):
+        """Return (total, [(rel_path, mtime_ns, size, width, height, format)]) for one page of matches.
+
+        Every word of text must match, as a prefix. "seed:123" in text, or
+        seed, matches the seed of any sampler in the prompt.
+        """
+        seeds = SEED_QUERY.findall(text)
+        if seed is not None:
+            seeds.append(str(seed))
+        words = re.findall(r"\w+", SEED_QUERY.sub(" ", text))
+
+        where, params = ["m.dir_type = ?"], [dir_type]
+        join = ""
+        if self._connect() is not None and self.fts and (words or seeds):
+            join = "JOIN image_metadata_fts f ON f.rowid = m.id"
+            # Quoting every term keeps FTS5 syntax in user input from being interpreted
+            terms = [f'"{w}"*' for w in words] + [f'"seed {s}"' for s in seeds]
+            where.append("image_metadata_fts MATCH ?")
+            params.append(" ".join(terms))
+        else:
+            for term in words + [f"seed {s}" for s in seeds]:
+                where.append("m.text LIKE ? ESCAPE '\\'")
+                params.append("%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+
+        if sort in SEARCH_SORTS:
+            order = f"{SEARCH_SORTS[sort]} {'DESC' if descending else 'ASC'}"
+        elif join:
+            order = "f.rank"
+        else:
+            order = "m.mtime_ns DESC"
+        clause = " AND ".join(where)
+        total = self._query(f"SELECT COUNT(*) FROM image_metadata m {join} WHERE {clause}", params)
+        rows = self._query(
+            f"SELECT m.rel_path, m.mtime_ns, m.size, m.width, m.height, m.format FROM image_metadata m {join} "
+            f"WHERE {clause} ORDER BY {order}, m.rel_path LIMIT ? OFFSET ?",
+            params + [limit, cursor],
+        )
+        return (total[0][0] if total else 0), rows
@@ -0,0 +1,177 @@
+import time
+import bisect
+import logging
+import threading
+import functools
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, roughly from a cache hit to a cold scan of a large tree
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Process wide counters, gauges and latency histograms.
+
+    A series is a name plus keyword labels. Values that other components
+    already track, such as the cache and queue counters, are pulled in at
+    read time by collectors instead of being counted twice. snapshot()
+    returns everything as JSON, prometheus() in the text exposition format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}  # key -> [count per bucket..., count above the last bucket, sum]
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[_series_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = _series_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    def add_collector(self, collect):
+        """collect() returns [(kind, name, labels, value)], kind being "counter" or "gauge" """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def _collect(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: list(h) for key, h in self._histograms.items()}
+            collectors = list(self._collectors)
+        for collect in collectors:
+            try:
+                for kind, name, labels, value in collect():
+                    (counters if kind == "counter" else gauges)[_series_key(name, labels)] = value
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+        return counters, gauges, histograms
+
+    def snapshot(self):
+        counters, gauges, histograms = self._collect()
+        result = {"counters": {}, "gauges": {}, "histograms": {}}
+        for section, series in (("counters", counters), ("gauges", gauges)):
+            for (name, labels), value in sorted(series.items()):
+                result[section].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in sorted(histograms.items()):
+            counts, total = histogram[:-1], histogram[-1]
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            result["histograms"].setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": cumulative,
+                "sum": round(total, 6),
+                "mean": round(total / cumulative, 6) if cumulative else 0.0,
+                "buckets": buckets,
+            })
+        return result
+
+    def prometheus(self):
+        counters, gauges, histograms = self._collect()
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            last = None
+            for (name, labels), value in sorted(series.items()):
+                if name != last:
+                    lines.append(f"# TYPE {name} {kind}")
+                    last = name
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        last = None
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name != last:
+                lines.append(f"# TYPE {name} histogram")
+                last = name
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def _response_bytes(response):
+    body = getattr(response, "body", None)
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    # Streamed responses were already written by the handler
+    if getattr(response, "prepared", False):
+        return response.body_length
+    return 0
+
+
+def timed_route(handler):
+    """Record latency, status and response size of an aiohttp handler, labelled by its name"""
+    route = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(request):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            METRICS.inc("gallery_bytes_served_total", _response_bytes(response), route=route)
+            return response
+        except Exception as e:
+            status = getattr(e, "status", 500)
+            raise
+        finally:
+            METRICS.observe("gallery_route_seconds", time.perf_counter() - start, route=route)
+            METRICS.inc("gallery_route_responses_total", route=route, status=status)
+
+    return wrapper
+
+
+METRICS = Metrics()
@@ -0,0 +1,263 @@
+import io
+import logging
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+from .db import connect
+
+logger = logging.getLogger(__name__)
+
+# ComfyUI ships NumPy, but thumbnails must not depend on it; without it nothing is hashed
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# 8x8 lowest DCT frequencies of a 32x32 grayscale image: a 64 bit pHash
+HASH_SIZE = 8
+DCT_SIZE = 32
+# Rows compared against a whole bucket at once, bounding the distance matrix
+COMPARE_BLOCK = 1024
+# Chunks narrow as the threshold grows, so buckets and work grow steeply:
+# on 100k hashes about 1.3 s at 6, 5 s at 8, 12 s at 10 and a minute at 16
+MAX_THRESHOLD = 8
+# A stale clustering is redone at most this often, so hashes recorded while
+# thumbnails are generated do not keep re-clustering the whole tree
+CLUSTER_INTERVAL = 10
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(DCT_SIZE) if HAS_NUMPY else None
+
+
+def phash(img):
+    """64 bit perceptual hash of a PIL image.
+
+    Bit i is set where the i-th of the 8x8 lowest frequencies of the image's
+    DCT is above their median, so re-encodes, small edits and re-runs with
+    nearly the same output land a few bits apart. None without NumPy.
+    """
+    if not HAS_NUMPY:
+        return None
+    gray = img.convert("L").resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    # Rounded, so flat images, whose frequencies are all float noise, share one hash
+    low = np.round(_DCT @ pixels @ _DCT.T, 6)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term is the mean brightness and would skew the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def phash_bytes(data):
+    """phash() of an encoded image, such as a stored thumbnail"""
+    with Image.open(io.BytesIO(data)) as img:
+        return phash(img)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+if not HAS_NUMPY:
+    _popcount = None
+elif hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # NumPy before 2.0: count bits in parallel within each 64 bit word
+    _M1, _M2, _M4 = np.uint64(0x5555555555555555), np.uint64(0x3333333333333333), np.uint64(0x0F0F0F0F0F0F0F0F)
+    _H01 = np.uint64(0x0101010101010101)
+
+    def _popcount(values):
+        values = values - ((values >> np.uint64(1)) & _M1)
+        values = (values & _M2) + ((values >> np.uint64(2)) & _M2)
+        values = (values + (values >> np.uint64(4))) & _M4
+        return (values * _H01) >> np.uint64(56)
+
+
+def duplicate_clusters(hashes, threshold):
+    """Group the indices of hashes that are within threshold bits of each other.
+
+    Uses multi-index hashing: the 64 bits are cut into threshold + 1 chunks,
+    and two hashes within the threshold agree exactly on at least one of
+    them. Only hashes sharing a chunk value are compared, so the work grows
+    with the number of near pairs instead of quadratically. Clusters are
+    linked transitively. Returns lists of indices, only those with 2 or more.
+    """
+    if len(hashes) < 2:
+        return []
+    unique, inverse = np.unique(np.array(hashes, dtype=np.uint64), return_inverse=True)
+    parent = list(range(len(unique)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    chunks = min(threshold + 1, HASH_SIZE * HASH_SIZE)
+    bounds = np.linspace(0, HASH_SIZE * HASH_SIZE, chunks + 1).astype(int)
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        keys = (unique >> np.uint64(low)) & np.uint64((1 << int(high - low)) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            if end - start < 2:
+                continue
+            members = order[start:end]
+            group = unique[members]
+            for offset in range(0, len(members), COMPARE_BLOCK):
+                block = group[offset:offset + COMPARE_BLOCK]
+                # Each pair once: the block against itself and everything after it
+                near = _popcount(block[:, None] ^ group[None, offset:]) <= threshold
+                rows, cols = np.nonzero(np.triu(near, 1))
+                for a, b in zip(members[rows + offset], members[cols + offset]):
+                    root_a, root_b = find(int(a)), find(int(b))
+                    if root_a != root_b:
+                        parent[root_a] = root_b
+
+    clusters = {}
+    for index, unique_index in enumerate(inverse.ravel()):
+        clusters.setdefault(find(int(unique_index)), []).append(index)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class HashIndex:
+    """Perceptual hash of every gallery image, with near-duplicate clustering.
+
+    Hashes are kept in memory, backed by the image_hashes table, and stored
+    with the source mtime/size they were computed from. Clusters are computed
+    on a background thread and cached per tree and threshold until a hash of
+    that tree changes.
+    """
+
+    def __init__(self, db_path, on_clustered=None):
+        self.db_path = db_path
+        # Called with (dir_type, seconds) after each clustering run
+        self.on_clustered = on_clustered
+        self.cluster_interval = CLUSTER_INTERVAL
+        self._lock = threading.Lock()
+        self._conn = None
+        self._entries = None  # dir_type -> {rel_path: (mtime_ns, size, hash)}
+        self._changes = {}
+        self._clusters = {}  # (dir_type, threshold) -> (changes, finished, clusters)
+        self._computing = set()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            self._conn = connect(self.db_path, (
+                "CREATE TABLE IF NOT EXISTS image_hashes ("
+                "dir_type TEXT, rel_path TEXT, mtime_ns INTEGER, size INTEGER, phash INTEGER, "
+                "PRIMARY KEY (dir_type, rel_path))",
+            ))
+            if self._conn is not None:
+                try:
+                    for dir_type, rel_path, mtime_ns, size, value in self._conn.execute(
+                            "SELECT dir_type, rel_path, mtime_ns, size, phash FROM image_hashes"):
+                        self._entries.setdefault(dir_type, {})[rel_path] = (mtime_ns, size, value & ((1 << 64) - 1))
+                except sqlite3.Error as e:
+                    logger.error(f"Error loading image hashes: {str(e)}")
+        return self._entries
+
+    def _write(self, sql, rows):
+        if self._conn is None:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(sql, rows)
+        except sqlite3.Error as e:
+            logger.error(f"Error saving image hashes: {str(e)}")
+
+    def record_many(self, dir_type, entries):
+        """Store [(rel_path, mtime_ns, size, hash)]"""
+        if not entries:
+            return
+        with self._lock:
+            hashes = self._load().setdefault(dir_type, {})
+            changed = False
+            for rel_path, mtime_ns, size, value in entries:
+                previous = hashes.get(rel_path)
+                changed = changed or previous is None or previous[2] != value
+                hashes[rel_path] = (mtime_ns, size, value)
+            # A re-hash to the same value, e.g. after a touch, leaves the clusters valid
+            if changed:
+                self._changes[dir_type] = self._changes.get(dir_type, 0) + 1
+            self._write("INSERT OR REPLACE INTO image_hashes VALUES (?, ?, ?, ?, ?)",
+                        [(dir_type, p, m, s, _to_signed(v)) for p, m, s, v in entries])
+
+    def record(self, dir_type, rel_path, mtime_ns, size, value):
+        self.record_many(dir_type, [(rel_path, mtime_ns, size, value)])
+
+    def forget(self, dir_type, rel_paths):
+        with self._lock:
+            hashes = self._load().get(dir_type, {})
+            gone = [rel_path for rel_path in rel_paths if hashes.pop(rel_path, None) is not None]
+            if gone:
+                self._changes[dir_type] = self._changes.get(dir_type, 0) + 1
+                self._write("DELETE FROM image_hashes WHERE dir_type = ? AND rel_path = ?",
+                            [(dir_type, rel_path) for rel_path in gone])
+
+    def versions(self, dir_type):
+        """Return {rel_path: (mtime_ns, size)} of the hashed files of one tree"""
+        with self._lock:
+            return {p: entry[:2] for p, entry in self._load().get(dir_type, {}).items()}
+
+    def get(self, dir_type, rel_path):
+        with self._lock:
+            entry = self._load().get(dir_type, {}).get(rel_path)
+            return entry[2] if entry is not None else None
+
+    def clusters(self, dir_type, threshold):
+        """Near-duplicate groups of one tree as lists of relative paths.
+
+        Never clusters on the calling thread. A stale result starts a new run
+        in the background, once it is cluster_interval seconds old, and is
+        returned until that finishes; None means the tree has not been
+        clustered at this threshold yet.
+        """
+        key = (dir_type, threshold)
+        with self._lock:
+            cached = self._clusters.get(key)
+            stale = cached is None or (
+                cached[0] != self._changes.get(dir_type, 0) and time.monotonic() - cached[1] >= self.cluster_interval)
+            if stale and key not in self._computing:
+                self._computing.add(key)
+                threading.Thread(target=self._compute, args=key, name="gallery-duplicates", daemon=True).start()
+            return cached[2] if cached is not None else None
+
+    def _compute(self, dir_type, threshold):
+        try:
+            with self._lock:
+                changes = self._changes.get(dir_type, 0)
+                items = list(self._load().get(dir_type, {}).items())
+            start = time.perf_counter()
+            clusters = [[items[i][0] for i in cluster]
+                        for cluster in duplicate_clusters([entry[2] for _, entry in items], threshold)]
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._clusters[(dir_type, threshold)] = (changes, time.monotonic(), clusters)
+            if self.on_clustered is not None:
+                self.on_clustered(dir_type, seconds)
+        except Exception as e:
+            logger.error(f"Error clustering image hashes: {str(e)}")
+        finally:
+            with self._lock:
+                self._computing.discard((dir_type, threshold))
@@ -0,0 +1,175 @@
+"""Pre-generate every missing or stale gallery thumbnail without starting ComfyUI.
+
+Lists the input/output trees with the gallery's own index, skips thumbnails
+the manifest says are current and decodes the rest on all CPU cores. Each
+thumbnail is recorded as soon as it is written, so an interrupted run just
+picks up where it stopped when started again.
+
+    python custom_nodes/ComfyUI-Load-Image-Gallery/prewarm.py
+    python prewarm.py --comfyui /path/to/ComfyUI --dirs output --workers 8 --json
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE = "load_image_gallery"
+PROGRESS_INTERVAL = 2.0
+
+
+def register_package():
+    # Load the node's modules as a package without running __init__.py, which needs the server
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE] = package
+
+
+# Worker processes only need the encoder, which has no ComfyUI dependencies
+register_package()
+encode_thumbnails = importlib.import_module(f"{PACKAGE}.thumbnailer").encode_thumbnails
+
+
+def load_core(args):
+    sys.path.insert(0, os.path.abspath(args.comfyui))
+    try:
+        import folder_paths
+    except ImportError:
+        print(f"ComfyUI not found in {args.comfyui}, pass its location with --comfyui")
+        sys.exit(2)
+    if args.input_dir:
+        folder_paths.set_input_directory(os.path.abspath(args.input_dir))
+    if args.output_dir:
+        folder_paths.set_output_directory(os.path.abspath(args.output_dir))
+    return importlib.import_module(f"{PACKAGE}.gallery_core")
+
+
+def plan(core, dir_types):
+    """Return ([(dir_type, rel_path, file_path)] needing thumbnails, number already fresh)"""
+    todo, fresh = [], 0
+    for dir_type in dir_types:
+        for value in core.get_enhanced_files(dir_type, queue_thumbnails=False):
+            _, rel_path, file_path, _ = core.resolve_gallery_file(value)
+            if all(core.thumbnail_is_fresh(file_path, path) for path in core.all_thumbnail_paths(dir_type, rel_path)):
+                fresh += 1
+            else:
+                todo.append((dir_type, rel_path, file_path))
+    return todo, fresh
+
+
+def generate(core, todo, workers, progress):
+    """Encode in worker processes and store from this one, so only one process writes the databases"""
+    generated, failures = 0, []
+    interrupted = False
+    pending = {}
+    items = iter(todo)
+    start = last_report = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # Keep every worker busy without pickling the whole backlog up front
+            while len(pending) < workers * 4:
+                item = next(items, None)
+                if item is None:
+                    break
+                try:
+                    source_stat = os.stat(item[2])
+                except OSError as e:
+                    failures.append({"file": item[2], "error": str(e)})
+                    continue
+                pending[pool.submit(encode_thumbnails, item[2], core.THUMBNAIL_SIZES)] = (item, source_stat)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (dir_type, rel_path, file_path), source_stat = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures.append({"file": file_path, "error": str(e)})
+                    continue
+                if result is None:
+                    failures.append({"file": file_path, "error": "not a readable image"})
+                elif core.store_thumbnails(dir_type, rel_path, source_stat, *result):
+                    generated += 1
+                else:
+                    failures.append({"file": file_path, "error": "could not be saved"})
+
+            now = time.perf_counter()
+            if progress and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                finished = generated + len(failures)
+                print(f"{finished}/{len(todo)} files, {generated / (now - start):.1f} thumbnails/s, {len(failures)} failed")
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+    return generated, failures, interrupted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comfyui", default=os.path.dirname(os.path.dirname(PACKAGE_DIR)),
+                        help="ComfyUI directory (default: two levels above this node)")
+    parser.add_argument("--input-dir", help="override ComfyUI's input directory")
+    parser.add_argument("--output-dir", help="override ComfyUI's output directory")
+    parser.add_argument("--dirs", nargs="+", choices=["input", "output"], default=["input", "output"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", action="store_true", help="print a machine readable report")
+    args = parser.parse_args()
+
+    core = load_core(args)
+    start = time.perf_counter()
+    core.migrate_flat_thumbnails(queue_thumbnails=False)
+    todo, fresh = plan(core, args.dirs)
+    if not args.json:
+        print(f"{fresh} files up to date, {len(todo)} to generate with {args.workers} workers")
+
+    generated, failures, interrupted = generate(core, todo, max(1, args.workers), not args.json)
+    # Files whose thumbnails were already fresh may predate the metadata and hash indexes
+    indexed = 0 if interrupted else core.sync_metadata_index(args.dirs, queue_thumbnails=False)
+    hashed = 0 if interrupted else core.sync_hash_index(args.dirs, queue_thumbnails=False)
+    elapsed = time.perf_counter() - start
+    report = {
+        "dirs": args.dirs,
+        "files": fresh + len(todo),
+        "fresh": fresh,
+        "generated": generated,
+        "failed": len(failures),
+        "metadata_indexed": indexed,
+        "hashed": hashed,
+        "interrupted": interrupted,
+        "elapsed": round(elapsed, 3),
+        "per_second": round(generated / elapsed, 2) if elapsed else 0.0,
+        "failures": failures,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for failure in failures[:20]:
+            print(f"Failed: {failure['file']}: {failure['error']}")
+        if len(failures) > 20:
+            print(f"... and {len(failures) - 20} more")
+        print(f"Generated {generated} thumbnails in {elapsed:.1f}s ({report['per_second']}/s), "
+              f"{len(failures)} failed, {fresh} already up to date")
+        if indexed:
+            print(f"Indexed the metadata of {indexed} more files")
+        if hashed:
+            print(f"Hashed {hashed} more files for duplicate detection")
+        if interrupted:
+            print("Interrupted; run again to resume")
+
+    if interrupted:
+        return 130
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
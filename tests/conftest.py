@@ -0,0 +1,24 @@
+import os
+import sys
+import types
+import importlib
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "load_image_gallery"
+
+# Register the package without running __init__.py, which needs ComfyUI's server
+if PACKAGE not in sys.modules:
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [PACKAGE_DIR]
+    sys.modules[PACKAGE] = package
+
+
+def load(module):
+    return importlib.import_module(f"{PACKAGE}.{module}")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "gallery_index.db")
@@ -0,0 +1,63 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from conftest import load
+
+np = pytest.importorskip("numpy")
+AtlasStore = load("atlas").AtlasStore
+
+
+def thumbnail(seed):
+    img = Image.new("RGB", (80, 80), (seed * 37 % 256, seed * 91 % 256, seed * 53 % 256))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, 80, 10):
+        draw.line((0, i, 80, 80 - i), fill=(255 - seed * 20 % 256, i * 3, 40), width=3)
+    buffer = io.BytesIO()
+    img.save(buffer, "WEBP", quality=90)
+    return buffer.getvalue()
+
+
+def tile_pixels(store, index, filename):
+    sheet, x, y = index["entries"][filename]
+    with Image.open(store.sheet_path(index["folder_id"], sheet)) as img:
+        return np.asarray(img.convert("RGB"), dtype=float)[y:y + 80, x:x + 80]
+
+
+def test_unchanged_tiles_do_not_degrade_across_rebuilds(tmp_path):
+    store = AtlasStore(str(tmp_path), columns=4, rows=4)
+    tiles = {f"{i}.png": thumbnail(i) for i in range(6)}
+    entries = {name: 1 for name in tiles}
+    first = tile_pixels(store, store.build("input:", entries, tiles.get), "0.png")
+
+    for version in range(2, 16):
+        tiles["5.png"] = thumbnail(version + 10)
+        entries["5.png"] = version
+        index = store.build("input:", entries, tiles.get)
+    assert np.abs(tile_pixels(store, index, "0.png") - first).mean() < 1
+
+
+def test_slots_are_kept_and_reused(tmp_path):
+    store = AtlasStore(str(tmp_path), columns=2, rows=2)
+    tiles = {name: thumbnail(i) for i, name in enumerate("abcde")}
+    index = store.build("output:", {name: 1 for name in "abcde"}, tiles.get)
+    assert len(index["sheets"]) == 2
+    positions = index["entries"]
+
+    index = store.build("output:", {name: 1 for name in "acde"}, tiles.get)
+    assert "b" not in index["entries"]
+    assert all(index["entries"][name] == positions[name] for name in "acde")
+
+    index = store.build("output:", {name: 1 for name in "acdef"}, {**tiles, "f": thumbnail(9)}.get)
+    assert index["entries"]["f"] == positions["b"]
+
+
+def test_unreadable_tiles_are_left_out(tmp_path):
+    store = AtlasStore(str(tmp_path), columns=2, rows=2)
+    tiles = {"a": thumbnail(1), "b": b"not an image"}
+    index = store.build("input:", {"a": 1, "b": 1}, tiles.get)
+    assert set(index["entries"]) == {"a"}
+    # Retried once the thumbnail is readable and the file's version changes
+    tiles["b"] = thumbnail(2)
+    assert set(store.build("input:", {"a": 1, "b": 2}, tiles.get)["entries"]) == {"a", "b"}
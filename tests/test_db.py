@@ -0,0 +1,32 @@
+from conftest import load
+
+db = load("db")
+PackedThumbnailStore = load("thumbnail_store").PackedThumbnailStore
+
+
+def journal_mode(conn):
+    return conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+
+
+def test_wal_by_default(db_path):
+    assert journal_mode(db.connect(db_path, ())) == "wal"
+
+
+def test_rollback_journal_on_request(db_path):
+    assert journal_mode(db.connect(db_path, (), journal_mode="DELETE")) == "delete"
+
+
+def test_refused_journal_mode_still_connects():
+    # In-memory databases cannot use WAL
+    conn = db.connect(":memory:", ("CREATE TABLE t (x)",))
+    assert conn is not None
+    assert journal_mode(conn) == "memory"
+
+
+def test_packed_store_converts_an_existing_wal_pack(tmp_path):
+    path = str(tmp_path / "thumbnail_pack.db")
+    db.connect(path, ()).close()
+    store = PackedThumbnailStore(path)
+    store.write("key", b"data")
+    assert journal_mode(store._conn) == "delete"
+    assert store.read("key") == b"data"
@@ -0,0 +1,182 @@
+import os
+import time
+
+import pytest
+
+from conftest import load
+
+FileIndex = load("file_index").FileIndex
+
+
+def is_image(name):
+    return name.endswith(".png")
+
+
+def write(path, data=b"x", mtime_ns=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def settle(root):
+    # Directories modified within the last 2 s are re-listed on every refresh
+    past = time.time_ns() - 3600 * 10**9
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, ns=(past, past))
+
+
+def bump(path, seconds=10):
+    # Directory mtimes have coarse resolution on some filesystems; move them explicitly
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 10**9))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "output"
+    write(str(root / "a.png"), b"a" * 3, 1_000_000_000)
+    write(str(root / "b.png"), b"b" * 1, 3_000_000_000)
+    write(str(root / "notes.txt"))
+    write(str(root / "sub" / "c.png"), b"c" * 2, 2_000_000_000)
+    write(str(root / "sub" / "deep" / "d.png"))
+    write(str(root / "skip" / "e.png"))
+    settle(str(root))
+    return str(root)
+
+
+def refresh(index, root):
+    added, removed = index.refresh(root, exclude_folders=("skip",), accept=is_image)
+    return sorted(added), sorted(removed)
+
+
+def test_first_refresh_lists_accepted_files(db_path, tree):
+    index = FileIndex(db_path)
+    added, removed = refresh(index, tree)
+    assert added == ["a.png", "b.png", os.path.join("sub", "c.png"), os.path.join("sub", "deep", "d.png")]
+    assert removed == []
+
+
+def test_unchanged_tree_reports_nothing(db_path, tree):
+    index = FileIndex(db_path)
+    refresh(index, tree)
+    generation = index.generation(tree)
+    assert refresh(index, tree) == ([], [])
+    assert index.generation(tree) == generation
+
+
+def test_only_directories_with_a_new_mtime_are_rescanned(db_path, tree):
+    index = FileIndex(db_path)
+    refresh(index, tree)
+    sub = os.path.join(tree, "sub")
+    write(os.path.join(sub, "new.png"))
+    os.remove(os.path.join(sub, "c.png"))
+    # A change in a directory whose mtime is restored stays invisible
+    st = os.stat(tree)
+    write(os.path.join(tree, "hidden.png"))
+    os.utime(tree, ns=(st.st_atime_ns, st.st_mtime_ns))
+    bump(sub)
+
+    generation = index.generation(tree)
+    assert refresh(index, tree) == ([os.path.join("sub", "new.png")], [os.path.join("sub", "c.png")])
+    assert index.generation(tree) > generation
+
+
+def test_state_survives_a_restart(db_path, tree):
+    refresh(FileIndex(db_path), tree)
+    index = FileIndex(db_path)
+    assert refresh(index, tree) == ([], [])
+    entries, _ = index.query(tree)
+    assert len(entries) == 4
+
+
+def test_dropped_subtree_removes_its_files(db_path, tree):
+    index = FileIndex(db_path)
+    refresh(index, tree)
+    sub = os.path.join(tree, "sub")
+    for rel in ("deep/d.png", "c.png"):
+        os.remove(os.path.join(sub, rel))
+    os.rmdir(os.path.join(sub, "deep"))
+    os.rmdir(sub)
+    settle(tree)
+
+    assert refresh(index, tree) == ([], [os.path.join("sub", "c.png"), os.path.join("sub", "deep", "d.png")])
+    # Also gone from the persisted state
+    restarted = FileIndex(db_path)
+    refresh(restarted, tree)
+    assert [e[0] for e in restarted.query(tree)[0]] == ["a.png", "b.png"]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_symlink_loop_is_walked_once(db_path, tree):
+    try:
+        os.symlink(tree, os.path.join(tree, "sub", "loop"), target_is_directory=True)
+    except OSError:
+        pytest.skip("symlinks not permitted")
+    index = FileIndex(db_path)
+    added, _ = refresh(index, tree)
+    assert len(added) == 4
+    assert not any("loop" in path for path in added)
+
+
+def test_query_filters_and_sorts(db_path, tree):
+    index = FileIndex(db_path)
+    refresh(index, tree)
+
+    entries, subfolders = index.query(tree, folder="")
+    assert [e[0] for e in entries] == ["a.png", "b.png"]
+    assert subfolders == ["sub"]
+    assert [e[0] for e in index.query(tree, folder="sub")[0]] == [os.path.join("sub", "c.png")]
+    assert index.query(tree, folder="missing") == ([], [])
+
+    assert [e[0] for e in index.query(tree, search="SUB/")[0]] == [os.path.join("sub", "c.png"), os.path.join("sub", "deep", "d.png")]
+    assert [e[0] for e in index.query(tree, prefix="C")[0]] == [os.path.join("sub", "c.png")]
+
+    by_mtime = index.query(tree, folder="", sort="mtime", descending=True)[0]
+    assert [e[0] for e in by_mtime] == ["b.png", "a.png"]
+    by_size = index.query(tree, folder="", sort="size")[0]
+    assert [(e[0], e[2]) for e in by_size] == [("b.png", 1), ("a.png", 3)]
+
+
+def test_query_cache_follows_changes(db_path, tree):
+    index = FileIndex(db_path)
+    refresh(index, tree)
+    assert len(index.query(tree, folder="")[0]) == 2
+    write(os.path.join(tree, "z.png"))
+    bump(tree)
+    refresh(index, tree)
+    assert [e[0] for e in index.query(tree, folder="")[0]] == ["a.png", "b.png", "z.png"]
+
+
+def test_directory_changed_within_one_mtime_tick_is_listed_again(db_path, tree):
+    index = FileIndex(db_path)
+    refresh(index, tree)
+    sub = os.path.join(tree, "sub")
+    # Coarse timestamps: both files are created in the tick of the first listing
+    tick = time.time_ns()
+    write(os.path.join(sub, "first.png"))
+    os.utime(sub, ns=(tick, tick))
+    assert refresh(index, tree) == ([os.path.join("sub", "first.png")], [])
+    write(os.path.join(sub, "second.png"))
+    os.utime(sub, ns=(tick, tick))
+    assert refresh(index, tree) == ([os.path.join("sub", "second.png")], [])
+
+    # Still pending after a restart
+    write(os.path.join(sub, "third.png"))
+    os.utime(sub, ns=(tick, tick))
+    restarted = FileIndex(db_path)
+    assert refresh(restarted, tree) == ([os.path.join("sub", "third.png")], [])
+
+    # Re-listing a directory that did not change does not invalidate listings
+    generation = restarted.generation(tree)
+    assert refresh(restarted, tree) == ([], [])
+    assert restarted.generation(tree) == generation
+
+    # Once settled, the directory is only listed again when its mtime moves
+    settle(sub)
+    refresh(restarted, tree)
+    st = os.stat(sub)
+    write(os.path.join(sub, "fourth.png"))
+    os.utime(sub, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert refresh(restarted, tree) == ([], [])
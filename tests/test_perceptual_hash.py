@@ -0,0 +1,152 @@
+import time
+import random
+
+import pytest
+
+from conftest import load
+
+pytest.importorskip("numpy")
+perceptual_hash = load("perceptual_hash")
+
+
+def brute_force_clusters(hashes, threshold):
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i in range(len(hashes)):
+        for j in range(i + 1, len(hashes)):
+            if perceptual_hash.hamming(hashes[i], hashes[j]) <= threshold:
+                parent[find(i)] = find(j)
+    clusters = {}
+    for i in range(len(hashes)):
+        clusters.setdefault(find(i), []).append(i)
+    return [c for c in clusters.values() if len(c) > 1]
+
+
+def normalized(clusters):
+    return sorted(sorted(c) for c in clusters)
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def planted_hashes(rng, count=400):
+    # Random hashes are ~32 bits apart; near copies and chains give real clusters
+    hashes = [rng.getrandbits(64) for _ in range(count)]
+    for _ in range(count // 2):
+        hashes.append(flip_bits(rng.choice(hashes), rng.randint(0, 12), rng))
+    hashes += [0, 0, (1 << 64) - 1, (1 << 64) - 2]
+    rng.shuffle(hashes)
+    return hashes
+
+
+@pytest.mark.parametrize("threshold", [0, 1, 3, 6, 10, 16])
+def test_matches_brute_force(threshold):
+    rng = random.Random(threshold)
+    hashes = planted_hashes(rng)
+    assert normalized(perceptual_hash.duplicate_clusters(hashes, threshold)) == \
+        normalized(brute_force_clusters(hashes, threshold))
+
+
+def test_compare_blocks_cover_every_pair(monkeypatch):
+    # Buckets larger than one block must still compare rows across blocks
+    monkeypatch.setattr(perceptual_hash, "COMPARE_BLOCK", 7)
+    rng = random.Random(1)
+    base = rng.getrandbits(64)
+    hashes = [flip_bits(base, rng.randint(0, 4), rng) for _ in range(50)] + [rng.getrandbits(64) for _ in range(50)]
+    assert normalized(perceptual_hash.duplicate_clusters(hashes, 4)) == normalized(brute_force_clusters(hashes, 4))
+
+
+def test_links_transitively():
+    a = 0
+    b = a ^ 0b111
+    c = b ^ (0b111 << 10)
+    assert perceptual_hash.hamming(a, c) == 6
+    assert normalized(perceptual_hash.duplicate_clusters([a, b, c, (1 << 64) - 1], 3)) == [[0, 1, 2]]
+
+
+def test_identical_hashes_and_small_inputs():
+    assert perceptual_hash.duplicate_clusters([], 5) == []
+    assert perceptual_hash.duplicate_clusters([42], 5) == []
+    assert normalized(perceptual_hash.duplicate_clusters([7, 7, 7], 0)) == [[0, 1, 2]]
+
+
+def test_threshold_beyond_the_hash_width():
+    hashes = [0, (1 << 64) - 1, 12345]
+    assert normalized(perceptual_hash.duplicate_clusters(hashes, 64)) == [[0, 1, 2]]
+
+
+def test_phash_is_stable_across_re_encoding():
+    from PIL import Image, ImageDraw
+    import io
+
+    img = Image.new("RGB", (256, 256), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(0, 256, 32):
+        draw.rectangle((i, i // 2, i + 24, i // 2 + 60), fill=(i, 255 - i, 128))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=70)
+    reencoded = perceptual_hash.phash_bytes(buffer.getvalue())
+    assert perceptual_hash.hamming(perceptual_hash.phash(img), reencoded) <= 4
+    assert perceptual_hash.phash(Image.new("L", (64, 64), 60)) == perceptual_hash.phash(Image.new("L", (64, 64), 200))
+
+
+def wait_for_clusters(index, dir_type, threshold):
+    for _ in range(500):
+        clusters = index.clusters(dir_type, threshold)
+        if clusters is not None:
+            return clusters
+        time.sleep(0.01)
+    raise AssertionError("clustering did not finish")
+
+
+def test_hash_index_clusters_in_the_background(db_path):
+    runs = []
+    index = perceptual_hash.HashIndex(db_path, on_clustered=lambda dir_type, seconds: runs.append(dir_type))
+    index.cluster_interval = 0
+    index.record_many("output", [("a.png", 1, 1, 0b1111), ("b.png", 1, 1, 0b0111), ("c.png", 1, 1, (1 << 64) - 1)])
+    assert index.clusters("output", 2) is None
+    assert sorted(map(sorted, wait_for_clusters(index, "output", 2))) == [["a.png", "b.png"]]
+    assert runs == ["output"]
+
+    # A change is picked up by a new run, the previous result is served meanwhile
+    index.record("output", "d.png", 1, 1, (1 << 64) - 2)
+    assert sorted(map(sorted, index.clusters("output", 2))) == [["a.png", "b.png"]]
+    while len(runs) < 2:
+        time.sleep(0.01)
+    assert sorted(map(sorted, index.clusters("output", 2))) == [["a.png", "b.png"], ["c.png", "d.png"]]
+
+
+def test_hash_index_reclusters_only_on_new_hash_values(db_path):
+    runs = []
+    index = perceptual_hash.HashIndex(db_path, on_clustered=lambda dir_type, seconds: runs.append(dir_type))
+    index.cluster_interval = 0
+    index.record_many("output", [("a.png", 1, 1, 0b1111), ("b.png", 1, 1, 0b0111)])
+    wait_for_clusters(index, "output", 2)
+
+    # Same hash under a new mtime, as after a touch or a re-save
+    index.record("output", "a.png", 2, 1, 0b1111)
+    index.clusters("output", 2)
+    time.sleep(0.1)
+    assert runs == ["output"]
+
+
+def test_hash_index_debounces_reclustering(db_path):
+    runs = []
+    index = perceptual_hash.HashIndex(db_path, on_clustered=lambda dir_type, seconds: runs.append(dir_type))
+    index.cluster_interval = 60
+    index.record_many("output", [("a.png", 1, 1, 0b1111), ("b.png", 1, 1, 0b0111)])
+    first = wait_for_clusters(index, "output", 2)
+
+    for i in range(20):
+        index.record("output", f"new{i}.png", 1, 1, 0b0011 | i << 8)
+        assert index.clusters("output", 2) is first
+    time.sleep(0.1)
+    assert runs == ["output"]
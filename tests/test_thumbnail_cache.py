@@ -0,0 +1,79 @@
+import threading
+
+from conftest import load
+
+CachedThumbnailStore = load("thumbnail_cache").CachedThumbnailStore
+ShardedThumbnailStore = load("thumbnail_store").ShardedThumbnailStore
+
+
+class PausingStore(ShardedThumbnailStore):
+    """Holds reads after they got their bytes until released"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.read_done = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, path):
+        data = super().read(path)
+        self.read_done.set()
+        self.release.wait(5)
+        return data
+
+    def read_many(self, paths):
+        return {path: data for path in paths if (data := self.read(path)) is not None}
+
+
+def start_read(cache, path, many=False):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        cache.read_many([path]) if many else {path: cache.read(path)}))
+    thread.start()
+    cache.store.read_done.wait(5)
+    return thread, result
+
+
+def test_hits_and_invalidation(tmp_path):
+    cache = CachedThumbnailStore(ShardedThumbnailStore(str(tmp_path)), 10_000)
+    path = cache.path("output", "a.png")
+    cache.write(path, b"one")
+    assert cache.read(path) == b"one"
+    assert cache.read(path) == b"one"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.write(path, b"two")
+    assert cache.read(path) == b"two"
+
+
+def test_write_during_a_read_keeps_the_old_bytes_out(tmp_path):
+    for many in (False, True):
+        store = PausingStore(str(tmp_path))
+        store.release.set()
+        cache = CachedThumbnailStore(store, 10_000)
+        path = cache.path("output", f"{many}.png")
+        cache.write(path, b"old")
+        store.release.clear()
+
+        thread, result = start_read(cache, path, many)
+        cache.write(path, b"new")
+        store.release.set()
+        thread.join(5)
+        # The racing read may return what it read, but must not cache it
+        assert result[path] == b"old"
+        assert cache.read(path) == b"new"
+        assert not cache._loading
+
+
+def test_invalidate_during_a_read(tmp_path):
+    store = PausingStore(str(tmp_path))
+    store.release.set()
+    cache = CachedThumbnailStore(store, 10_000)
+    path = cache.path("input", "a.png")
+    cache.write(path, b"old")
+    store.release.clear()
+
+    thread, _ = start_read(cache, path)
+    store.write(path, b"replaced outside the cache")
+    cache.invalidate(path)
+    store.release.set()
+    thread.join(5)
+    assert cache.read(path) == b"replaced outside the cache"
@@ -0,0 +1,60 @@
+import os
+import time
+
+from conftest import load
+
+ThumbnailCollector = load("thumbnail_gc").ThumbnailCollector
+ShardedThumbnailStore = load("thumbnail_store").ShardedThumbnailStore
+
+
+def age(path, seconds):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_orphans_are_deleted_but_thumbnails_written_during_the_run_are_kept(tmp_path):
+    store = ShardedThumbnailStore(str(tmp_path))
+    kept, orphan = store.path("output", "kept.png"), store.path("output", "gone.png")
+    for path in (kept, orphan):
+        store.write(path, b"webp")
+        age(path, 3600)
+    new = store.path("output", "new.png")
+
+    def valid_paths():
+        # A file added after the snapshot gets its thumbnail while the run goes on
+        store.write(new, b"webp")
+        return {kept}
+
+    deleted = []
+    collector = ThumbnailCollector(store, valid_paths, on_delete=deleted.append, pause=0)
+    report = collector.collect()
+    assert deleted == [orphan]
+    assert report["stale"] == 1
+    assert os.path.exists(kept) and os.path.exists(new)
+
+
+def test_dry_run_deletes_nothing(tmp_path):
+    store = ShardedThumbnailStore(str(tmp_path))
+    orphan = store.path("input", "gone.png")
+    store.write(orphan, b"webp")
+    age(orphan, 3600)
+    report = ThumbnailCollector(store, lambda: set(), pause=0).collect(dry_run=True)
+    assert report["stale"] == 1
+    assert os.path.exists(orphan)
+
+
+def test_unavailable_sources_skip_the_run(tmp_path):
+    store = ShardedThumbnailStore(str(tmp_path))
+    store.write(store.path("input", "a.png"), b"webp")
+    assert ThumbnailCollector(store, lambda: None, pause=0).collect() is None
+
+
+def test_quota_evicts_the_oldest(tmp_path):
+    store = ShardedThumbnailStore(str(tmp_path))
+    paths = [store.path("output", f"{i}.png") for i in range(4)]
+    for i, path in enumerate(paths):
+        store.write(path, b"x" * 100)
+        age(path, 4000 - i * 1000)
+    collector = ThumbnailCollector(store, lambda: set(paths), pause=0, max_bytes=250)
+    assert collector.collect()["evicted"] == 2
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
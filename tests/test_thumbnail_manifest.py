@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from conftest import load
+
+ThumbnailManifest = load("thumbnail_manifest").ThumbnailManifest
+
+KEY = "thumbnails/ab/cd/abcd.webp"
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"original")
+    os.utime(path, ns=(5 * 10**9, 5 * 10**9))
+    return str(path)
+
+
+def overwrite(path, data=b"replaced"):
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, ns=(9 * 10**9, 9 * 10**9))
+
+
+def no_thumbnail():
+    return None
+
+
+def fresh(manifest, key, st):
+    # Without a stored thumbnail to adopt, only a recorded entry makes it fresh
+    return manifest.check(key, st, no_thumbnail)
+
+
+def known(manifest, key):
+    # The store is only consulted for keys the manifest has no entry for
+    asked = []
+    manifest.check(key, os.stat(__file__), lambda: asked.append(key))
+    return not asked
+
+
+def test_recorded_thumbnail_is_fresh_until_the_source_changes(db_path, source):
+    manifest = ThumbnailManifest(db_path)
+    assert not fresh(manifest, KEY, os.stat(source))
+    manifest.record(KEY, os.stat(source))
+    assert known(manifest, KEY)
+    assert fresh(manifest, KEY, os.stat(source))
+    overwrite(source)
+    assert not fresh(manifest, KEY, os.stat(source))
+
+
+def test_same_mtime_and_size_with_a_new_inode_is_stale(db_path, source):
+    manifest = ThumbnailManifest(db_path)
+    st = os.stat(source)
+    manifest.record(KEY, st)
+    # Replaced by a file with identical validators except the inode
+    os.replace(source, source + ".old")
+    with open(source, "wb") as f:
+        f.write(b"original")
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns))
+    if os.stat(source).st_ino == st.st_ino:
+        pytest.skip("filesystem reused the inode")
+    assert not fresh(manifest, KEY, os.stat(source))
+
+
+def test_entries_persist(db_path, source):
+    ThumbnailManifest(db_path).record(KEY, os.stat(source))
+    assert fresh(ThumbnailManifest(db_path), KEY, os.stat(source))
+
+
+def test_forget_and_rename(db_path, source):
+    st = os.stat(source)
+    manifest = ThumbnailManifest(db_path)
+    manifest.record(KEY, st)
+    manifest.rename(KEY, "moved")
+    assert not known(manifest, KEY)
+    assert fresh(manifest, "moved", st)
+    manifest.forget("moved")
+    assert not known(manifest, "moved")
+
+    restarted = ThumbnailManifest(db_path)
+    assert not known(restarted, KEY)
+    assert not known(restarted, "moved")
+
+
+def test_thumbnail_newer_than_its_source_is_adopted(db_path, source):
+    manifest = ThumbnailManifest(db_path)
+    st = os.stat(source)
+    assert manifest.check(KEY, st, lambda: (st.st_mtime_ns + 1, 100))
+    assert known(manifest, KEY)
+    # Adopted thumbnails then follow the normal rules
+    overwrite(source)
+    assert not manifest.check(KEY, os.stat(source), lambda: (10**20, 100))
+
+
+def test_thumbnail_older_than_its_source_or_missing_is_not_adopted(db_path, source):
+    manifest = ThumbnailManifest(db_path)
+    st = os.stat(source)
+    assert not manifest.check(KEY, st, lambda: (st.st_mtime_ns - 1, 100))
+    assert not manifest.check(KEY, st, no_thumbnail)
+    assert not known(manifest, KEY)
+
+
+def test_known_key_never_consults_the_store(db_path, source):
+    manifest = ThumbnailManifest(db_path)
+    manifest.record(KEY, os.stat(source))
+
+    def stored_version():
+        raise AssertionError("store looked up for a known thumbnail")
+
+    assert manifest.check(KEY, os.stat(source), stored_version)
+    overwrite(source)
+    assert not manifest.check(KEY, os.stat(source), stored_version)
@@ -0,0 +1,60 @@
+import sys
+import time
+import threading
+import subprocess
+
+from conftest import load, PACKAGE_DIR
+
+thumbnail_queue = load("thumbnail_queue")
+
+
+def test_visible_jobs_jump_the_backlog():
+    gate = threading.Event()
+    order = []
+
+    def worker(name):
+        gate.wait()
+        order.append(name)
+        return True
+
+    queue = thumbnail_queue.ThumbnailQueue(worker, max_workers=1)
+    first = queue.enqueue("first", "first")
+    while not first.running():
+        time.sleep(0.01)
+    futures = [queue.enqueue(name, name) for name in ("a", "b", "c")]
+    # Re-enqueueing a waiting key only raises its priority
+    assert queue.enqueue("c", "c", priority=thumbnail_queue.PRIORITY_VISIBLE) is futures[2]
+    gate.set()
+    assert all(f.result(timeout=5) for f in futures)
+    assert order == ["first", "c", "a", "b"]
+
+
+def test_stop_cancels_waiting_jobs():
+    gate = threading.Event()
+    queue = thumbnail_queue.ThumbnailQueue(lambda: gate.wait(), max_workers=1)
+    running = queue.enqueue("running")
+    while not running.running():
+        time.sleep(0.01)
+    waiting = [queue.enqueue(f"job{i}") for i in range(5)]
+    queue.stop()
+    assert all(f.cancelled() for f in waiting)
+    assert queue.enqueue("late").cancelled()
+    gate.set()
+    assert running.result(timeout=5)
+    assert queue.status()["pending"] == 0
+
+
+def test_exit_does_not_render_the_backlog():
+    script = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {repr(PACKAGE_DIR + '/tests')})\n"
+        "from conftest import load\n"
+        "queue = load('thumbnail_queue').ThumbnailQueue(lambda: time.sleep(0.1) or True, max_workers=1)\n"
+        "for i in range(100):\n"
+        "    queue.enqueue(i)\n"
+        "time.sleep(0.2)\n"
+    )
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
+    # 100 jobs of 0.1 s would take 10 s to drain
+    assert time.perf_counter() - start < 3
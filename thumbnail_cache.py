@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+# Rough per-entry bookkeeping cost on top of the thumbnail bytes
+ENTRY_OVERHEAD = 200
+
+
+class CachedThumbnailStore:
+    """Size-bounded LRU of encoded thumbnails in front of a thumbnail store.
+
+    Hot thumbnails are served from memory together with their validators.
+    Writes and deletes through the cache drop the entry, and invalidate()
+    covers changes that happen outside of it, such as a source file being
+    replaced or removed. An invalidation during a store read keeps that
+    read's bytes out of the cache. Anything else is passed to the wrapped
+    store.
+    """
+
+    def __init__(self, store, max_bytes):
+        self.store = store
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> (data, version or None)
+        self._loading = {}  # path -> [readers, invalidation epoch], only while read from the store
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def _get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+    def _begin_load(self, path):
+        with self._lock:
+            loading = self._loading.setdefault(path, [0, 0])
+            loading[0] += 1
+            return loading[1]
+
+    def _finish_load(self, path, epoch, data, version):
+        """Cache what a store read returned, unless the path was invalidated since _begin_load()"""
+        with self._lock:
+            loading = self._loading[path]
+            loading[0] -= 1
+            if loading[0] == 0:
+                del self._loading[path]
+            if data is not None and loading[1] == epoch:
+                self._put(path, data, version)
+
+    def _put(self, path, data, version):
+        # Called with the lock held
+        size = len(data) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(path, None)
+        if old is not None:
+            self._bytes -= len(old[0]) + ENTRY_OVERHEAD
+        self._entries[path] = (data, version)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted) + ENTRY_OVERHEAD
+            self.evictions += 1
+
+    def invalidate(self, path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._bytes -= len(entry[0]) + ENTRY_OVERHEAD
+            loading = self._loading.get(path)
+            if loading is not None:
+                loading[1] += 1
+
+    def read(self, path):
+        entry = self._get(path)
+        if entry is not None:
+            return entry[0]
+        epoch = self._begin_load(path)
+        data = version = None
+        try:
+            version = self.store.version(path)
+            data = self.store.read(path)
+        finally:
+            self._finish_load(path, epoch, data, version)
+        return data
+
+    def read_many(self, paths):
+        result, missing = {}, []
+        for path in paths:
+            entry = self._get(path)
+            if entry is not None:
+                result[path] = entry[0]
+            else:
+                missing.append(path)
+        if missing:
+            epochs = {path: self._begin_load(path) for path in missing}
+            loaded = {}
+            try:
+                loaded = self.store.read_many(missing)
+            finally:
+                for path, epoch in epochs.items():
+                    # Validators are looked up lazily, so a cold batch stays one pass over the store
+                    self._finish_load(path, epoch, loaded.get(path), None)
+            result.update(loaded)
+        return result
+
+    def version(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[1] is not None:
+            return entry[1]
+        version = self.store.version(path)
+        if entry is not None and version is not None:
+            with self._lock:
+                if self._entries.get(path) is entry:
+                    self._entries[path] = (entry[0], version)
+        return version
+
+    def write(self, path, data):
+        self.store.write(path, data)
+        self.invalidate(path)
+
+    def delete(self, path):
+        self.invalidate(path)
+        return self.store.delete(path)
+
+    def status(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,142 @@
+import logging
+import time
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails written this shortly before a run, or during it, may belong to
+# files newer than its snapshot of valid paths and are never judged stale
+RECENT_SECONDS = 60
+
+
+class ThumbnailCollector:
+    """Background garbage collection of the thumbnail store.
+
+    A run walks the store in batches of batch_size, pausing between batches
+    so it never competes with requests for long. A thumbnail is stale when
+    valid_paths() does not list it and it was written before the run
+    started. Optional quotas then evict the oldest
+    remaining thumbnails past max_age seconds or beyond max_bytes in total;
+    they are regenerated on demand. Nothing is ever generated here.
+    """
+
+    def __init__(self, store, valid_paths, on_delete=None, interval=3600.0, batch_size=500,
+                 pause=0.05, max_bytes=0, max_age=0, dry_run=False):
+        self.store = store
+        self.valid_paths = valid_paths
+        self.on_delete = on_delete
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.dry_run = dry_run
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requested_dry_run = None
+        self._running = False
+        self._thread = None
+        self.last_report = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="thumbnail-gc", daemon=True)
+            self._thread.start()
+
+    def request(self, dry_run=None):
+        """Schedule a run as soon as possible. Returns False if one is already running."""
+        with self._lock:
+            if self._running:
+                return False
+            self._requested_dry_run = self.dry_run if dry_run is None else dry_run
+        self._wake.set()
+        self.start()
+        return True
+
+    def status(self):
+        with self._lock:
+            return {"running": self._running, "last_run": self.last_report}
+
+    def _loop(self):
+        while True:
+            # With no interval the collector only runs when requested
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            with self._lock:
+                dry_run = self._requested_dry_run if self._requested_dry_run is not None else self.dry_run
+                self._requested_dry_run = None
+                self._running = True
+            try:
+                report = self.collect(dry_run)
+            except Exception as e:
+                logger.error(f"Error collecting stale thumbnails: {str(e)}")
+                report = None
+            with self._lock:
+                self._running = False
+                if report is not None:
+                    self.last_report = report
+
+    def _delete(self, path, dry_run):
+        if dry_run:
+            return True
+        if self.store.delete(path):
+            if self.on_delete is not None:
+                self.on_delete(path)
+            return True
+        return False
+
+    def collect(self, dry_run=False):
+        start = time.time()
+        recent_ns = int((start - RECENT_SECONDS) * 1e9)
+        valid = self.valid_paths()
+        if valid is None:
+            # The source directories are unavailable, so nothing can be judged stale
+            return None
+
+        scanned = stale = evicted = reclaimed = 0
+        kept = []  # (written_ns, size, path) of valid thumbnails, for the quotas
+        paths = self.store.iter_paths()
+        while True:
+            batch = [path for _, path in zip(range(self.batch_size), paths)]
+            if not batch:
+                break
+            for path in batch:
+                scanned += 1
+                version = self.store.version(path)
+                if version is None:
+                    continue
+                if path not in valid:
+                    if version[0] >= recent_ns:
+                        continue
+                    if self._delete(path, dry_run):
+                        stale += 1
+                        reclaimed += version[1]
+                elif self.max_bytes or self.max_age:
+                    kept.append((version[0], version[1], path))
+            time.sleep(self.pause)
+
+        if kept:
+            kept.sort()
+            total = sum(size for _, size, _ in kept)
+            cutoff = (start - self.max_age) * 1e9 if self.max_age else None
+            for i, (written_ns, size, path) in enumerate(kept):
+                too_old = cutoff is not None and written_ns < cutoff
+                too_big = self.max_bytes and total > self.max_bytes
+                if not (too_old or too_big):
+                    break
+                if self._delete(path, dry_run):
+                    evicted += 1
+                    reclaimed += size
+                    total -= size
+                if i % self.batch_size == self.batch_size - 1:
+                    time.sleep(self.pause)
+
+        return {
+            "dry_run": dry_run,
+            "scanned": scanned,
+            "stale": stale,
+            "evicted": evicted,
+            "bytes_reclaimed": reclaimed,
+            "duration": round(time.time() - start, 3),
+            "finished_at": time.time(),
+        }
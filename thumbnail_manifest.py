@@ -0,0 +1,89 @@
+import logging
+import threading
+import sqlite3
+
+from .db import connect
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailManifest:
+    """Source validators (mtime, size, inode) for every generated thumbnail.
+
+    A thumbnail is fresh while its source still stats the same, so staleness
+    is detected with one stat of the source and no decoding. Files that are
+    overwritten under the same name get a new thumbnail. Untouched files keep
+    theirs.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            self._conn = connect(self.db_path, (
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "key TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, inode INTEGER)",
+            ))
+            if self._conn is not None:
+                try:
+                    for key, mtime_ns, size, inode in self._conn.execute("SELECT key, mtime_ns, size, inode FROM thumbnails"):
+                        self._entries[key] = (mtime_ns, size, inode)
+                except sqlite3.Error as e:
+                    logger.error(f"Error loading thumbnail manifest: {str(e)}")
+        return self._entries
+
+    def _write(self, sql, params):
+        if self._conn is None:
+            return
+        try:
+            with self._conn:
+                self._conn.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.error(f"Error saving thumbnail manifest: {str(e)}")
+
+    def check(self, key, st, stored_version):
+        """True if the thumbnail under key was made from a source with this stat result.
+
+        A known key with a different stat means the source was overwritten.
+        For keys the manifest does not know, stored_version() returns the
+        (mtime_ns, size) of the stored thumbnail or None. Thumbnails made
+        before the manifest existed are adopted if they are newer than the
+        source.
+        """
+        with self._lock:
+            entries = self._load()
+            if key in entries:
+                return entries[key] == (st.st_mtime_ns, st.st_size, st.st_ino)
+        version = stored_version()
+        if version is not None and version[0] >= st.st_mtime_ns:
+            self.record(key, st)
+            return True
+        return False
+
+    def record(self, key, st):
+        entry = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            entries = self._load()
+            if entries.get(key) != entry:
+                entries[key] = entry
+                self._write("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)", (key,) + entry)
+
+    def forget(self, key):
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._write("DELETE FROM thumbnails WHERE key = ?", (key,))
+
+    def rename(self, old_key, new_key):
+        """Carry a thumbnail's validators over to the place it was moved to"""
+        with self._lock:
+            entries = self._load()
+            entry = entries.pop(old_key, None)
+            if entry is None:
+                return
+            entries[new_key] = entry
+            self._write("UPDATE thumbnails SET key = ? WHERE key = ?", (new_key, old_key))
@@ -0,0 +1,141 @@
+import os
+import logging
+import heapq
+import itertools
+import atexit
+import weakref
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 10
+
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+_QUEUES = weakref.WeakSet()
+
+
+def _stop_all():
+    for queue in list(_QUEUES):
+        queue.stop()
+
+
+# Threading exit hooks run before the executor joins its workers, plain atexit ones only after
+getattr(threading, "_register_atexit", atexit.register)(_stop_all)
+
+
+class _Job:
+    __slots__ = ("key", "priority", "args", "future")
+
+    def __init__(self, key, priority, args):
+        self.key = key
+        self.priority = priority
+        self.args = args
+        self.future = Future()
+
+
+class ThumbnailQueue:
+    """Priority queue of thumbnail jobs drained by a bounded thread pool.
+
+    Jobs are deduplicated by key. Enqueueing a key that is already waiting
+    only raises its priority, so files the gallery is showing can jump ahead
+    of a large background backlog. On interpreter exit the waiting jobs are
+    cancelled, so shutdown only waits for the ones already rendering.
+    """
+
+    def __init__(self, worker, max_workers=DEFAULT_WORKERS):
+        self._worker = worker
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gallery-thumbnail")
+        self._lock = threading.Lock()
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._drainers = 0
+        self._running = 0
+        self._enqueued = 0
+        self._completed = 0
+        self._failed = 0
+        self._stopped = False
+        _QUEUES.add(self)
+
+    def enqueue(self, key, *args, priority=PRIORITY_BACKGROUND):
+        """Queue worker(*args) under key and return a Future for its result."""
+        with self._lock:
+            if self._stopped:
+                future = Future()
+                future.cancel()
+                return future
+            job = self._jobs.get(key)
+            if job is None:
+                job = self._jobs[key] = _Job(key, priority, args)
+                self._enqueued += 1
+            elif job.priority <= priority or job.future.running():
+                return job.future
+            else:
+                job.priority = priority
+            # Superseded heap entries are skipped when popped
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            if self._drainers < self._max_workers:
+                self._drainers += 1
+                self._executor.submit(self._drain)
+            return job.future
+
+    def stop(self):
+        """Cancel every waiting job and accept no new ones; running jobs finish"""
+        with self._lock:
+            self._stopped = True
+            waiting = [job for job in self._jobs.values() if not job.future.running()]
+            for job in waiting:
+                del self._jobs[job.key]
+            self._heap = []
+        for job in waiting:
+            job.future.cancel()
+
+    def _next_job(self):
+        with self._lock:
+            while self._heap:
+                priority, _, job = heapq.heappop(self._heap)
+                if job.priority != priority or job.future.running() or job.future.done():
+                    continue
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._running += 1
+                return job
+            self._drainers -= 1
+            return None
+
+    def _drain(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                result = self._worker(*job.args)
+            except Exception as e:
+                logger.warning(f"Thumbnail job error for {job.key}: {str(e)}")
+                result = None
+            with self._lock:
+                self._running -= 1
+                self._jobs.pop(job.key, None)
+                if result:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            job.future.set_result(result)
+
+    def status(self):
+        with self._lock:
+            pending = len(self._jobs) - self._running
+            return {
+                "workers": self._max_workers,
+                "pending": pending,
+                "running": self._running,
+                "enqueued": self._enqueued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "idle": pending == 0 and self._running == 0,
+            }
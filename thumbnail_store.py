@@ -0,0 +1,242 @@
+import os
+import logging
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .db import connect
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_FILE = "layout"
+LAYOUT = "sharded-v1"
+# Thumbnails of this size keep the plain key, so the original layout stays valid
+BASE_SIZE = 80
+
+
+class ShardedThumbnailStore:
+    """Thumbnails named by a hash of their source, fanned out over two directory levels.
+
+    thumbnails/ab/cd/abcd....webp keeps every directory small at any gallery
+    size, and since the name is a hash of "<dir_type>/<rel_path>" distinct
+    sources can no longer collide or exceed filename length limits.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def key(dir_type, rel_path, size=BASE_SIZE):
+        rel_path = os.path.normpath(rel_path).replace(os.sep, "/")
+        if size != BASE_SIZE:
+            return f"{dir_type}/{rel_path}@{size}"
+        return f"{dir_type}/{rel_path}"
+
+    def path(self, dir_type, rel_path, size=BASE_SIZE):
+        digest = hashlib.sha1(self.key(dir_type, rel_path, size).encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.webp")
+
+    def read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def read_many(self, paths):
+        """Return {path: bytes} for the paths that exist"""
+        result = {}
+        for path in paths:
+            data = self.read(path)
+            if data is not None:
+                result[path] = data
+        return result
+
+    def write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a regenerated thumbnail is never served half written
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def version(self, path):
+        """(mtime_ns, size) of a stored thumbnail, or None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def iter_paths(self):
+        """Yield the path of every stored thumbnail"""
+        for first in self._hex_dirs(self.root):
+            for second in self._hex_dirs(first):
+                try:
+                    with os.scandir(second) as entries:
+                        for entry in entries:
+                            if entry.name.endswith(".webp"):
+                                yield entry.path
+                except OSError:
+                    continue
+
+    @staticmethod
+    def _hex_dirs(path):
+        try:
+            with os.scandir(path) as entries:
+                return [
+                    e.path for e in entries
+                    if len(e.name) == 2 and all(c in "0123456789abcdef" for c in e.name) and e.is_dir()
+                ]
+        except OSError:
+            return []
+
+    def needs_migration(self):
+        try:
+            with open(os.path.join(self.root, LAYOUT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() != LAYOUT
+        except OSError:
+            return True
+
+    def migrate_flat(self, candidates, keep=(), on_move=None):
+        """Move thumbnails from the old flat layout into shards.
+
+        candidates yields (dir_type, rel_path, legacy_path). A legacy file that
+        more than one source maps to (a/b.png and a__b.png) cannot be told
+        apart and is dropped, as is any flat thumbnail no source claims.
+        Files named in keep are left alone. on_move(old, new) is called for
+        every file, with new None when it was dropped. Returns (moved, dropped).
+        """
+        claims = {}
+        for dir_type, rel_path, legacy_path in candidates:
+            claims.setdefault(legacy_path, []).append((dir_type, rel_path))
+
+        moved = dropped = 0
+        try:
+            with os.scandir(self.root) as entries:
+                flat = [e.path for e in entries if e.name.endswith(".webp") and e.name not in keep and e.is_file()]
+        except OSError:
+            flat = []
+        for legacy_path in flat:
+            owners = claims.get(legacy_path, ())
+            try:
+                if len(owners) == 1:
+                    new_path = self.path(*owners[0])
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    os.replace(legacy_path, new_path)
+                    if on_move is not None:
+                        on_move(legacy_path, new_path)
+                    moved += 1
+                else:
+                    os.remove(legacy_path)
+                    if on_move is not None:
+                        on_move(legacy_path, None)
+                    dropped += 1
+            except OSError as e:
+                logger.error(f"Error migrating thumbnail {legacy_path}: {str(e)}")
+
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LAYOUT_FILE), "w", encoding="utf-8") as f:
+            f.write(LAYOUT)
+        return moved, dropped
+
+
+class PackedThumbnailStore:
+    """All thumbnails as BLOBs in one SQLite file.
+
+    Meant for network mounted installs, where every open and stat of a small
+    file is a round trip. Here a thumbnail is a primary key lookup in one
+    file, and a batch is a single query. Thumbnails are addressed by the same
+    hash as in the sharded layout, so "paths" are plain digests.
+    """
+
+    # Stay well below SQLite's bound parameter limit
+    READ_CHUNK = 500
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            # The pack is meant for network mounts and shared with prewarm.py, so no WAL
+            self._conn = connect(self.db_path, (
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "key TEXT PRIMARY KEY, mtime_ns INTEGER, data BLOB)",
+            ), journal_mode="DELETE") or False
+        return self._conn or None
+
+    def path(self, dir_type, rel_path, size=BASE_SIZE):
+        return hashlib.sha1(ShardedThumbnailStore.key(dir_type, rel_path, size).encode("utf-8")).hexdigest()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            try:
+                return conn.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading thumbnail pack: {str(e)}")
+                return []
+
+    def _execute(self, sql, params):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            try:
+                with conn:
+                    return conn.execute(sql, params).rowcount
+            except sqlite3.Error as e:
+                logger.error(f"Error writing thumbnail pack: {str(e)}")
+                return 0
+
+    def read(self, path):
+        rows = self._query("SELECT data FROM thumbnails WHERE key = ?", (path,))
+        return rows[0][0] if rows else None
+
+    def read_many(self, paths):
+        """Return {path: bytes}, reading each chunk of keys in one query in file order"""
+        paths = list(paths)
+        result = {}
+        for i in range(0, len(paths), self.READ_CHUNK):
+            chunk = paths[i:i + self.READ_CHUNK]
+            result.update(self._query(
+                f"SELECT key, data FROM thumbnails WHERE key IN ({','.join('?' * len(chunk))}) ORDER BY rowid",
+                chunk,
+            ))
+        return result
+
+    def write(self, path, data):
+        """Raises on failure like the sharded store, so no caller records a thumbnail that was never stored"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                raise sqlite3.OperationalError(f"Thumbnail pack {self.db_path} is unavailable")
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?)", (path, time.time_ns(), sqlite3.Binary(data)))
+
+    def delete(self, path):
+        return self._execute("DELETE FROM thumbnails WHERE key = ?", (path,)) > 0
+
+    def version(self, path):
+        rows = self._query("SELECT mtime_ns, length(data) FROM thumbnails WHERE key = ?", (path,))
+        return tuple(rows[0]) if rows else None
+
+    def iter_paths(self):
+        for (key,) in self._query("SELECT key FROM thumbnails"):
+            yield key
+
+    def needs_migration(self):
+        # Switching to the pack starts it empty; thumbnails are regenerated on demand
+        return False
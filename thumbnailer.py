@@ -0,0 +1,130 @@
+import io
+import math
+from PIL import Image, UnidentifiedImageError
+
+from .perceptual_hash import phash
+
+# Modes Pillow can filter directly; anything else is converted up front
+RESIZABLE_MODES = ('1', 'L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F')
+# Text chunks ComfyUI embeds in saved images
+METADATA_KEYS = ('prompt', 'workflow')
+
+
+def center_square(width, height):
+    """Crop box of the largest centered square"""
+    side = min(width, height)
+    left = (width - side) // 2
+    top = (height - side) // 2
+    return (left, top, left + side, top + side)
+
+
+def render_thumbnail(file_path, size=(80, 80)):
+    """Decode an image once and return a center-cropped RGB thumbnail.
+
+    JPEGs are decoded at reduced scale with draft(), and everything else is
+    shrunk with reduce() before the final LANCZOS pass. The crop happens as
+    part of the resize, so mode conversion and alpha compositing only ever
+    touch the small result. Returns None if the file is not an image.
+    """
+    thumbs = render_thumbnails(file_path, [size])
+    return thumbs[size] if thumbs is not None else None
+
+
+def image_metadata(img):
+    """Dimensions, format and the embedded prompt/workflow JSON of an opened image.
+
+    Only headers and text chunks are read, never pixels. PNGs carry the JSON
+    in tEXt chunks; WebP and other formats in EXIF strings like "prompt:{...}".
+    """
+    metadata = {"width": img.width, "height": img.height, "format": img.format}
+    for key in METADATA_KEYS:
+        value = img.info.get(key)
+        metadata[key] = value if isinstance(value, str) else None
+    if metadata["prompt"] is None and metadata["workflow"] is None:
+        try:
+            for value in img.getexif().values():
+                if isinstance(value, bytes):
+                    value = value.decode("utf-8", "ignore")
+                if isinstance(value, str) and ":" in value:
+                    key, _, data = value.partition(":")
+                    if key.lower() in METADATA_KEYS:
+                        metadata[key.lower()] = data
+        except Exception:
+            # Broken EXIF only costs the metadata, never the thumbnail
+            pass
+    return metadata
+
+
+def read_metadata(file_path):
+    """image_metadata() of a file, or None if it is not an image"""
+    try:
+        with Image.open(file_path) as img:
+            return image_metadata(img)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def render_thumbnails(file_path, sizes, metadata=None):
+    """Render several thumbnail sizes from a single decode.
+
+    The largest size is made from the source as in render_thumbnail(), and
+    the smaller ones are scaled down from it. Returns {size: image}, or None
+    if the file is not an image. A metadata dict is filled with
+    image_metadata() from the same open.
+    """
+    sizes = sorted(set(sizes), key=lambda s: s[0] * s[1], reverse=True)
+    largest = sizes[0]
+    try:
+        img = Image.open(file_path)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    with img:
+        if metadata is not None:
+            # Before draft(), which changes the reported size
+            metadata.update(image_metadata(img))
+        if img.format == "JPEG":
+            # Let the decoder scale down by up to 1/8 while keeping the square at least the largest size
+            width, height = img.size
+            side = min(width, height)
+            img.draft("RGB", (math.ceil(width * largest[0] / side), math.ceil(height * largest[1] / side)))
+
+        if img.mode not in RESIZABLE_MODES:
+            # Palettes cannot be filtered, and exotic modes are normalised the same way
+            img = img.convert('RGBA' if img.mode == 'P' or 'transparency' in img.info else 'RGB')
+
+        thumb = img.resize(largest, Image.LANCZOS, box=center_square(*img.size), reducing_gap=3.0)
+
+    if thumb.mode in ('RGBA', 'LA'):
+        # Flatten transparency onto white
+        background = Image.new('RGB', largest, (255, 255, 255))
+        background.paste(thumb.convert('RGBA'), mask=thumb.getchannel('A'))
+        thumb = background
+    elif thumb.mode != 'RGB':
+        thumb = thumb.convert('RGB')
+
+    result = {largest: thumb}
+    for size in sizes[1:]:
+        result[size] = thumb.resize(size, Image.LANCZOS)
+    return result
+
+
+def encode_thumbnails(file_path, sizes, quality=80):
+    """render_thumbnails() for square sizes, encoded as WebP.
+
+    Returns ({size: bytes}, metadata) or None, metadata including the
+    perceptual hash of the largest size. Takes and returns only plain values,
+    so it can run in a worker process.
+    """
+    metadata = {}
+    images = render_thumbnails(file_path, [(s, s) for s in sizes], metadata)
+    if images is None:
+        return None
+    # The square is already small, so hashing it costs far less than a second decode
+    metadata["phash"] = phash(images[max(images)])
+    encoded = {}
+    for (size, _), img in images.items():
+        buffer = io.BytesIO()
+        img.save(buffer, "WEBP", quality=quality)
+        encoded[size] = buffer.getvalue()
+    return encoded, metadata
@@ -0,0 +1,127 @@
+import os
+import logging
+import time
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    HAS_WATCHDOG = True
+except ImportError:
+    FileSystemEventHandler = object
+    HAS_WATCHDOG = False
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher, dir_type, base_dir):
+        self.watcher = watcher
+        self.dir_type = dir_type
+        self.base_dir = base_dir
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        for path in paths:
+            if not path:
+                continue
+            rel_path = os.path.relpath(os.fsdecode(path), self.base_dir)
+            if rel_path.startswith(os.pardir) or self.watcher.is_excluded(rel_path):
+                continue
+            # Overwrites keep their directory mtime, so the path itself has to be passed on
+            modified = rel_path if event.event_type in ("modified", "closed") and not event.is_directory else None
+            self.watcher.mark_dirty(self.dir_type, modified)
+
+
+class GalleryWatcher:
+    """Keeps the gallery live by reporting changes under the watched directories.
+
+    Events from watchdog (inotify and friends) only mark a directory dirty. A
+    debounced worker then calls on_change(dir_type, modified), which refreshes
+    the file index. Renames and bursts of writes from one SaveImage therefore
+    collapse into one update, and a missed event is caught on the next one.
+    Without watchdog, on_change is polled every poll_interval seconds. A poll
+    stats every indexed directory, so the default interval is long. Overwrites
+    in place do not change any directory mtime, so polling also asks
+    scan_modified(dir_type) for files changed that way.
+    """
+
+    def __init__(self, roots, on_change, exclude_folders=(), mode="auto", poll_interval=30.0, debounce=0.5,
+                 scan_modified=None):
+        self.roots = roots  # dir_type -> base directory
+        self.on_change = on_change
+        self.exclude_folders = set(exclude_folders)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.scan_modified = scan_modified
+        self.mode = "watchdog" if mode == "auto" and HAS_WATCHDOG else ("poll" if mode == "auto" else mode)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dirty = {}
+        self._observer = None
+        self._thread = None
+
+    def is_excluded(self, rel_path):
+        return any(part in self.exclude_folders for part in rel_path.split(os.sep)[:-1])
+
+    def mark_dirty(self, dir_type, modified=None):
+        with self._lock:
+            pending = self._dirty.setdefault(dir_type, set())
+            if modified:
+                pending.add(modified)
+        self._wakeup.set()
+
+    def start(self):
+        if self.mode == "off" or self._thread is not None:
+            return False
+        if self.mode == "watchdog":
+            if not HAS_WATCHDOG:
+                self.mode = "poll"
+            else:
+                self._observer = Observer()
+                for dir_type, base_dir in self.roots.items():
+                    if os.path.isdir(base_dir):
+                        self._observer.schedule(_EventHandler(self, dir_type, base_dir), base_dir, recursive=True)
+                self._observer.daemon = True
+                self._observer.start()
+        if self.mode == "poll" and not HAS_WATCHDOG:
+            logger.info(f"watchdog is not installed, gallery watcher polls every {self.poll_interval:g}s")
+        self._thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+        self._thread = None
+        self._wakeup.set()
+
+    def _run(self):
+        thread = self._thread
+        while self._thread is thread:
+            if self.mode == "poll":
+                self._wakeup.wait(self.poll_interval)
+                for dir_type in self.roots:
+                    self.mark_dirty(dir_type)
+                    if self.scan_modified is None:
+                        continue
+                    try:
+                        for rel_path in self.scan_modified(dir_type):
+                            self.mark_dirty(dir_type, rel_path)
+                    except Exception as e:
+                        logger.error(f"Gallery watcher error checking {dir_type} for overwrites: {str(e)}")
+            else:
+                self._wakeup.wait()
+                # Let a burst of events settle before touching the index
+                time.sleep(self.debounce)
+            self._wakeup.clear()
+
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            for dir_type, modified in dirty.items():
+                try:
+                    self.on_change(dir_type, sorted(modified))
+                except Exception as e:
+                    logger.error(f"Gallery watcher error for {dir_type}: {str(e)}")